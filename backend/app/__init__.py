@@ -53,18 +53,24 @@ def _init_redis_client(app: Flask):
     use_fake = os.environ.get('USE_FAKE_REDIS_FOR_TESTS') == '1'
     client = None
 
+    binary_client = None
+
     if not use_fake and Redis is not None:  # pragma: no branch - optional runtime dependency
         try:
             client = Redis.from_url(redis_url, decode_responses=True)  # type: ignore[attr-defined]
             client.ping()
+            # 二進位資料（例如 RAG 向量區塊）需使用不解碼回應的連線
+            binary_client = Redis.from_url(redis_url, decode_responses=False)  # type: ignore[attr-defined]
         except Exception:
             client = None
 
     if client is None:
         client = InMemoryRedis()
+        binary_client = client
 
     app.config.setdefault('REDIS_URL', redis_url)
     app.extensions['redis_client'] = client
+    app.extensions['redis_binary_client'] = binary_client
     return client
 
 def _load_api_hmac_secret() -> bytes:
@@ -90,6 +96,7 @@ def create_app():
     # --- 配置 ---
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
     app.config['GOOGLE_API_KEY'] = os.environ.get('GOOGLE_API_KEY')
+    app.config['MODEL_ADMIN_TOKEN'] = os.environ.get('MODEL_ADMIN_TOKEN')
     app.config['API_HMAC_SECRET'] = _load_api_hmac_secret()
     
     # --- 【檔案上傳大小限制】 ---
@@ -191,6 +198,10 @@ def create_app():
         app.register_blueprint(bi_bp.bp, url_prefix='/api/bi')
         app.register_blueprint(activity_bp.bp, url_prefix='/api/activity')
 
+        # --- CLI 指令 ---
+        from .services.finance_rollup import finance_rollup_cli
+        app.cli.add_command(finance_rollup_cli)
+
         # --- OpenAPI 規格與 Swagger UI ---
         @app.route('/openapi.yaml')
         def serve_openapi_yaml():
@@ -248,4 +259,8 @@ def create_app():
         except Exception as exc:  # pragma: no cover - defensive logging
             app.logger.warning("RAG preload failed: %s", exc)
 
+        # 於 fork 前預先載入 LightGBM 模型（gunicorn --preload 時各 worker 以 copy-on-write 共用）
+        if os.environ.get('PRELOAD_LGBM_MODELS', '1') == '1':
+            prediction_bp.model_registry.preload(app.logger)
+
         return app
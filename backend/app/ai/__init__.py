@@ -1,19 +1,38 @@
 """AI integration helpers for embedding generation."""
 
-from .embedding import EmbeddingError, embed_documents, embed_query
+from .embedding import (
+    EmbeddingError,
+    clear_query_cache,
+    embed_documents,
+    embed_query,
+    get_query_cache_stats,
+)
 from .genai_client import (
     GenAIClientError,
     GenAIResponse,
     GenAIPromptBlocked,
+    agenerate_content,
+    agenerate_many,
     generate_content,
+    generate_content_many,
+    stream_content,
 )
+from .response_cache import get_response_cache_stats, reset_response_cache_stats
 
 __all__ = [
     "EmbeddingError",
     "embed_documents",
     "embed_query",
+    "clear_query_cache",
+    "get_query_cache_stats",
     "GenAIClientError",
     "GenAIResponse",
     "GenAIPromptBlocked",
+    "agenerate_content",
+    "agenerate_many",
     "generate_content",
+    "generate_content_many",
+    "stream_content",
+    "get_response_cache_stats",
+    "reset_response_cache_stats",
 ]
@@ -1,10 +1,19 @@
 """Utilities for generating Gemini embeddings used by RAG flows."""
 from __future__ import annotations
 
+import hashlib
+import logging
 import os
+import random
+import re
 import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Iterable, List, Sequence
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
 
 import numpy as np
 from google import genai
@@ -16,13 +25,44 @@ EMBEDDING_DIMENSION = 768
 DOCUMENT_TASK_TYPE = "RETRIEVAL_DOCUMENT"
 QUERY_TASK_TYPE = "RETRIEVAL_QUERY"
 BATCH_SIZE = 32
+# Document batches are also capped by total characters so long chunks travel in smaller requests.
+MAX_BATCH_CHARS = int(os.environ.get("EMBEDDING_MAX_BATCH_CHARS", "60000"))
+MAX_WORKERS = int(os.environ.get("EMBEDDING_MAX_WORKERS", "4"))
+MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", "5"))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# Request-size rejections are handled by splitting the batch instead of retrying it as-is:
+# any 413, or a 400 whose message says the request is too big. Other 400s fail fast.
+PAYLOAD_TOO_LARGE_STATUS = 413
+_PAYLOAD_SIZE_ERROR = re.compile(
+    r"too large|too long|too many|payload size|request size|exceeds? the (?:maximum|limit)|at most \d+",
+    re.IGNORECASE,
+)
 
 _CLIENT_CACHE: dict[str, genai.Client] = {}
 _CLIENT_LOCK = threading.Lock()
 
+LOGGER = logging.getLogger(__name__)
+
+# Query embeddings are cached in two tiers: a per-process LRU and a shared
+# Redis tier (raw float32 bytes). Keys cover the normalised text, model and
+# dimension, so changing either never serves stale vectors.
+QUERY_CACHE_SIZE = int(os.environ.get("EMBEDDING_QUERY_CACHE_SIZE", "512"))
+QUERY_CACHE_TTL = int(os.environ.get("EMBEDDING_QUERY_CACHE_TTL", str(7 * 24 * 3600)))
+_QUERY_CACHE_PREFIX = "embedding:query"
+
+_QUERY_CACHE: "OrderedDict[str, tuple[float, np.ndarray]]" = OrderedDict()
+_QUERY_CACHE_LOCK = threading.Lock()
+_QUERY_CACHE_STATS: Dict[str, int] = {"memory_hits": 0, "redis_hits": 0, "misses": 0}
+
 
 class EmbeddingError(RuntimeError):
-    """Raised when embedding generation fails."""
+    """Raised when embedding generation fails; ``code`` holds the API status when known."""
+
+    def __init__(self, message: str, *, code: int | None = None):
+        super().__init__(message)
+        self.code = code
 
 
 @dataclass(frozen=True)
@@ -81,7 +121,7 @@ def _perform_embedding_requests(requests_batch: List[_EmbeddingRequest], api_key
             config=config,
         )
     except genai_errors.APIError as exc:  # pragma: no cover - network failures handled here
-        raise EmbeddingError(f"Embedding API error {exc.code}: {exc}") from exc
+        raise EmbeddingError(f"Embedding API error {exc.code}: {exc}", code=exc.code) from exc
     except Exception as exc:  # pragma: no cover - defensive to wrap unexpected SDK issues
         raise EmbeddingError(f"Unexpected error while generating embeddings: {exc}") from exc
 
@@ -111,14 +151,266 @@ def _embed(texts: Sequence[str], task_type: str, api_key: str | None = None) ->
     return vectors
 
 
-def embed_documents(texts: Sequence[str], api_key: str | None = None) -> List[np.ndarray]:
-    """Embed document chunks for retrieval."""
-    return _embed(texts, DOCUMENT_TASK_TYPE, api_key)
+def _plan_batches(texts: Sequence[str], max_items: int, max_chars: int) -> List[List[int]]:
+    """Group text positions into batches bounded by item count and total characters."""
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_chars = 0
+    for position, text in enumerate(texts):
+        size = len(text)
+        if current and (len(current) >= max_items or current_chars + size > max_chars):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(position)
+        current_chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _is_payload_size_error(exc: EmbeddingError) -> bool:
+    if exc.code == PAYLOAD_TOO_LARGE_STATUS:
+        return True
+    return exc.code == 400 and bool(_PAYLOAD_SIZE_ERROR.search(str(exc)))
+
+
+def _retry_delay(attempt: int) -> float:
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+_sleep = time.sleep
+
+
+def _embed_with_retry(texts: List[str], task_type: str, api_key: str) -> List[np.ndarray]:
+    """Embed one batch, backing off on 429/5xx and halving batches the API rejects as too large."""
+    requests_batch = [_EmbeddingRequest(text=text, task_type=task_type) for text in texts]
+    attempt = 0
+    while True:
+        try:
+            return _perform_embedding_requests(requests_batch, api_key)
+        except EmbeddingError as exc:
+            if _is_payload_size_error(exc) and len(texts) > 1:
+                middle = len(texts) // 2
+                LOGGER.info("Embedding batch of %s rejected (%s); splitting", len(texts), exc.code)
+                return (
+                    _embed_with_retry(texts[:middle], task_type, api_key)
+                    + _embed_with_retry(texts[middle:], task_type, api_key)
+                )
+            if exc.code not in RETRYABLE_STATUS_CODES or attempt >= MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt)
+            attempt += 1
+            LOGGER.warning(
+                "Embedding batch failed with %s; retry %s/%s in %.1fs", exc.code, attempt, MAX_RETRIES, delay
+            )
+            _sleep(delay)
+
+
+def _checkpoint_path(checkpoint_dir: Path, texts: Sequence[str], task_type: str) -> Path:
+    digest = hashlib.sha256(f"{EMBEDDING_MODEL}|{EMBEDDING_DIMENSION}|{task_type}".encode("utf-8"))
+    for text in texts:
+        digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+    return checkpoint_dir / f"{digest.hexdigest()[:32]}.npy"
+
+
+def _load_checkpoint(path: Path, expected_rows: int) -> Optional[List[np.ndarray]]:
+    try:
+        matrix = np.load(path, allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    if matrix.ndim != 2 or matrix.shape[0] != expected_rows:
+        return None
+    return list(matrix.astype(np.float32))
+
+
+def _save_checkpoint(path: Path, vectors: List[np.ndarray]) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as handle:
+        np.save(handle, np.vstack(vectors).astype(np.float32), allow_pickle=False)
+    os.replace(tmp_path, path)
+
+
+def embed_documents(
+    texts: Sequence[str],
+    api_key: str | None = None,
+    *,
+    max_workers: int | None = None,
+    checkpoint_dir: str | os.PathLike[str] | None = None,
+    progress: Callable[[int, int], None] | None = None,
+) -> List[np.ndarray]:
+    """Embed document chunks for retrieval.
+
+    Batches run concurrently on a bounded thread pool and are retried with
+    exponential backoff on 429/5xx responses. With ``checkpoint_dir`` every
+    finished batch is written to disk, keyed by its content, so an
+    interrupted run resumes without re-embedding completed batches.
+    ``progress`` receives ``(finished_batches, total_batches)``.
+    """
+    if not texts:
+        return []
+
+    resolved_key = _resolve_api_key(api_key)
+    texts = list(texts)
+    batches = _plan_batches(texts, BATCH_SIZE, MAX_BATCH_CHARS)
+    results: List[Optional[np.ndarray]] = [None] * len(texts)
+    checkpoint_root = Path(checkpoint_dir) if checkpoint_dir is not None else None
+    if checkpoint_root is not None:
+        checkpoint_root.mkdir(parents=True, exist_ok=True)
+
+    pending: List[List[int]] = []
+    for positions in batches:
+        if checkpoint_root is not None:
+            batch_texts = [texts[position] for position in positions]
+            restored = _load_checkpoint(_checkpoint_path(checkpoint_root, batch_texts, DOCUMENT_TASK_TYPE), len(positions))
+            if restored is not None:
+                for position, vector in zip(positions, restored):
+                    results[position] = vector
+                continue
+        pending.append(positions)
+
+    finished = len(batches) - len(pending)
+    if checkpoint_root is not None and finished:
+        LOGGER.info("Resuming embeddings: %s/%s batches restored from checkpoints", finished, len(batches))
+    progress_lock = threading.Lock()
+
+    def run(positions: List[int]) -> None:
+        nonlocal finished
+        batch_texts = [texts[position] for position in positions]
+        vectors = _embed_with_retry(batch_texts, DOCUMENT_TASK_TYPE, resolved_key)
+        if checkpoint_root is not None:
+            _save_checkpoint(_checkpoint_path(checkpoint_root, batch_texts, DOCUMENT_TASK_TYPE), vectors)
+        for position, vector in zip(positions, vectors):
+            results[position] = vector
+        with progress_lock:
+            finished += 1
+            if progress is not None:
+                progress(finished, len(batches))
+
+    workers = max(1, min(max_workers or MAX_WORKERS, len(pending) or 1))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as executor:
+        futures = [executor.submit(run, positions) for positions in pending]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    return results  # type: ignore[return-value]
+
+
+def _normalize_query_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def _query_cache_key(normalized_text: str) -> str:
+    digest = hashlib.sha256(normalized_text.encode("utf-8")).hexdigest()
+    return f"{_QUERY_CACHE_PREFIX}:{EMBEDDING_MODEL}:{EMBEDDING_DIMENSION}:{digest}"
+
+
+def _get_redis_client():
+    try:
+        from flask import current_app, has_app_context
+    except ImportError:  # pragma: no cover - flask is always installed with the backend
+        return None
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("redis_binary_client")
+
+
+def _count(stat: str) -> None:
+    with _QUERY_CACHE_LOCK:
+        _QUERY_CACHE_STATS[stat] += 1
+
+
+def _memory_get(key: str) -> Optional[np.ndarray]:
+    with _QUERY_CACHE_LOCK:
+        entry = _QUERY_CACHE.get(key)
+        if entry is None:
+            return None
+        expires_at, vector = entry
+        if expires_at <= time.monotonic():
+            del _QUERY_CACHE[key]
+            return None
+        _QUERY_CACHE.move_to_end(key)
+        return vector
+
+
+def _memory_set(key: str, vector: np.ndarray) -> None:
+    if QUERY_CACHE_SIZE <= 0:
+        return
+    vector.setflags(write=False)
+    with _QUERY_CACHE_LOCK:
+        _QUERY_CACHE[key] = (time.monotonic() + QUERY_CACHE_TTL, vector)
+        _QUERY_CACHE.move_to_end(key)
+        while len(_QUERY_CACHE) > QUERY_CACHE_SIZE:
+            _QUERY_CACHE.popitem(last=False)
+
+
+def _redis_get(redis_client, key: str) -> Optional[np.ndarray]:
+    try:
+        raw = redis_client.get(key)
+    except Exception as exc:  # pragma: no cover - cache best effort
+        LOGGER.warning("Failed to read query embedding cache: %s", exc)
+        return None
+    if not isinstance(raw, (bytes, bytearray)) or len(raw) != EMBEDDING_DIMENSION * 4:
+        return None
+    return np.frombuffer(raw, dtype=np.float32).copy()
+
+
+def _redis_set(redis_client, key: str, vector: np.ndarray) -> None:
+    try:
+        redis_client.setex(key, QUERY_CACHE_TTL, np.asarray(vector, dtype=np.float32).tobytes())
+    except Exception as exc:  # pragma: no cover - cache best effort
+        LOGGER.warning("Failed to write query embedding cache: %s", exc)
+
+
+def get_query_cache_stats() -> Dict[str, int]:
+    """Return hit/miss counters and the current size of the in-process tier."""
+    with _QUERY_CACHE_LOCK:
+        stats = dict(_QUERY_CACHE_STATS)
+        stats["memory_size"] = len(_QUERY_CACHE)
+    return stats
+
+
+def clear_query_cache() -> None:
+    """Drop the in-process tier and reset the counters (the Redis tier expires on its own)."""
+    with _QUERY_CACHE_LOCK:
+        _QUERY_CACHE.clear()
+        for stat in _QUERY_CACHE_STATS:
+            _QUERY_CACHE_STATS[stat] = 0
 
 
 def embed_query(text: str, api_key: str | None = None) -> np.ndarray:
-    """Embed a single query string."""
-    vectors = _embed([text], QUERY_TASK_TYPE, api_key)
+    """Embed a single query string, served from the query cache when possible.
+
+    The returned vector is shared with the cache and marked read-only.
+    """
+    normalized = _normalize_query_text(text)
+    key = _query_cache_key(normalized)
+
+    vector = _memory_get(key)
+    if vector is not None:
+        _count("memory_hits")
+        return vector
+
+    redis_client = _get_redis_client()
+    if redis_client is not None:
+        vector = _redis_get(redis_client, key)
+        if vector is not None:
+            _count("redis_hits")
+            _memory_set(key, vector)
+            return vector
+
+    _count("misses")
+    vectors = _embed([normalized], QUERY_TASK_TYPE, api_key)
     if not vectors:
         raise EmbeddingError("Embedding API returned no vector for the query.")
-    return vectors[0]
+    vector = np.asarray(vectors[0], dtype=np.float32)
+    _memory_set(key, vector)
+    if redis_client is not None:
+        _redis_set(redis_client, key, vector)
+    return vector
@@ -1,26 +1,34 @@
 """Google GenAI SDK wrapper providing consistent request/response handling."""
 from __future__ import annotations
 
+import asyncio
 import base64
 import binascii
 import os
 import threading
 from dataclasses import dataclass
-from typing import Any, Iterable, List, Sequence
+from typing import Any, Iterable, Iterator, List, Sequence
 
 from google import genai
 from google.genai import errors as genai_errors
 from google.genai import types as genai_types
 
+from . import response_cache
+
 __all__ = [
     "GenAIClientError",
     "GenAIResponse",
     "GenAIPromptBlocked",
+    "agenerate_content",
+    "agenerate_many",
     "generate_content",
+    "generate_content_many",
+    "stream_content",
 ]
 
 _DEFAULT_MODEL = os.getenv("GEMINI_MODEL_NAME", os.getenv("GOOGLE_GENAI_MODEL", "gemini-flash-latest"))
 _DEFAULT_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "16384"))
+DEFAULT_FANOUT_CONCURRENCY = int(os.getenv("GEMINI_FANOUT_CONCURRENCY", "4"))
 
 _DEFAULT_GENERATION_CONFIG = {
     "temperature": 0.4,
@@ -65,8 +73,9 @@ class GenAIResponse:
 
     text: str
     finish_reason: str | None
-    raw_response: genai_types.GenerateContentResponse
-    candidate: genai_types.Candidate
+    raw_response: genai_types.GenerateContentResponse | None
+    candidate: genai_types.Candidate | None
+    cached: bool = False
 
 
 class GenAIClientError(RuntimeError):
@@ -146,16 +155,22 @@ def _build_safety_settings(settings: Sequence[Any] | None) -> list[genai_types.S
 
 
 def _decode_inline_data(part: dict[str, Any]) -> genai_types.Part:
+    """Build an inline blob part; raw ``bytes`` are used as-is, strings are base64-decoded."""
     inline_data = part.get("inline_data")
     if not isinstance(inline_data, dict):
-        raise GenAIClientError("inline_data part must be a dict with base64-encoded 'data'")
+        raise GenAIClientError("inline_data part must be a dict with 'data' as bytes or base64 text")
     raw_data = inline_data.get("data")
     if not raw_data:
         raise GenAIClientError("inline_data part missing 'data'")
-    try:
-        decoded = base64.b64decode(raw_data)
-    except (binascii.Error, ValueError) as exc:  # pragma: no cover - defensive guard
-        raise GenAIClientError("inline_data contains invalid base64") from exc
+    if isinstance(raw_data, (bytearray, memoryview)):
+        raw_data = bytes(raw_data)
+    if isinstance(raw_data, bytes):
+        decoded = raw_data
+    else:
+        try:
+            decoded = base64.b64decode(raw_data)
+        except (binascii.Error, ValueError) as exc:  # pragma: no cover - defensive guard
+            raise GenAIClientError("inline_data contains invalid base64") from exc
     mime_type = inline_data.get("mime_type") or "application/octet-stream"
     return genai_types.Part.from_bytes(data=decoded, mime_type=mime_type)
 
@@ -233,33 +248,37 @@ def _is_vertex_mode() -> bool:
     return os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "false").lower() in {"1", "true", "yes"}
 
 
-def _get_client(api_key: str | None) -> genai.Client:
-    use_vertex = _is_vertex_mode()
-    if use_vertex:
+def _client_settings(api_key: str | None) -> tuple[tuple[str, ...], dict[str, Any]]:
+    """Return the cache key and ``genai.Client`` keyword arguments for ``api_key``."""
+    if _is_vertex_mode():
         project = os.getenv("GOOGLE_CLOUD_PROJECT")
         location = os.getenv("GOOGLE_CLOUD_LOCATION")
         if not project or not location:
             raise GenAIClientError("Vertex AI mode requires GOOGLE_CLOUD_PROJECT and GOOGLE_CLOUD_LOCATION")
-        cache_key = ("vertex", project, location)
-        with _CLIENT_LOCK:
-            client = _CLIENT_CACHE.get(cache_key)
-            if client is None:
-                client = genai.Client(vertexai=True, project=project, location=location)
-                _CLIENT_CACHE[cache_key] = client
-            return client
+        return ("vertex", project, location), {"vertexai": True, "project": project, "location": location}
 
     resolved_key = (api_key or os.getenv("GOOGLE_API_KEY") or "").strip()
     if not resolved_key or resolved_key in {"your-gemini-api-key", "your-gemini-api-key-here"}:
         raise GenAIClientError("GOOGLE_API_KEY is not configured. Provide a valid key via header or environment.")
-    cache_key = ("api_key", resolved_key)
+    return ("api_key", resolved_key), {"api_key": resolved_key}
+
+
+def _get_client(api_key: str | None) -> genai.Client:
+    cache_key, client_kwargs = _client_settings(api_key)
     with _CLIENT_LOCK:
         client = _CLIENT_CACHE.get(cache_key)
         if client is None:
-            client = genai.Client(api_key=resolved_key)
+            client = genai.Client(**client_kwargs)
             _CLIENT_CACHE[cache_key] = client
         return client
 
 
+def _new_client(api_key: str | None) -> genai.Client:
+    """Create an uncached client, for async work on a short-lived event loop."""
+    _, client_kwargs = _client_settings(api_key)
+    return genai.Client(**client_kwargs)
+
+
 def _stringify_finish_reason(finish_reason: Any) -> str | None:
     if finish_reason is None:
         return None
@@ -294,6 +313,74 @@ def _format_api_error(exc: genai_errors.APIError) -> str:
     return f"GenAI API error (code {code}): {message}" if code is not None else f"GenAI API error: {message}"
 
 
+def _prepare_request(
+    prompt: Any,
+    api_key: str | None,
+    generation_config_override: Any | None,
+    safety_settings_override: Sequence[Any] | None,
+    client: genai.Client | None = None,
+) -> tuple[genai.Client, list[genai_types.Content], genai_types.GenerateContentConfig]:
+    contents = _normalise_contents(prompt)
+    generation_config = _build_generation_config(generation_config_override)
+    safety_settings = _build_safety_settings(safety_settings_override)
+    if client is None:
+        client = _get_client(api_key)
+
+    if generation_config is None:
+        generation_config = genai_types.GenerateContentConfig(**_DEFAULT_GENERATION_CONFIG)
+
+    generation_config.safety_settings = safety_settings
+    return client, contents, generation_config
+
+
+def _raise_if_blocked(response: genai_types.GenerateContentResponse) -> None:
+    feedback = response.prompt_feedback
+    if feedback and feedback.block_reason:
+        raise GenAIPromptBlocked(str(feedback.block_reason), feedback.safety_ratings)
+
+
+def _lookup_cache(
+    cache_policy: str | None,
+    model_name: str,
+    contents: list[genai_types.Content],
+    generation_config: genai_types.GenerateContentConfig,
+) -> tuple[str | None, int, GenAIResponse | None]:
+    """Return ``(cache_key, ttl, cached_response)``; the key is ``None`` when caching is off."""
+    cache_ttl = response_cache.policy_ttl(cache_policy) if cache_policy else 0
+    if not cache_ttl:
+        return None, 0, None
+    cache_key = response_cache.cache_key(cache_policy, model_name, contents, generation_config)
+    cached = response_cache.get_cached_response(cache_key, cache_policy)
+    if cached is None:
+        return cache_key, cache_ttl, None
+    return cache_key, cache_ttl, GenAIResponse(
+        text=cached["text"],
+        finish_reason=cached.get("finish_reason"),
+        raw_response=None,
+        candidate=None,
+        cached=True,
+    )
+
+
+def _finalise_response(
+    response: genai_types.GenerateContentResponse,
+    cache_policy: str | None,
+    cache_key: str | None,
+    cache_ttl: int,
+) -> GenAIResponse:
+    _raise_if_blocked(response)
+
+    candidate = _pick_candidate(response.candidates)
+    if candidate is None:
+        raise GenAIClientError("GenAI response did not contain any candidates.")
+
+    text = getattr(response, "text", None) or _extract_text(candidate)
+    finish_reason = _stringify_finish_reason(candidate.finish_reason)
+    if cache_key is not None:
+        response_cache.store_response(cache_key, cache_policy, cache_ttl, text or "", finish_reason)
+    return GenAIResponse(text=text or "", finish_reason=finish_reason, raw_response=response, candidate=candidate)
+
+
 def generate_content(
     prompt: Any,
     *,
@@ -301,22 +388,27 @@ def generate_content(
     generation_config_override: Any | None = None,
     safety_settings_override: Sequence[Any] | None = None,
     model: str | None = None,
+    cache_policy: str | None = None,
 ) -> GenAIResponse:
-    """Invoke the Google GenAI SDK with consistent defaults and error handling."""
+    """Invoke the Google GenAI SDK with consistent defaults and error handling.
 
-    contents = _normalise_contents(prompt)
-    generation_config = _build_generation_config(generation_config_override)
-    safety_settings = _build_safety_settings(safety_settings_override)
-    client = _get_client(api_key)
+    Passing ``cache_policy`` (a key of ``response_cache.RESPONSE_CACHE_POLICIES``)
+    opts the call into the Redis response cache; cached answers come back with
+    ``cached=True`` and no raw response or candidate.
+    """
 
-    if generation_config is None:
-        generation_config = genai_types.GenerateContentConfig(**_DEFAULT_GENERATION_CONFIG)
+    client, contents, generation_config = _prepare_request(
+        prompt, api_key, generation_config_override, safety_settings_override
+    )
+    model_name = model or _DEFAULT_MODEL
 
-    generation_config.safety_settings = safety_settings
+    cache_key, cache_ttl, cached = _lookup_cache(cache_policy, model_name, contents, generation_config)
+    if cached is not None:
+        return cached
 
     try:
         response = client.models.generate_content(
-            model=model or _DEFAULT_MODEL,
+            model=model_name,
             contents=contents,
             config=generation_config,
         )
@@ -325,14 +417,150 @@ def generate_content(
     except Exception as exc:  # pragma: no cover - defensive guard
         raise GenAIClientError(f"Unexpected error invoking GenAI: {exc}") from exc
 
-    feedback = response.prompt_feedback
-    if feedback and feedback.block_reason:
-        raise GenAIPromptBlocked(str(feedback.block_reason), feedback.safety_ratings)
+    return _finalise_response(response, cache_policy, cache_key, cache_ttl)
 
-    candidate = _pick_candidate(response.candidates)
-    if candidate is None:
-        raise GenAIClientError("GenAI response did not contain any candidates.")
 
-    text = getattr(response, "text", None) or _extract_text(candidate)
-    finish_reason = _stringify_finish_reason(candidate.finish_reason)
-    return GenAIResponse(text=text or "", finish_reason=finish_reason, raw_response=response, candidate=candidate)
+async def agenerate_content(
+    prompt: Any,
+    *,
+    api_key: str | None = None,
+    generation_config_override: Any | None = None,
+    safety_settings_override: Sequence[Any] | None = None,
+    model: str | None = None,
+    cache_policy: str | None = None,
+    client: genai.Client | None = None,
+) -> GenAIResponse:
+    """Async counterpart of :func:`generate_content` built on the SDK's ``client.aio`` interface.
+
+    Pass ``client`` to reuse one client for many calls on the same event loop;
+    otherwise the cached per-key client is used.
+    """
+
+    client, contents, generation_config = _prepare_request(
+        prompt, api_key, generation_config_override, safety_settings_override, client
+    )
+    model_name = model or _DEFAULT_MODEL
+
+    cache_key, cache_ttl, cached = _lookup_cache(cache_policy, model_name, contents, generation_config)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await client.aio.models.generate_content(
+            model=model_name,
+            contents=contents,
+            config=generation_config,
+        )
+    except genai_errors.APIError as exc:
+        raise GenAIClientError(_format_api_error(exc)) from exc
+    except Exception as exc:  # pragma: no cover - defensive guard
+        raise GenAIClientError(f"Unexpected error invoking GenAI: {exc}") from exc
+
+    return _finalise_response(response, cache_policy, cache_key, cache_ttl)
+
+
+async def agenerate_many(
+    prompts: Sequence[Any],
+    *,
+    max_concurrency: int | None = None,
+    client: genai.Client | None = None,
+    api_key: str | None = None,
+    **kwargs: Any,
+) -> list[GenAIResponse | GenAIClientError]:
+    """Run :func:`agenerate_content` for every prompt with at most ``max_concurrency`` in flight.
+
+    Results keep the order of ``prompts``. A failing prompt yields its
+    :class:`GenAIClientError` in place of a response instead of cancelling the others.
+    """
+
+    limit = max(1, max_concurrency or DEFAULT_FANOUT_CONCURRENCY)
+    semaphore = asyncio.Semaphore(limit)
+    if client is None:
+        client = _get_client(api_key)
+
+    async def run_one(prompt: Any) -> GenAIResponse | GenAIClientError:
+        async with semaphore:
+            try:
+                return await agenerate_content(prompt, api_key=api_key, client=client, **kwargs)
+            except GenAIClientError as exc:
+                return exc
+
+    return list(await asyncio.gather(*(run_one(prompt) for prompt in prompts)))
+
+
+def generate_content_many(
+    prompts: Sequence[Any],
+    *,
+    max_concurrency: int | None = None,
+    api_key: str | None = None,
+    **kwargs: Any,
+) -> list[GenAIResponse | GenAIClientError]:
+    """Blocking entry point for :func:`agenerate_many`, for synchronous Flask views and jobs.
+
+    Runs a private event loop with a dedicated client that is closed afterwards,
+    so pooled async connections never outlive the loop that opened them.
+    Inside a running event loop, await :func:`agenerate_many` instead.
+    """
+
+    if not prompts:
+        return []
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise GenAIClientError("generate_content_many cannot run inside an event loop; await agenerate_many instead")
+
+    client = _new_client(api_key)
+
+    async def run() -> list[GenAIResponse | GenAIClientError]:
+        try:
+            return await agenerate_many(
+                prompts, max_concurrency=max_concurrency, client=client, api_key=api_key, **kwargs
+            )
+        finally:
+            await client.aio.aclose()
+
+    return asyncio.run(run())
+
+
+def stream_content(
+    prompt: Any,
+    *,
+    api_key: str | None = None,
+    generation_config_override: Any | None = None,
+    safety_settings_override: Sequence[Any] | None = None,
+    model: str | None = None,
+) -> Iterator[str]:
+    """Stream the completion as text fragments using the SDK's streaming API.
+
+    Accepts the same arguments as :func:`generate_content` and yields each
+    non-empty text fragment as soon as the model emits it. Blocked prompts and
+    transport errors raise the same exceptions, either before the first
+    fragment or mid-stream.
+    """
+
+    client, contents, generation_config = _prepare_request(
+        prompt, api_key, generation_config_override, safety_settings_override
+    )
+
+    try:
+        stream = client.models.generate_content_stream(
+            model=model or _DEFAULT_MODEL,
+            contents=contents,
+            config=generation_config,
+        )
+        for chunk in stream:
+            _raise_if_blocked(chunk)
+            candidate = _pick_candidate(chunk.candidates)
+            if candidate is None:
+                continue
+            text = _extract_text(candidate)
+            if text:
+                yield text
+    except GenAIClientError:
+        raise
+    except genai_errors.APIError as exc:
+        raise GenAIClientError(_format_api_error(exc)) from exc
+    except Exception as exc:  # pragma: no cover - defensive guard
+        raise GenAIClientError(f"Unexpected error invoking GenAI: {exc}") from exc
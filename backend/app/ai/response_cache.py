@@ -0,0 +1,138 @@
+"""Redis-backed cache for deterministic Gemini text responses.
+
+Caching is opt-in per call site: callers pass a ``cache_policy`` name to
+:func:`app.ai.genai_client.generate_content` and the policy decides the TTL.
+Keys hash the normalised contents, model and full generation config
+(including safety settings), so any change to the prompt or sampling
+parameters misses. Only complete (``STOP``) non-empty answers are stored.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from google.genai import types as genai_types
+
+LOGGER = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.environ.get("GEMINI_RESPONSE_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"}
+
+# TTL in seconds per call site; ``GEMINI_RESPONSE_CACHE_TTL_<POLICY>`` overrides
+# a default and ``0`` disables that policy.
+_DEFAULT_POLICY_TTLS: Dict[str, int] = {
+    "agent_tip": 12 * 3600,
+    "ai_import_mapping": 24 * 3600,
+    "analytics_report": 3600,
+}
+RESPONSE_CACHE_POLICIES: Dict[str, int] = {
+    name: int(os.environ.get(f"GEMINI_RESPONSE_CACHE_TTL_{name.upper()}", str(ttl)))
+    for name, ttl in _DEFAULT_POLICY_TTLS.items()
+}
+
+_CACHE_PREFIX = "genai:response"
+_CACHEABLE_FINISH_REASONS = frozenset({"STOP"})
+
+_STATS_LOCK = threading.Lock()
+_STATS: Dict[str, Dict[str, int]] = {}
+
+
+def policy_ttl(policy: str) -> int:
+    """Return the TTL for ``policy``; ``0`` means the policy is switched off."""
+    if policy not in RESPONSE_CACHE_POLICIES:
+        raise KeyError(f"Unknown response cache policy: {policy}")
+    if not RESPONSE_CACHE_ENABLED:
+        return 0
+    return max(0, RESPONSE_CACHE_POLICIES[policy])
+
+
+def cache_key(
+    policy: str,
+    model: str,
+    contents: Sequence[genai_types.Content],
+    config: genai_types.GenerateContentConfig,
+) -> str:
+    payload = {
+        "model": model,
+        "contents": [content.model_dump(mode="json", exclude_none=True) for content in contents],
+        "config": config.model_dump(mode="json", exclude_none=True),
+    }
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    digest = hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+    return f"{_CACHE_PREFIX}:{policy}:{digest}"
+
+
+def _get_redis_client():
+    try:
+        from flask import current_app, has_app_context
+    except ImportError:  # pragma: no cover - flask is always installed with the backend
+        return None
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("redis_client")
+
+
+def _count(policy: str, stat: str) -> None:
+    with _STATS_LOCK:
+        counters = _STATS.setdefault(policy, {"hits": 0, "misses": 0, "stores": 0, "errors": 0})
+        counters[stat] += 1
+
+
+def get_cached_response(key: str, policy: str) -> Optional[Dict[str, Any]]:
+    """Return ``{"text", "finish_reason"}`` for a cached answer, counting hits and misses."""
+    redis_client = _get_redis_client()
+    if redis_client is None:
+        return None
+    try:
+        raw = redis_client.get(key)
+    except Exception as exc:  # pragma: no cover - cache best effort
+        LOGGER.warning("Failed to read Gemini response cache: %s", exc)
+        _count(policy, "errors")
+        return None
+    if raw:
+        try:
+            payload = json.loads(raw)
+        except (TypeError, json.JSONDecodeError):
+            payload = None
+        if isinstance(payload, dict) and isinstance(payload.get("text"), str):
+            _count(policy, "hits")
+            return payload
+    _count(policy, "misses")
+    return None
+
+
+def store_response(key: str, policy: str, ttl: int, text: str, finish_reason: str | None) -> bool:
+    """Store a complete answer; truncated, blocked or empty ones are skipped."""
+    if not text or finish_reason not in _CACHEABLE_FINISH_REASONS:
+        return False
+    redis_client = _get_redis_client()
+    if redis_client is None:
+        return False
+    try:
+        redis_client.setex(key, ttl, json.dumps({"text": text, "finish_reason": finish_reason}, ensure_ascii=False))
+    except Exception as exc:  # pragma: no cover - cache best effort
+        LOGGER.warning("Failed to write Gemini response cache: %s", exc)
+        _count(policy, "errors")
+        return False
+    _count(policy, "stores")
+    return True
+
+
+def get_response_cache_stats() -> Dict[str, Any]:
+    """Return per-policy hit/miss counters for this process and the configured TTLs."""
+    with _STATS_LOCK:
+        policies = {policy: dict(counters) for policy, counters in _STATS.items()}
+    return {
+        "enabled": RESPONSE_CACHE_ENABLED,
+        "ttl_seconds": dict(RESPONSE_CACHE_POLICIES),
+        "policies": policies,
+    }
+
+
+def reset_response_cache_stats() -> None:
+    """Reset the in-process counters (cached entries in Redis expire on their own)."""
+    with _STATS_LOCK:
+        _STATS.clear()
@@ -1,6 +1,6 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_login import login_required, current_user
-from app.utils import call_gemini_api, get_sheep_info_for_context, encode_image_to_base64
+from app.utils import call_gemini_api, get_sheep_info_for_context, encode_image_to_base64, stream_gemini_api
 from app.models import db, ChatHistory
 from app.schemas import (
     AgentRecommendationModel,
@@ -9,12 +9,15 @@ from app.schemas import (
     create_error_response,
 )
 from app.rag_loader import get_status as get_rag_status, rag_query
+from app.ai import get_query_cache_stats, get_response_cache_stats
+from app.services.chat_context import build_chat_history, compact_chat_history, record_chat_exchange
+from app.services.chat_image import prepare_image, read_upload
 from pydantic import ValidationError
 from datetime import datetime
 from html import escape as html_escape
 from html.parser import HTMLParser
+import json
 import markdown
-import base64
 import bleach
 from bleach.linkifier import Linker
 
@@ -216,6 +219,46 @@ def _build_recommendation_rag_query(data: dict, sheep_context: str) -> str:
 
     return "\n".join(query_lines)
 
+
+def _sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _escape_markdown_fragment(fragment: str) -> str:
+    """逐字跳脫 ``&`` 與 ``<``，讓片段中的原始 HTML 無法成形；切塊邊界不影響結果。"""
+    return fragment.replace('&', '&amp;').replace('<', '&lt;')
+
+
+def _stream_markdown_events(fragments, html_key: str, *, fallback_text: str = '', on_complete=None):
+    """將 Gemini 文字片段轉為 SSE 事件。
+
+    每個片段送出一個 ``delta`` 事件（已跳脫的 Markdown）；完成後呼叫
+    ``on_complete(全文)`` 並以 ``done`` 事件送出清理過的完整 HTML。
+    上游錯誤送出 ``error`` 事件並結束，不會呼叫 ``on_complete``。
+    """
+    parts: list[str] = []
+    for item in fragments:
+        if 'error' in item:
+            yield _sse_event('error', {'error': item['error']})
+            return
+        parts.append(item['text'])
+        yield _sse_event('delta', {'markdown': _escape_markdown_fragment(item['text'])})
+
+    full_text = ''.join(parts) or fallback_text
+    if on_complete is not None:
+        on_complete(full_text)
+    html = markdown.markdown(full_text, extensions=['fenced_code', 'tables', 'nl2br'])
+    yield _sse_event('done', {html_key: _sanitize_rich_text(html)})
+
+
+def _sse_response(events) -> Response:
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 避免 Nginx 等反向代理緩衝整個串流
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @bp.route('/tip', methods=['GET'])
 @login_required
 def get_agent_tip():
@@ -232,7 +275,9 @@ def get_agent_tip():
     
     prompt = f"作為『領頭羊博士』，請給我一條關於台灣當前季節（{season}）的實用山羊飼養小提示，簡短且易懂，請使用 Markdown 格式，例如將重點字詞用 `**` 包裹起來。"
 
-    result = call_gemini_api(prompt, api_key, generation_config_override={"temperature": 0.7})
+    result = call_gemini_api(
+        prompt, api_key, generation_config_override={"temperature": 0.7}, cache_policy="agent_tip"
+    )
     if "error" in result:
         return jsonify(error=result["error"]), 500
     
@@ -253,6 +298,8 @@ def agent_status():
         rag_enabled=bool(status.get('available')),  # type: ignore[arg-type]
         message=status.get('message', ''),
         detail=status.get('detail'),
+        embedding_cache=get_query_cache_stats(),
+        response_cache=get_response_cache_stats(),
     )
 
 
@@ -347,7 +394,9 @@ def generate_analytics_report():
         "請重點標示 ROI 最高與最低的分群，並提供可立即採取的改善建議。最後給出下週需追蹤的 2 項量化指標。"
     )
 
-    result = call_gemini_api(prompt, api_key, generation_config_override={'temperature': 0.35})
+    result = call_gemini_api(
+        prompt, api_key, generation_config_override={'temperature': 0.35}, cache_policy='analytics_report'
+    )
     if 'error' in result:
         return jsonify(error=result['error']), 500
 
@@ -356,20 +405,8 @@ def generate_analytics_report():
     clean_report_html = _sanitize_rich_text(report_html)
     return jsonify(report_html=clean_report_html, report_markdown=report_text)
 
-@bp.route('/recommendation', methods=['POST'])
-@login_required
-def get_recommendation():
-    """獲取飼養建議"""
-    try:
-        # 使用 Pydantic 驗證請求資料
-        recommendation_data = AgentRecommendationModel(**request.get_json())
-    except ValidationError as e:
-        return jsonify(create_error_response("請求資料驗證失敗", e.errors())), 400
-
-    # 將 Pydantic 模型轉換為字典
-    data = recommendation_data.model_dump(exclude_unset=True)
-    api_key = data.pop('api_key')
-    
+def _build_recommendation_prompt(data: dict, api_key: str) -> str:
+    """組合飼養建議提示詞（含資料庫背景、RAG 參考片段與 ESG 指示）；會就地補齊 ``data`` 的空值。"""
     ear_num = data.get('EarNum')
     sheep_context_str = ""
     if ear_num:
@@ -435,7 +472,32 @@ def get_recommendation():
 
     full_prompt += esg_prompt_instruction
     full_prompt += "\n\n請開始提供您的綜合建議。"
+    return full_prompt
+
+
+def _parse_recommendation_request():
+    """驗證建議請求；回傳 ``(資料, api_key, None)`` 或 ``(None, None, 錯誤回應)``。"""
+    try:
+        # 使用 Pydantic 驗證請求資料
+        recommendation_data = AgentRecommendationModel(**request.get_json())
+    except ValidationError as e:
+        return None, None, (jsonify(create_error_response("請求資料驗證失敗", e.errors())), 400)
+
+    # 將 Pydantic 模型轉換為字典
+    data = recommendation_data.model_dump(exclude_unset=True)
+    api_key = data.pop('api_key')
+    return data, api_key, None
 
+
+@bp.route('/recommendation', methods=['POST'])
+@login_required
+def get_recommendation():
+    """獲取飼養建議"""
+    data, api_key, error_response = _parse_recommendation_request()
+    if error_response:
+        return error_response
+
+    full_prompt = _build_recommendation_prompt(data, api_key)
     result = call_gemini_api(full_prompt, api_key)
     if "error" in result:
         return jsonify(error=result["error"]), 500
@@ -444,10 +506,21 @@ def get_recommendation():
     return jsonify(recommendation_html=recommendation_html)
 
 
-@bp.route('/chat', methods=['POST'])
+@bp.route('/recommendation/stream', methods=['POST'])
 @login_required
-def chat_with_agent():
-    """與 AI 聊天，支援文字和圖片"""
+def stream_recommendation():
+    """以 Server-Sent Events 串流飼養建議"""
+    data, api_key, error_response = _parse_recommendation_request()
+    if error_response:
+        return error_response
+
+    full_prompt = _build_recommendation_prompt(data, api_key)
+    fragments = stream_gemini_api(full_prompt, api_key)
+    return _sse_response(_stream_markdown_events(fragments, 'recommendation_html'))
+
+
+def _parse_chat_request():
+    """解析純文字或含圖片的聊天請求；回傳 ``(參數, None)`` 或 ``(None, 錯誤回應)``。"""
     try:
         # 檢查是否為包含檔案的請求
         if 'image' in request.files:
@@ -459,24 +532,24 @@ def chat_with_agent():
             image_file = request.files['image']
             
             if not api_key or not session_id:
-                return jsonify(error="缺少必要參數"), 400
+                return None, (jsonify(error="缺少必要參數"), 400)
             
             # 驗證圖片
             if not image_file or not image_file.filename:
-                return jsonify(error="未選擇圖片檔案"), 400
+                return None, (jsonify(error="未選擇圖片檔案"), 400)
             
             # 檢查檔案類型
             allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp']
             if image_file.content_type not in allowed_types:
-                return jsonify(error="不支援的圖片格式，請使用 JPEG、PNG、GIF 或 WebP"), 400
-            
-            # 檢查檔案大小 (10MB)
-            image_data = image_file.read()
-            if len(image_data) > 10 * 1024 * 1024:
-                return jsonify(error="圖片檔案不能超過 10MB"), 400
+                return None, (jsonify(error="不支援的圖片格式，請使用 JPEG、PNG、GIF 或 WebP"), 400)
             
-            # 將圖片編碼為 base64
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
+            # 檢查檔案大小 (10MB)：最多只讀取上限 + 1 位元組
+            image_bytes = read_upload(image_file.stream)
+            if image_bytes is None:
+                return None, (jsonify(error="圖片檔案不能超過 10MB"), 400)
+
+            # 直接保留原始位元組，大型照片先縮圖再上傳
+            image_bytes, image_mime_type = prepare_image(image_bytes, image_file.content_type)
             
         else:
             # 處理純文字請求
@@ -485,26 +558,35 @@ def chat_with_agent():
             user_message = chat_data.message
             session_id = chat_data.session_id
             ear_num_context = chat_data.ear_num_context
-            image_base64 = None
+            image_bytes = None
+            image_mime_type = None
             
     except ValidationError as e:
-        return jsonify(create_error_response("聊天資料驗證失敗", e.errors())), 400
+        return None, (jsonify(create_error_response("聊天資料驗證失敗", e.errors())), 400)
     except Exception as e:
-        return jsonify(error=f"處理請求時發生錯誤: {str(e)}"), 400
+        return None, (jsonify(error=f"處理請求時發生錯誤: {str(e)}"), 400)
 
-    # 獲取聊天歷史
-    history = ChatHistory.query.filter_by(
-        user_id=current_user.id, 
-        session_id=session_id
-    ).order_by(ChatHistory.timestamp.asc()).limit(20).all()
-    
-    # 建立對話歷史
+    return {
+        'api_key': api_key,
+        'user_message': user_message,
+        'session_id': session_id,
+        'ear_num_context': ear_num_context,
+        'image_bytes': image_bytes,
+        'image_mime_type': image_mime_type,
+    }, None
+
+
+def _build_chat_messages(chat: dict) -> list[dict]:
+    """組合送往 Gemini 的對話內容：系統角色、歷史訊息、羊隻背景、RAG 片段與圖片。"""
+    user_message = chat['user_message']
+    ear_num_context = chat['ear_num_context']
+
+    # 建立對話歷史：先前對話摘要 + 最近幾輪原文（受輪數與 token 預算限制）
     chat_messages_for_api = [
         {"role": "user", "parts": [{"text": "你是一位名叫『領頭羊博士』的AI羊隻飼養代理人，你非常了解台灣的氣候和常見飼養方式。請友善且專業地回答使用者的問題。當用戶上傳山羊照片時，請仔細分析照片中山羊的外觀、健康狀況、環境等，並給出專業的飼養建議。"}]},
         {"role": "model", "parts": [{"text": "是的，領頭羊博士在此為您服務。請問有什麼問題嗎？"}]}
     ]
-    for entry in history:
-        chat_messages_for_api.append({"role": entry.role, "parts": [{"text": entry.content}]})
+    chat_messages_for_api.extend(build_chat_history(current_user.id, chat['session_id']))
 
     # 加入羊隻背景資料
     sheep_context_text = ""
@@ -528,50 +610,110 @@ def chat_with_agent():
     # 準備用戶訊息
     current_user_message_with_context = user_message + sheep_context_text
 
-    rag_chunks = rag_query(user_message + sheep_context_text, api_key=api_key)
+    rag_chunks = rag_query(user_message + sheep_context_text, api_key=chat['api_key'])
     rag_context_text = _format_rag_context(rag_chunks)
     if rag_context_text:
         current_user_message_with_context = rag_context_text + "\n" + current_user_message_with_context
     
     # 如果有圖片，加入圖片部分
     user_message_parts = [{"text": current_user_message_with_context}]
-    if image_base64:
-        mime_type = "image/jpeg"  # 默認值
-        if 'image' in request.files:
-            mime_type = image_file.content_type
-        
+    if chat['image_bytes']:
         user_message_parts.append({
             "inline_data": {
-                "mime_type": mime_type,
-                "data": image_base64
+                "mime_type": chat['image_mime_type'] or "image/jpeg",
+                "data": chat['image_bytes']
             }
         })
     
     chat_messages_for_api.append({"role": "user", "parts": user_message_parts})
+    return chat_messages_for_api
 
-    # 呼叫 Gemini API
-    gemini_response = call_gemini_api(chat_messages_for_api, api_key, generation_config_override={"temperature": 0.7})
-
-    if "error" in gemini_response:
-        return jsonify(error=gemini_response['error']), 500
 
-    model_reply_text = gemini_response.get("text", "抱歉，我暫時無法回答。")
-    
-    # 儲存聊天記錄
+def _save_chat_exchange(user_id: int, chat: dict, model_reply_text: str) -> None:
+    """儲存一輪使用者與模型的聊天記錄；失敗時僅記錄錯誤。"""
     try:
         # 為包含圖片的訊息添加標記
-        user_content = user_message
-        if image_base64:
+        user_content = chat['user_message']
+        if chat['image_bytes']:
             user_content += " [包含圖片]"
             
-        user_entry = ChatHistory(user_id=current_user.id, session_id=session_id, role='user', content=user_content, ear_num_context=ear_num_context)
-        model_entry = ChatHistory(user_id=current_user.id, session_id=session_id, role='model', content=model_reply_text, ear_num_context=ear_num_context)
+        session_id = chat['session_id']
+        ear_num_context = chat['ear_num_context']
+        user_entry = ChatHistory(user_id=user_id, session_id=session_id, role='user', content=user_content, ear_num_context=ear_num_context)
+        model_entry = ChatHistory(user_id=user_id, session_id=session_id, role='model', content=model_reply_text, ear_num_context=ear_num_context)
         db.session.add(user_entry)
         db.session.add(model_entry)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"儲存聊天記錄失败: {e}")
+        return
+    record_chat_exchange(user_id, session_id, [user_entry, model_entry])
+
+
+def _compact_history_after_response(response: Response, user_id: int, chat: dict) -> Response:
+    """回覆送出後才整併對話摘要，摘要的 LLM 呼叫不佔用回覆時間；失敗時保留原對話待下次重試。"""
+    app = current_app._get_current_object()
+    session_id, api_key = chat['session_id'], chat['api_key']
+
+    def compact() -> None:
+        with app.app_context():
+            try:
+                compact_chat_history(user_id, session_id, api_key)
+            except Exception as exc:  # pragma: no cover - 摘要為最佳努力
+                db.session.rollback()
+                app.logger.warning(f"整併對話摘要失敗: {exc}")
+
+    response.call_on_close(compact)
+    return response
+
+
+@bp.route('/chat', methods=['POST'])
+@login_required
+def chat_with_agent():
+    """與 AI 聊天，支援文字和圖片"""
+    chat, error_response = _parse_chat_request()
+    if error_response:
+        return error_response
+
+    chat_messages_for_api = _build_chat_messages(chat)
+
+    # 呼叫 Gemini API
+    gemini_response = call_gemini_api(chat_messages_for_api, chat['api_key'], generation_config_override={"temperature": 0.7})
+
+    if "error" in gemini_response:
+        return jsonify(error=gemini_response['error']), 500
+
+    model_reply_text = gemini_response.get("text", "抱歉，我暫時無法回答。")
+    
+    # 儲存聊天記錄
+    _save_chat_exchange(current_user.id, chat, model_reply_text)
 
     reply_html = markdown.markdown(model_reply_text, extensions=['fenced_code', 'tables', 'nl2br'])
-    return jsonify(reply_html=reply_html)
+    return _compact_history_after_response(jsonify(reply_html=reply_html), current_user.id, chat)
+
+
+@bp.route('/chat/stream', methods=['POST'])
+@login_required
+def stream_chat_with_agent():
+    """以 Server-Sent Events 串流 AI 聊天回覆；串流完成後才寫入聊天記錄"""
+    chat, error_response = _parse_chat_request()
+    if error_response:
+        return error_response
+
+    chat_messages_for_api = _build_chat_messages(chat)
+    user_id = current_user.id
+
+    def persist(model_reply_text: str) -> None:
+        _save_chat_exchange(user_id, chat, model_reply_text)
+
+    fragments = stream_gemini_api(chat_messages_for_api, chat['api_key'], generation_config_override={"temperature": 0.7})
+    response = _sse_response(
+        _stream_markdown_events(
+            fragments,
+            'reply_html',
+            fallback_text="抱歉，我暫時無法回答。",
+            on_complete=persist,
+        )
+    )
+    return _compact_history_after_response(response, user_id, chat)
@@ -8,12 +8,12 @@ from typing import Any
 from flask import Blueprint, jsonify, request
 from flask_login import current_user, login_required
 from pydantic import ValidationError
-from sqlalchemy import and_, func, literal, select, union
-from sqlalchemy.sql import Select
+from sqlalchemy import DateTime, Integer, and_, cast, func, literal, null, or_, select, type_coerce, union, union_all
+from sqlalchemy.sql import Select, Subquery
 from sqlalchemy.sql.elements import ColumnElement
 
 from app import db
-from app.cache import check_bi_rate_limit, get_bi_cache, set_bi_cache
+from app.cache import check_bi_rate_limit, get_bi_cache, get_or_compute_bi_cache
 from app.models import CostEntry, RevenueEntry, Sheep
 from app.schemas import (
     CohortAnalysisRequest,
@@ -22,6 +22,7 @@ from app.schemas import (
     TimeRangeModel,
     create_error_response,
 )
+from app.services.finance_rollup import DIMENSIONS, ROLLUP_MODELS, full_month_window
 
 bp = Blueprint('bi', __name__)
 
@@ -45,7 +46,7 @@ _DIMENSION_CONFIG = {
 
 
 def _dimension_expression(
-    model: type[Sheep] | type[CostEntry] | type[RevenueEntry],
+    model: Any,
     dimension: str,
 ) -> ColumnElement[Any]:
     config = _DIMENSION_CONFIG[dimension]
@@ -70,23 +71,30 @@ def _apply_sheep_filters(query: Select, filters: CohortFilterModel | None) -> Se
     return query
 
 
+def _apply_dimension_filters(query: Select, model: Any, filters: CohortFilterModel | None) -> Select:
+    if not filters:
+        return query
+    if filters.category:
+        query = query.where(model.category.in_(filters.category))
+    if filters.breed:
+        query = query.where(model.breed.in_(filters.breed))
+    if filters.lactation_number:
+        query = query.where(model.lactation_number.in_(filters.lactation_number))
+    if filters.production_stage:
+        query = query.where(model.production_stage.in_(filters.production_stage))
+    return query
+
+
 def _apply_finance_filters(
     query: Select,
     model: type[CostEntry] | type[RevenueEntry],
+    user_id: int,
     filters: CohortFilterModel | None,
     time_range: TimeRangeModel | None,
 ) -> Select:
-    conditions = [model.user_id == current_user.id]
+    conditions = [model.user_id == user_id]
 
     if filters:
-        if filters.category:
-            conditions.append(model.category.in_(filters.category))
-        if filters.breed:
-            conditions.append(model.breed.in_(filters.breed))
-        if filters.lactation_number:
-            conditions.append(model.lactation_number.in_(filters.lactation_number))
-        if filters.production_stage:
-            conditions.append(model.production_stage.in_(filters.production_stage))
         if filters.min_age_months is not None:
             conditions.append(model.age_months >= filters.min_age_months)
         if filters.max_age_months is not None:
@@ -98,7 +106,79 @@ def _apply_finance_filters(
         if time_range.end:
             conditions.append(model.recorded_at <= time_range.end)
 
-    return query.where(and_(*conditions))
+    return _apply_dimension_filters(query.where(and_(*conditions)), model, filters)
+
+
+def _month_as_datetime(column: ColumnElement[Any]) -> ColumnElement[Any]:
+    bind = db.session.get_bind()
+    dialect_name = getattr(bind.dialect, 'name', 'sqlite') if bind is not None else 'sqlite'
+    if dialect_name == 'sqlite':
+        # SQLite 以 'YYYY-MM-DD' 字串儲存日期，strftime 可直接處理
+        return type_coerce(column, DateTime)
+    return cast(column, DateTime)
+
+
+def _finance_facts(
+    model: type[CostEntry] | type[RevenueEntry],
+    user_id: int,
+    filters: CohortFilterModel | None,
+    time_range: TimeRangeModel | None,
+    *,
+    per_sheep: bool = False,
+) -> Subquery:
+    """財務資料來源：完整月份取自月彙總表，時間範圍頭尾的不完整月份才掃描明細。
+
+    月彙總表不含月齡與羊隻，依月齡篩選或需要逐羊計數（``per_sheep``）時改為全部掃描明細。
+    回傳的子查詢欄位與明細相同（``recorded_at``、各維度、``amount``、``sheep_id``），另含 ``entry_count``。
+    """
+    use_rollup = not per_sheep and not (
+        filters and (filters.min_age_months is not None or filters.max_age_months is not None)
+    )
+    start = time_range.start if time_range else None
+    end = time_range.end if time_range else None
+    window = full_month_window(start, end) if use_rollup else None
+
+    parts = []
+    if window is not None:
+        lower, upper = window
+        rollup = ROLLUP_MODELS[model]
+        rollup_query = select(
+            _month_as_datetime(rollup.month).label('recorded_at'),
+            *[getattr(rollup, name).label(name) for name in DIMENSIONS],
+            rollup.total_amount.label('amount'),
+            rollup.entry_count.label('entry_count'),
+            cast(null(), Integer).label('sheep_id'),
+        ).where(rollup.user_id == user_id)
+        rollup_query = _apply_dimension_filters(rollup_query, rollup, filters)
+        if lower is not None:
+            rollup_query = rollup_query.where(rollup.month >= lower.date())
+        if upper is not None:
+            rollup_query = rollup_query.where(rollup.month < upper.date())
+        parts.append(rollup_query)
+
+    raw_query = select(
+        model.recorded_at.label('recorded_at'),
+        *[getattr(model, name).label(name) for name in DIMENSIONS],
+        model.amount.label('amount'),
+        literal(1).label('entry_count'),
+        model.sheep_id.label('sheep_id'),
+    )
+    raw_query = _apply_finance_filters(raw_query, model, user_id, filters, time_range)
+    if window is not None:
+        lower, upper = window
+        outside = []
+        if lower is not None:
+            outside.append(model.recorded_at < lower)
+        if upper is not None:
+            outside.append(model.recorded_at >= upper)
+        if outside:
+            parts.append(raw_query.where(or_(*outside)))
+    else:
+        parts.append(raw_query)
+
+    if len(parts) == 1:
+        return parts[0].subquery(f'{model.__tablename__}_facts')
+    return union_all(*parts).subquery(f'{model.__tablename__}_facts')
 
 
 def _serialize_decimal(value: Decimal | None) -> float | None:
@@ -113,7 +193,7 @@ def _cohort_analysis(payload: dict) -> dict:
     except ValidationError as exc:
         return {'error': create_error_response('請求資料驗證失敗', exc.errors()), 'status': 400}
 
-    wrapped_payload = {'endpoint': 'cohort', 'payload': request_model.model_dump()}
+    wrapped_payload = {'endpoint': 'cohort', 'payload': request_model.model_dump(mode='json')}
     cached = get_bi_cache(current_user.id, wrapped_payload)
     if cached:
         return {'data': cached, 'status': 200}
@@ -121,6 +201,12 @@ def _cohort_analysis(payload: dict) -> dict:
     if not check_bi_rate_limit(current_user.id, 'cohort-analysis'):
         return {'error': create_error_response('查詢次數過多，請稍後再試'), 'status': 429}
 
+    user_id = current_user.id
+    result = get_or_compute_bi_cache(user_id, wrapped_payload, lambda: _compute_cohort(user_id, request_model))
+    return {'data': result, 'status': 200}
+
+
+def _compute_cohort(user_id: int, request_model: CohortAnalysisRequest) -> dict:
     dimension_exprs = []
     dimension_labels = []
     for dimension in request_model.cohort_by:
@@ -133,32 +219,32 @@ def _cohort_analysis(payload: dict) -> dict:
         func.count(Sheep.id).label('sheep_count'),
         func.avg(Sheep.Body_Weight_kg).label('avg_weight'),
         func.avg(Sheep.milk_yield_kg_day).label('avg_milk'),
-    ).where(Sheep.user_id == current_user.id)
+    ).where(Sheep.user_id == user_id)
     sheep_query = _apply_sheep_filters(sheep_query, request_model.filters)
     if dimension_exprs:
         sheep_query = sheep_query.group_by(*dimension_exprs)
     sheep_subquery = sheep_query.subquery('sheep_cohort')
 
+    cost_facts = _finance_facts(CostEntry, user_id, request_model.filters, request_model.time_range)
     cost_group_exprs = [
-        _dimension_expression(CostEntry, dimension).label(dimension) for dimension in request_model.cohort_by
+        _dimension_expression(cost_facts.c, dimension).label(dimension) for dimension in request_model.cohort_by
     ]
     cost_query = select(
         *cost_group_exprs,
-        func.sum(CostEntry.amount).label('total_cost'),
+        func.sum(cost_facts.c.amount).label('total_cost'),
     )
-    cost_query = _apply_finance_filters(cost_query, CostEntry, request_model.filters, request_model.time_range)
     if cost_group_exprs:
         cost_query = cost_query.group_by(*cost_group_exprs)
     cost_subquery = cost_query.subquery('cost_cohort')
 
+    revenue_facts = _finance_facts(RevenueEntry, user_id, request_model.filters, request_model.time_range)
     revenue_group_exprs = [
-        _dimension_expression(RevenueEntry, dimension).label(dimension) for dimension in request_model.cohort_by
+        _dimension_expression(revenue_facts.c, dimension).label(dimension) for dimension in request_model.cohort_by
     ]
     revenue_query = select(
         *revenue_group_exprs,
-        func.sum(RevenueEntry.amount).label('total_revenue'),
+        func.sum(revenue_facts.c.amount).label('total_revenue'),
     )
-    revenue_query = _apply_finance_filters(revenue_query, RevenueEntry, request_model.filters, request_model.time_range)
     if revenue_group_exprs:
         revenue_query = revenue_query.group_by(*revenue_group_exprs)
     revenue_subquery = revenue_query.subquery('revenue_cohort')
@@ -198,9 +284,7 @@ def _cohort_analysis(payload: dict) -> dict:
 
     rows = db.session.execute(final_query).all()
     if not rows:
-        result = {'items': [], 'metrics': request_model.metrics}
-        set_bi_cache(current_user.id, wrapped_payload, result)
-        return {'data': result, 'status': 200}
+        return {'items': [], 'metrics': request_model.metrics}
 
     response_items = []
     for row in rows:
@@ -237,15 +321,22 @@ def _cohort_analysis(payload: dict) -> dict:
         item['metrics'] = {metric: metrics_payload.get(metric) for metric in request_model.metrics}
         response_items.append(item)
 
-    result = {
+    return {
         'items': response_items,
         'metrics': request_model.metrics,
     }
-    set_bi_cache(current_user.id, wrapped_payload, result)
-    return {'data': result, 'status': 200}
 
 
-def _time_group_expression(model: type[CostEntry] | type[RevenueEntry], group_by: str) -> list[ColumnElement]:
+def compute_bi_response(user_id: int, wrapped_payload: dict) -> dict:
+    """依快取鍵值中的原始查詢重算 BI 結果，供背景刷新使用。"""
+    if wrapped_payload['endpoint'] == 'cohort':
+        return _compute_cohort(user_id, CohortAnalysisRequest(**wrapped_payload['payload']))
+    if wrapped_payload['endpoint'] == 'cost-benefit':
+        return _compute_cost_benefit(user_id, CostBenefitRequest(**wrapped_payload['payload']))
+    raise ValueError('不支援的 BI 查詢類型')
+
+
+def _time_group_expression(model: Any, group_by: str) -> list[ColumnElement]:
     if group_by == 'none':
         return []
     if group_by == 'month':
@@ -268,7 +359,7 @@ def _cost_benefit(payload: dict) -> dict:
     except ValidationError as exc:
         return {'error': create_error_response('請求資料驗證失敗', exc.errors()), 'status': 400}
 
-    wrapped_payload = {'endpoint': 'cost-benefit', 'payload': request_model.model_dump()}
+    wrapped_payload = {'endpoint': 'cost-benefit', 'payload': request_model.model_dump(mode='json')}
     cached = get_bi_cache(current_user.id, wrapped_payload)
     if cached:
         return {'data': cached, 'status': 200}
@@ -276,24 +367,39 @@ def _cost_benefit(payload: dict) -> dict:
     if not check_bi_rate_limit(current_user.id, 'cost-benefit'):
         return {'error': create_error_response('查詢次數過多，請稍後再試'), 'status': 429}
 
-    group_expr_cost = _time_group_expression(CostEntry, request_model.group_by)
+    user_id = current_user.id
+    result = get_or_compute_bi_cache(user_id, wrapped_payload, lambda: _compute_cost_benefit(user_id, request_model))
+    return {'data': result, 'status': 200}
+
+
+def _compute_cost_benefit(user_id: int, request_model: CostBenefitRequest) -> dict:
+    # 每頭平均需要逐羊去重計數，只有這時才需掃描明細
+    per_sheep = bool({'avg_cost_per_head', 'avg_revenue_per_head'} & set(request_model.metrics))
+
+    cost_facts = _finance_facts(
+        CostEntry, user_id, request_model.filters, request_model.time_range, per_sheep=per_sheep
+    )
+    group_expr_cost = _time_group_expression(cost_facts.c, request_model.group_by)
     cost_query = select(
         *group_expr_cost,
-        func.sum(CostEntry.amount).label('total_cost'),
-        func.count(func.distinct(CostEntry.sheep_id)).label('sheep_incurred'),
+        func.sum(cost_facts.c.amount).label('total_cost'),
+        func.count(func.distinct(cost_facts.c.sheep_id)).label('sheep_incurred'),
+        func.sum(cost_facts.c.entry_count).label('entry_count'),
     )
-    cost_query = _apply_finance_filters(cost_query, CostEntry, request_model.filters, request_model.time_range)
     if group_expr_cost:
         cost_query = cost_query.group_by(*group_expr_cost)
     cost_subquery = cost_query.subquery('cost_benefit')
 
-    group_expr_revenue = _time_group_expression(RevenueEntry, request_model.group_by)
+    revenue_facts = _finance_facts(
+        RevenueEntry, user_id, request_model.filters, request_model.time_range, per_sheep=per_sheep
+    )
+    group_expr_revenue = _time_group_expression(revenue_facts.c, request_model.group_by)
     revenue_query = select(
         *group_expr_revenue,
-        func.sum(RevenueEntry.amount).label('total_revenue'),
-        func.count(func.distinct(RevenueEntry.sheep_id)).label('sheep_served'),
+        func.sum(revenue_facts.c.amount).label('total_revenue'),
+        func.count(func.distinct(revenue_facts.c.sheep_id)).label('sheep_served'),
+        func.sum(revenue_facts.c.entry_count).label('entry_count'),
     )
-    revenue_query = _apply_finance_filters(revenue_query, RevenueEntry, request_model.filters, request_model.time_range)
     if group_expr_revenue:
         revenue_query = revenue_query.group_by(*group_expr_revenue)
     revenue_subquery = revenue_query.subquery('revenue_benefit')
@@ -307,6 +413,9 @@ def _cost_benefit(payload: dict) -> dict:
             (cost_row._mapping['sheep_incurred'] if cost_row else 0) or 0,
             (revenue_row._mapping['sheep_served'] if revenue_row else 0) or 0,
         )
+        entry_count = ((cost_row._mapping['entry_count'] if cost_row else 0) or 0) + (
+            (revenue_row._mapping['entry_count'] if revenue_row else 0) or 0
+        )
         net_profit = total_revenue - total_cost
         summary_decimal = {
             'total_cost': total_cost,
@@ -328,7 +437,7 @@ def _cost_benefit(payload: dict) -> dict:
                 'group': '總計',
                 'metrics': item_metrics,
             }
-        ] if (total_cost or total_revenue or sheep_count) else []
+        ] if (total_cost or total_revenue or entry_count) else []
     else:
         group_by = request_model.group_by
         if group_by == 'month':
@@ -396,13 +505,11 @@ def _cost_benefit(payload: dict) -> dict:
 
         summary = {key: float(value) for key, value in summary_decimal.items()}
 
-    result = {
+    return {
         'summary': summary,
         'items': items,
         'metrics': request_model.metrics,
     }
-    set_bi_cache(current_user.id, wrapped_payload, result)
-    return {'data': result, 'status': 200}
 
 
 @bp.route('/cohort-analysis', methods=['POST'])
@@ -5,6 +5,7 @@ from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app, send_file
 from flask_login import login_required, current_user
 from app import db
+from app.cache import clear_bi_cache, clear_dashboard_cache, clear_dashboard_state, clear_farm_report_cache, clear_prediction_cache, clear_sheep_context_cache
 from app.models import Sheep, SheepEvent, SheepHistoricalData, ChatHistory
 from app.utils import call_gemini_api
 
@@ -406,7 +407,8 @@ def ai_import_mapping():
         ai_response = call_gemini_api(
             prompt,
             api_key,
-            generation_config_override={"temperature": 0.25, "topK": 1, "topP": 0.9}
+            generation_config_override={"temperature": 0.25, "topK": 1, "topP": 0.9},
+            cache_policy="ai_import_mapping",
         )
 
         if not isinstance(ai_response, dict):
@@ -453,6 +455,17 @@ def ai_import_mapping():
         current_app.logger.error(f"AI 智慧導入分析失敗: {e}", exc_info=True)
         return jsonify(error=f"AI 智慧分析過程中發生錯誤: {str(e)}"), 500
 
+
+def _clear_import_caches(user_id, sheep_ids):
+    """清除 Excel 匯入影響的快取：已提交羊隻的預測，以及使用者層級的背景、儀表板與 BI 快取。"""
+    clear_prediction_cache(*sheep_ids)
+    clear_sheep_context_cache(user_id)
+    clear_dashboard_state(user_id)
+    clear_dashboard_cache(user_id)
+    clear_farm_report_cache(user_id)
+    clear_bi_cache(user_id)
+
+
 @bp.route('/process_import', methods=['POST'])
 @login_required
 def process_import():
@@ -485,6 +498,9 @@ def process_import():
         except json.JSONDecodeError:
             return jsonify(error="映射設定格式錯誤"), 400
 
+    # 基礎資料會先分段提交；只要有任何提交，不論匯入最後是否成功都要清除快取
+    committed = False
+    committed_sheep_ids = set()
     try:
         xls = pd.ExcelFile(file)
         report_details = []
@@ -528,6 +544,7 @@ def process_import():
             
             df = pd.read_excel(xls, sheet_name=sheet_name, dtype=str).where(pd.notna, None)
             created, updated = 0, 0
+            touched_sheep = []
             for _, row in df.iterrows():
                 ear_num = row.get(cols['EarNum'])
                 if not ear_num: continue
@@ -539,6 +556,7 @@ def process_import():
                     created += 1
                 else:
                     updated += 1
+                touched_sheep.append(sheep)
                 
                 for db_field, xls_col in cols.items():
                     if hasattr(sheep, db_field) and xls_col in row and row[xls_col] is not None:
@@ -548,11 +566,16 @@ def process_import():
                         elif 'Date' in db_field: value = format_date(value)
                         setattr(sheep, db_field, value)
             
+            db.session.flush()
+            sheet_sheep_ids = {sheep.id for sheep in touched_sheep}
             db.session.commit() # 提交基礎資料變更
+            committed = True
+            committed_sheep_ids.update(sheet_sheep_ids)
             report_details.append({"sheet": sheet_name, "message": f"處理完成。新增 {created} 筆，更新 {updated} 筆基礎資料。"})
 
         # --- 第二階段：處理事件和歷史數據 ---
         sheep_id_cache = {s.EarNum: s.id for s in Sheep.query.filter_by(user_id=current_user.id).all()}
+        history_sheep_ids = set()
         
         for sheet_name, sheet_config in sheets_to_process.items():
             if sheet_name not in xls.sheet_names or sheet_config.get('purpose') in ['ignore', 'basic_info', 'breed_mapping', 'sex_mapping']: continue
@@ -612,6 +635,7 @@ def process_import():
                     try:
                         db.session.add(SheepHistoricalData(user_id=current_user.id, sheep_id=sheep_id, record_date=formatted_date, record_type=hist_type, value=float(hist_value)))
                         count += 1
+                        history_sheep_ids.add(sheep_id)
                     except (ValueError, TypeError):
                         continue
 
@@ -619,9 +643,14 @@ def process_import():
                 report_details.append({"sheet": sheet_name, "message": f"成功導入 {count} 筆記錄。"})
 
         db.session.commit()
+        committed = True
+        committed_sheep_ids.update(history_sheep_ids)
         return jsonify(success=True, message="數據導入已成功完成！", details=report_details)
 
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"導入 Excel 數據失敗: {e}", exc_info=True)
-        return jsonify(error=f"導入數據過程中發生錯誤: {str(e)}"), 500
\ No newline at end of file
+        return jsonify(error=f"導入數據過程中發生錯誤: {str(e)}"), 500
+    finally:
+        if committed:
+            _clear_import_caches(current_user.id, committed_sheep_ids)
\ No newline at end of file
@@ -14,6 +14,7 @@ from sqlalchemy import and_, select
 from sqlalchemy.exc import IntegrityError
 
 from app import db
+from app.cache import clear_bi_cache
 from app.models import CostEntry, RevenueEntry, Sheep
 from app.schemas import (
     CostEntryCreateModel,
@@ -23,6 +24,7 @@ from app.schemas import (
     RevenueEntryUpdateModel,
     create_error_response,
 )
+from app.services.finance_rollup import apply_rollup_changes, entry_bucket
 
 bp = Blueprint('finance', __name__)
 
@@ -117,7 +119,9 @@ def _create_entry(model_cls: Type[CostEntry | RevenueEntry], payload: dict) -> d
     payload['amount'] = _normalize_amount(payload['amount'])
     entry = model_cls(**payload)
     db.session.add(entry)
+    apply_rollup_changes(model_cls, added=[entry_bucket(entry)])
     db.session.commit()
+    clear_bi_cache(current_user.id)
     return _serialize_entry(entry)
 
 
@@ -131,9 +135,12 @@ def _update_entry(model_cls: Type[CostEntry | RevenueEntry], entry_id: int, payl
     if 'amount' in payload and payload['amount'] is not None:
         payload['amount'] = _normalize_amount(payload['amount'])
 
+    previous = entry_bucket(entry)
     for key, value in payload.items():
         setattr(entry, key, value)
+    apply_rollup_changes(model_cls, removed=[previous], added=[entry_bucket(entry)])
     db.session.commit()
+    clear_bi_cache(current_user.id)
     db.session.refresh(entry)
     return _serialize_entry(entry)
 
@@ -148,7 +155,9 @@ def _handle_bulk_import(model_cls: Type[CostEntry | RevenueEntry], entries: list
         entry = model_cls(**item)
         db.session.add(entry)
         created.append(entry)
+    apply_rollup_changes(model_cls, added=[entry_bucket(entry) for entry in created])
     db.session.commit()
+    clear_bi_cache(current_user.id)
     return {'items': [_serialize_entry(e) for e in created]}
 
 
@@ -224,8 +233,10 @@ class FinanceEntryAPI(MethodView):
         if not entry or entry.user_id != current_user.id:
             return jsonify(create_error_response('資料不存在')), 404
 
+        apply_rollup_changes(self.model, removed=[entry_bucket(entry)])
         db.session.delete(entry)
         db.session.commit()
+        clear_bi_cache(current_user.id)
         return jsonify({'success': True})
 
 
@@ -1,15 +1,19 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, has_app_context
 from flask_login import login_required, current_user
+from app.cache import get_prediction_batch_result, get_prediction_cache, set_prediction_cache
 from app.models import Sheep, SheepHistoricalData
-from app.utils import call_gemini_api
+from app.schemas import BatchPredictionRequestModel, create_error_response
+from app.services.model_registry import ModelRegistry
+from app.utils import call_gemini_api, call_gemini_api_many
 from datetime import datetime, date, timedelta
 from pathlib import Path
-import importlib
 import numpy as np
 import pandas as pd
 from sklearn.linear_model import LinearRegression
-import joblib
+import hashlib
+import hmac
 import json
+from pydantic import ValidationError
 
 bp = Blueprint('prediction', __name__)
 
@@ -203,6 +207,14 @@ DISPLAY_FIELD_NAMES = {
 _lgbm_models = {}
 _lgbm_load_error = None
 _lgbm_category_levels = {}
+_lgbm_model_version = None
+_lgbm_boosters = {}
+_lgbm_category_codes = {}
+
+model_registry = ModelRegistry(MODEL_DIR, LGBM_MODEL_FILES)
+
+# 影響 LightGBM 特徵的羊隻欄位，納入預測快取指紋
+FORECAST_SHEEP_FIELDS = ('BirthDate', 'BirWei', 'Sex', 'Breed', 'LittleSize', 'Lactation', 'DaysInMilk', 'ReproStatus', 'status')
 
 
 def _postprocess_lgbm_model(model):
@@ -215,56 +227,63 @@ def _postprocess_lgbm_model(model):
         pass
 
 
-def _ensure_lgbm_models():
-    """Lazy-load LightGBM 模型，供預測使用。"""
-    global _lgbm_models, _lgbm_load_error, _lgbm_category_levels
+def _sync_from_registry():
+    """將模型註冊表的快照同步至模組層級變數。"""
+    global _lgbm_models, _lgbm_category_levels, _lgbm_model_version, _lgbm_boosters, _lgbm_category_codes
 
-    if _lgbm_models:
-        return True
-    if _lgbm_load_error:
-        return False
-
-    if importlib.util.find_spec('lightgbm') is None:  # pragma: no cover - 需實際環境才會觸發
-        _lgbm_load_error = "LightGBM 套件未安裝"
-        if current_app:
-            current_app.logger.warning(_lgbm_load_error)
-        return False
-
-    loaded_models = {}
-    main_model_path = MODEL_DIR / LGBM_MODEL_FILES['main']
-    if not main_model_path.exists():
-        _lgbm_load_error = f"找不到主要模型檔案 {main_model_path.name}"
-        if current_app:
-            current_app.logger.warning(_lgbm_load_error)
-        return False
+    loaded_models = dict(model_registry.models)
+    for model in loaded_models.values():
+        _postprocess_lgbm_model(model)
 
-    try:
-        loaded_models['main'] = joblib.load(main_model_path)
-        _postprocess_lgbm_model(loaded_models['main'])
-
-        _lgbm_category_levels = {}
-        booster = getattr(loaded_models['main'], 'booster_', None)
-        category_info = getattr(booster, 'pandas_categorical', None) if booster else None
-        if category_info and LGBM_CATEGORICAL_FEATURE_LIST:
-            _lgbm_category_levels = dict(zip(LGBM_CATEGORICAL_FEATURE_LIST, category_info))
-
-        for key in ('q10', 'q90'):
-            model_path = MODEL_DIR / LGBM_MODEL_FILES[key]
-            if model_path.exists():
-                loaded_models[key] = joblib.load(model_path)
-                _postprocess_lgbm_model(loaded_models[key])
-            else:
-                message = f"量化模型檔案 {model_path.name} 不存在"
-                if current_app:
-                    current_app.logger.warning(message)
-    except Exception as exc:  # pragma: no cover - 需實際模型才會觸發
-        _lgbm_load_error = f"載入 LightGBM 模型失敗: {exc}"
-        if current_app:
-            current_app.logger.warning(_lgbm_load_error)
-        return False
+    category_levels = {}
+    main_model = loaded_models.get('main')
+    booster = getattr(main_model, 'booster_', main_model)
+    category_info = getattr(booster, 'pandas_categorical', None) if booster is not None else None
+    if category_info and LGBM_CATEGORICAL_FEATURE_LIST:
+        category_levels = dict(zip(LGBM_CATEGORICAL_FEATURE_LIST, category_info))
 
+    boosters = {}
+    for key, model in loaded_models.items():
+        booster = getattr(model, 'booster_', model)
+        if callable(getattr(booster, 'predict', None)) and hasattr(booster, 'num_trees'):
+            boosters[key] = booster
+
+    _lgbm_category_levels = category_levels
+    _lgbm_category_codes = {
+        feature: {level: index for index, level in enumerate(levels)}
+        for feature, levels in category_levels.items()
+    }
+    _lgbm_boosters = boosters if len(boosters) == len(loaded_models) else {}
     _lgbm_models = loaded_models
-    return True
+    _lgbm_model_version = model_registry.version
+
+
+def _ensure_lgbm_models():
+    """確保 LightGBM 模型已載入；啟動時通常已由 preload 完成。"""
+    global _lgbm_load_error
+
+    if has_app_context():
+        redis_client = current_app.extensions.get('redis_client')
+        if redis_client is not None:
+            model_registry.sync_generation(redis_client)
+
+    if model_registry.load():
+        if not _lgbm_models or _lgbm_model_version != model_registry.version:
+            _sync_from_registry()
+        _lgbm_load_error = None
+        return True
+
+    if model_registry.last_error != _lgbm_load_error and has_app_context():
+        current_app.logger.warning(model_registry.last_error)
+    _lgbm_load_error = model_registry.last_error
+    return False
+
+
+def _current_model_version():
+    """回傳目前預測所用模型的版本；無 LightGBM 時為線性迴歸。"""
+    if _ensure_lgbm_models():
+        return _lgbm_model_version or 'lightgbm'
+    return 'linear'
 
 
 def _coerce_numeric(value, field_name, warnings):
@@ -279,6 +298,26 @@ def _coerce_numeric(value, field_name, warnings):
         return np.nan
 
 
+def _coerce_numeric_array(values, field_name, warnings):
+    """向量版 :func:`_coerce_numeric`：整批轉為 float 陣列，缺值或無法轉換者為 NaN，每種問題只記錄一次警告。"""
+    try:
+        array = np.asarray(values, dtype=float)
+        if not np.isnan(array).any():
+            return array
+    except (TypeError, ValueError):
+        pass
+
+    raw = pd.Series(list(values), dtype=object)
+    missing = raw.isna()
+    coerced = pd.to_numeric(raw, errors='coerce')
+    invalid = coerced.isna() & ~missing
+    if missing.any():
+        warnings.append(f"{field_name} 缺值，已使用 NaN（{int(missing.sum())} 筆）")
+    if invalid.any():
+        warnings.append(f"{field_name} 無法轉為數值，已使用 NaN（{int(invalid.sum())} 筆）")
+    return coerced.to_numpy(dtype=float)
+
+
 def _coerce_categorical(value, field_name, warnings):
     """將輸入轉為字串；缺值時以 'Unknown' 取代並記錄警告。"""
     if value in (None, ''):
@@ -364,46 +403,156 @@ def _determine_seasonality(target_date):
     return target_date.month
 
 
-def _build_lgbm_dataframe(sheep, future_days, future_date):
-    """組裝 LightGBM 模型所需的特徵資料。"""
-    if not LGBM_FEATURE_ORDER:
-        return None, "缺少 LightGBM 特徵定義"
-
+def _lgbm_feature_values(sheep, age_days_series, future_dates):
+    """計算靜態（每隻羊一次）與動態（每個預測日）特徵值。"""
     warnings = []
-    feature_values = {}
-
-    feature_values['AgeDays'] = _coerce_numeric(future_days, 'AgeDays', warnings)
-    feature_values['BirWei'] = _coerce_numeric(getattr(sheep, 'BirWei', None), 'BirWei', warnings)
-    feature_values['Sex'] = _normalize_category('Sex', getattr(sheep, 'Sex', None), warnings)
-    feature_values['Breed'] = _normalize_category('Breed', getattr(sheep, 'Breed', None), warnings)
-    feature_values['LittleSize'] = _coerce_numeric(getattr(sheep, 'LittleSize', None), 'LittleSize', warnings)
-    feature_values['Lactation'] = _coerce_numeric(getattr(sheep, 'Lactation', None), 'Lactation', warnings)
+    static_values = {}
+
+    static_values['BirWei'] = _coerce_numeric(getattr(sheep, 'BirWei', None), 'BirWei', warnings)
+    static_values['Sex'] = _normalize_category('Sex', getattr(sheep, 'Sex', None), warnings)
+    static_values['Breed'] = _normalize_category('Breed', getattr(sheep, 'Breed', None), warnings)
+    static_values['LittleSize'] = _coerce_numeric(getattr(sheep, 'LittleSize', None), 'LittleSize', warnings)
+    static_values['Lactation'] = _coerce_numeric(getattr(sheep, 'Lactation', None), 'Lactation', warnings)
     days_in_milk_raw = getattr(sheep, 'DaysInMilk', None)
     if days_in_milk_raw in (None, ''):
         days_in_milk_raw = -1
     days_in_milk_value = _coerce_numeric(days_in_milk_raw, 'DaysInMilk', warnings)
     if not np.isfinite(days_in_milk_value):
         days_in_milk_value = -1
-    feature_values['DaysInMilk'] = days_in_milk_value
+    static_values['DaysInMilk'] = days_in_milk_value
 
     repro_status = getattr(sheep, 'ReproStatus', None) or getattr(sheep, 'status', None) or '未配種'
-    feature_values['ReproStatus'] = _normalize_category('ReproStatus', repro_status, warnings)
+    static_values['ReproStatus'] = _normalize_category('ReproStatus', repro_status, warnings)
+
+    dynamic_warnings = []
+    dynamic_values = {
+        'AgeDays': _coerce_numeric_array(age_days_series, 'AgeDays', dynamic_warnings),
+        'Seasonality': _coerce_numeric_array(
+            [_determine_seasonality(day) if day else None for day in future_dates], 'Seasonality', dynamic_warnings
+        ),
+    }
+    if dynamic_warnings:
+        # 逐日特徵整批轉換，每次組裝只記錄一次
+        current_app.logger.warning(f"LightGBM 逐日特徵含無效值: {'；'.join(dynamic_warnings)}")
+        warnings.extend(dynamic_warnings)
+    return static_values, dynamic_values, '；'.join(warnings) if warnings else None
+
+
+def _build_lgbm_feature_frame(sheep, age_days_series, future_dates):
+    """一次組裝多個預測日的 LightGBM 特徵矩陣。
 
-    feature_values['Seasonality'] = _coerce_numeric(_determine_seasonality(future_date), 'Seasonality', warnings)
+    靜態特徵（出生重、品種等）只計算一次並廣播到每一列；僅 AgeDays 與
+    Seasonality 隨預測日變動。分類欄位亦只轉換一次。
+    """
+    if not LGBM_FEATURE_ORDER:
+        return None, "缺少 LightGBM 特徵定義"
 
-    ordered_row = [feature_values.get(feature, np.nan) for feature in LGBM_FEATURE_ORDER]
-    dataframe = pd.DataFrame([ordered_row], columns=LGBM_FEATURE_ORDER)
+    row_count = len(age_days_series)
+    if row_count == 0 or row_count != len(future_dates):
+        return None, "預測日序列長度不一致"
+
+    static_values, dynamic_values, warning = _lgbm_feature_values(sheep, age_days_series, future_dates)
+
+    columns = {}
+    for feature in LGBM_FEATURE_ORDER:
+        if feature in dynamic_values:
+            columns[feature] = dynamic_values[feature]
+        else:
+            columns[feature] = [static_values.get(feature, np.nan)] * row_count
+    dataframe = pd.DataFrame(columns, columns=LGBM_FEATURE_ORDER)
 
     if _lgbm_category_levels:
         for feature, categories in _lgbm_category_levels.items():
             if feature in dataframe.columns and categories:
                 dataframe[feature] = pd.Categorical(dataframe[feature], categories=categories)
 
-    return dataframe, '；'.join(warnings) if warnings else None
+    return dataframe, warning
+
+
+def _build_lgbm_feature_matrix(sheep, age_days_series, future_dates):
+    """不經 pandas 組裝 float32 特徵矩陣。
+
+    分類欄位依 ``_lgbm_category_codes`` 直接編碼為類別索引，未知類別為 NaN，
+    與 LightGBM 處理 ``pd.Categorical`` 的方式相同。
+    """
+    if not LGBM_FEATURE_ORDER:
+        return None, "缺少 LightGBM 特徵定義"
+
+    row_count = len(age_days_series)
+    if row_count == 0 or row_count != len(future_dates):
+        return None, "預測日序列長度不一致"
+
+    static_values, dynamic_values, warning = _lgbm_feature_values(sheep, age_days_series, future_dates)
+
+    matrix = np.empty((row_count, len(LGBM_FEATURE_ORDER)), dtype=np.float32)
+    for column, feature in enumerate(LGBM_FEATURE_ORDER):
+        if feature in dynamic_values:
+            matrix[:, column] = dynamic_values[feature]
+        elif feature in _lgbm_category_codes:
+            matrix[:, column] = _lgbm_category_codes[feature].get(static_values.get(feature), np.nan)
+        else:
+            value = static_values.get(feature, np.nan)
+            matrix[:, column] = value if value is not None else np.nan
 
+    return matrix, warning
 
-def _compute_prediction_metrics(sheep, weight_data, target_days, birth_date):
-    """根據歷史體重數據計算預測結果、曲線與統計指標。"""
+
+def _lgbm_fast_path_ready():
+    """所有模型皆有 Booster 且分類欄位皆有編碼表時，可走 NumPy 推論路徑。"""
+    return (
+        bool(_lgbm_boosters)
+        and set(_lgbm_boosters) == set(_lgbm_models)
+        and all(feature in _lgbm_category_codes for feature in LGBM_CATEGORICAL_FEATURE_LIST)
+    )
+
+
+def _build_lgbm_inputs(sheep, age_days_series, future_dates):
+    """依推論路徑組裝 NumPy 特徵矩陣或 pandas DataFrame。"""
+    if _lgbm_fast_path_ready():
+        return _build_lgbm_feature_matrix(sheep, age_days_series, future_dates)
+    return _build_lgbm_feature_frame(sheep, age_days_series, future_dates)
+
+
+def _build_lgbm_dataframe(sheep, future_days, future_date):
+    """組裝單一預測日的 LightGBM 特徵資料。"""
+    return _build_lgbm_feature_frame(sheep, [future_days], [future_date])
+
+
+def _predict_lgbm_curves(feature_frame):
+    """以單次 predict 呼叫取得主模型與 q10/q90 曲線（皆為一維陣列）。
+
+    傳入 NumPy 矩陣時直接呼叫 Booster.predict，略過 sklearn 與 pandas 的轉換。
+    """
+    models = _lgbm_boosters if isinstance(feature_frame, np.ndarray) else _lgbm_models
+    main_model = models.get('main')
+    q10_model = models.get('q10')
+    q90_model = models.get('q90')
+
+    pred_values = np.asarray(main_model.predict(feature_frame), dtype=float)
+    q10_values = np.asarray(q10_model.predict(feature_frame), dtype=float) if q10_model else None
+    q90_values = np.asarray(q90_model.predict(feature_frame), dtype=float) if q90_model else None
+
+    if q10_values is not None and q90_values is not None:
+        q10_values, q90_values = np.minimum(q10_values, q90_values), np.maximum(q10_values, q90_values)
+
+    return pred_values, q10_values, q90_values
+
+
+def _forecast_axis(current_days, target_days):
+    """回傳預測日偏移、對應日齡與日期序列。"""
+    today = date.today()
+    day_offsets = list(range(0, target_days + 1))
+    age_series = [current_days + offset for offset in day_offsets]
+    future_dates = [today + timedelta(days=offset) for offset in day_offsets]
+    return day_offsets, age_series, future_dates
+
+
+def _compute_prediction_metrics(sheep, weight_data, target_days, birth_date, precomputed_lgbm=None):
+    """根據歷史體重數據計算預測結果、曲線與統計指標。
+
+    ``precomputed_lgbm`` 可傳入 ``(feature_warning, (pred, q10, q90))``，供批次預測
+    先以堆疊特徵矩陣一次推論後，再逐隻套用相同的後處理與備援邏輯。
+    """
     if not weight_data or not birth_date:
         return None, "無有效的體重記錄可用於預測"
 
@@ -434,10 +583,7 @@ def _compute_prediction_metrics(sheep, weight_data, target_days, birth_date):
     latest_weight = float(weights[-1]) if weights else float('nan')
     first_weight = float(weights[0]) if weights else float('nan')
 
-    today = date.today()
-    day_offsets = list(range(0, target_days + 1))
-    age_series = [current_days + offset for offset in day_offsets]
-    future_dates = [today + timedelta(days=offset) for offset in day_offsets] if birth_date else [None for _ in day_offsets]
+    day_offsets, age_series, future_dates = _forecast_axis(current_days, target_days)
 
     linear_series = model.predict(np.array(age_series).reshape(-1, 1))
     linear_series = [float(value) for value in linear_series]
@@ -500,56 +646,45 @@ def _compute_prediction_metrics(sheep, weight_data, target_days, birth_date):
 
     if birth_date and not skip_lgbm_due_to_age and _ensure_lgbm_models():
         try:
-            main_model = _lgbm_models.get('main')
-            if main_model is None:
+            if _lgbm_models.get('main') is None:
                 metrics['warning_messages'].append('主要 LightGBM 模型尚未就緒，已使用線性迴歸')
             else:
-                q10_model = _lgbm_models.get('q10')
-                q90_model = _lgbm_models.get('q90')
-
-                lgbm_daily_forecasts = []
+                lgbm_daily_forecasts = None
                 lgbm_confidence_band = []
-                recorded_feature_warnings = set()
-
-                for idx, offset in enumerate(day_offsets):
-                    day_age = age_series[idx]
-                    day_date = future_dates[idx]
-                    lgbm_input, feature_warning = _build_lgbm_dataframe(sheep, day_age, day_date)
-
-                    if feature_warning:
-                        for warning_msg in feature_warning.split('；'):
-                            warning_msg = warning_msg.strip()
-                            if warning_msg and warning_msg not in recorded_feature_warnings:
-                                metrics['warning_messages'].append(warning_msg)
-                                recorded_feature_warnings.add(warning_msg)
-
-                    if lgbm_input is None:
-                        lgbm_daily_forecasts = None
-                        break
-
-                    pred_value = float(main_model.predict(lgbm_input)[0])
-                    q10_value = float(q10_model.predict(lgbm_input)[0]) if q10_model else None
-                    q90_value = float(q90_model.predict(lgbm_input)[0]) if q90_model else None
-
-                    if q10_value is not None and q90_value is not None and q10_value > q90_value:
-                        q10_value, q90_value = q90_value, q10_value
-
-                    forecast_entry = {
-                        'day_offset': int(offset),
-                        'age_days': int(day_age),
-                        'date': day_date.strftime('%Y-%m-%d') if day_date else None,
-                        'predicted_weight': max(pred_value, 0.0)
-                    }
-                    lgbm_daily_forecasts.append(forecast_entry)
-
-                    band_entry = {
-                        'day_offset': int(offset),
-                        'age_days': int(day_age),
-                        'date': day_date.strftime('%Y-%m-%d') if day_date else None,
-                        'lower': max(q10_value, 0.0) if q10_value is not None else None,
-                        'upper': max(q90_value, 0.0) if q90_value is not None else None
-                    }
-                    lgbm_confidence_band.append(band_entry)
+
+                if precomputed_lgbm is not None:
+                    feature_warning, lgbm_curves = precomputed_lgbm
+                else:
+                    lgbm_input, feature_warning = _build_lgbm_inputs(sheep, age_series, future_dates)
+                    lgbm_curves = _predict_lgbm_curves(lgbm_input) if lgbm_input is not None else None
+
+                if feature_warning:
+                    for warning_msg in feature_warning.split('；'):
+                        warning_msg = warning_msg.strip()
+                        if warning_msg and warning_msg not in metrics['warning_messages']:
+                            metrics['warning_messages'].append(warning_msg)
+
+                if lgbm_curves is not None:
+                    pred_values, q10_values, q90_values = lgbm_curves
+
+                    lgbm_daily_forecasts = []
+                    for idx, offset in enumerate(day_offsets):
+                        day_age = age_series[idx]
+                        day_date = future_dates[idx]
+                        date_text = day_date.strftime('%Y-%m-%d') if day_date else None
+                        lgbm_daily_forecasts.append({
+                            'day_offset': int(offset),
+                            'age_days': int(day_age),
+                            'date': date_text,
+                            'predicted_weight': max(float(pred_values[idx]), 0.0)
+                        })
+                        lgbm_confidence_band.append({
+                            'day_offset': int(offset),
+                            'age_days': int(day_age),
+                            'date': date_text,
+                            'lower': max(float(q10_values[idx]), 0.0) if q10_values is not None else None,
+                            'upper': max(float(q90_values[idx]), 0.0) if q90_values is not None else None
+                        })
 
                 if lgbm_daily_forecasts is not None:
                     final_lgbm_weight = lgbm_daily_forecasts[-1]['predicted_weight']
@@ -645,6 +780,39 @@ def _compute_prediction_metrics(sheep, weight_data, target_days, birth_date):
     metrics.pop('warning_messages', None)
     return metrics, None
 
+def _forecast_fingerprint(sheep, weight_data):
+    """以體重歷史、羊隻特徵欄位、模型版本與當日日期組成預測快取指紋。"""
+    payload = {
+        'history': [(record.get('record_date'), record.get('value')) for record in weight_data],
+        'sheep': [getattr(sheep, field, None) for field in FORECAST_SHEEP_FIELDS],
+        'model_version': _current_model_version(),
+        'today': date.today().isoformat(),
+    }
+    serialized = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def _get_prediction_metrics(sheep, weight_data, target_days, birth_date):
+    """預測與圖表端點共用的快取版 _compute_prediction_metrics。"""
+    fingerprint = None
+    try:
+        fingerprint = _forecast_fingerprint(sheep, weight_data)
+        cached = get_prediction_cache(sheep.id, target_days, fingerprint)
+    except Exception as exc:  # pragma: no cover - 快取失效不應阻斷預測
+        current_app.logger.warning(f"讀取預測快取失敗: {exc}")
+        cached = None
+    if cached is not None:
+        return cached, None
+
+    metrics, error_message = _compute_prediction_metrics(sheep, weight_data, target_days, birth_date)
+    if metrics is not None and fingerprint is not None:
+        try:
+            set_prediction_cache(sheep.id, target_days, fingerprint, metrics)
+        except Exception as exc:  # pragma: no cover - 快取失效不應阻斷預測
+            current_app.logger.warning(f"寫入預測快取失敗: {exc}")
+    return metrics, error_message
+
+
 def data_quality_check(weight_records):
     """
     數據品質檢驗函式
@@ -750,6 +918,52 @@ def get_breed_reference_ranges(breed, age_months):
         'max': round(base_range['max'] * multiplier, 3)
     }
 
+def _describe_prediction_model(prediction_source, pred_interval):
+    """回傳提示詞與備用分析使用的模型名稱與信賴區間文字。"""
+    model_label = 'LightGBM 模型' if prediction_source == 'lightgbm' else '線性回歸模型'
+    if pred_interval['q10'] is not None and pred_interval['q90'] is not None:
+        interval_text = f"{pred_interval['q10']:.2f} - {pred_interval['q90']:.2f} 公斤"
+    else:
+        interval_text = '暫無可用資料'
+    return model_label, interval_text
+
+
+def _build_growth_analysis_prompt(sheep, target_days, current_age_months, data_quality_report,
+                                  model_label, predicted_weight, average_daily_gain, interval_text, breed_ranges):
+    """組裝第二階段 AI 生長分析的提示詞。"""
+    return f"""# 角色扮演指令
+你是一位資深的智慧牧場營養學專家「領頭羊博士」，兼具ESG永續經營的顧問視角。請用繁體中文，以專業、溫暖且數據驅動的語氣進行分析，並將各部分回覆控制在2-3句話內。
+
+# 羊隻資料
+- 耳號: {sheep.EarNum}
+- 品種: {sheep.Breed or '未指定'}
+- 性別: {sheep.Sex or '未指定'}
+- 目前月齡: {current_age_months or '未知'} 個月
+
+# 數據品質評估 (由我方系統提供)
+- 數據品質狀況: {data_quality_report['status']}
+- 評估說明: {data_quality_report['message']}
+
+# 統計分析結果 (由我方系統提供)
+- 預測目標: {target_days} 天後的體重
+- 預測模型: {model_label}
+- 預測體重: {predicted_weight:.2f} 公斤
+- 模型平均日增重: {average_daily_gain:.3f} 公斤/天
+- 預測信賴區間 (q10-q90): {interval_text}
+
+# 領域知識錨點 (由我方系統提供)
+- 參考指標: 根據文獻，{sheep.Breed or '一般山羊'}品種的山羊在此月齡，健康的日增重範圍約為 {breed_ranges['min']} 到 {breed_ranges['max']} 公斤/天。
+
+# 你的任務
+請基於以上所有資訊，特別是「數據品質評估」和「領域知識錨點」，生成一份包含以下三部分的分析報告：
+
+1. **生長潛力解讀**: 結合數據品質，解讀預測體重。將「模型平均日增重」與「參考指標」進行比較，判斷其增長趨勢（例如：優於預期、符合標準、略顯緩慢、因數據品質有限建議謹慎看待）。
+2. **飼養管理與ESG建議**: 根據生長情況，提供1-2項具體建議。**請務必在建議中融入ESG理念**，例如如何透過精準飼餵減少浪費（環境E），或如何調整管理方式提升動物福利（社會S）。
+3. **透明度與提醒**: 根據數據品質，提供一個客製化的提醒。如果品質好，則肯定數據記錄的價值；如果品質差，則鼓勵用戶更頻繁、準確地記錄數據以獲得更可靠的分析。
+
+請用 Markdown 格式回覆，並確保內容專業且易懂。"""
+
+
 @bp.route('/goats/<string:ear_tag>/prediction', methods=['GET'])
 @login_required
 def get_sheep_prediction(ear_tag):
@@ -795,7 +1009,7 @@ def get_sheep_prediction(ear_tag):
             ), 400
         
         # 準備預測數據
-        prediction_metrics, error_message = _compute_prediction_metrics(sheep, weight_data, target_days, birth_date)
+        prediction_metrics, error_message = _get_prediction_metrics(sheep, weight_data, target_days, birth_date)
         if error_message:
             return jsonify(error=error_message), 400
 
@@ -811,44 +1025,13 @@ def get_sheep_prediction(ear_tag):
         # 獲取品種參考範圍
         breed_ranges = get_breed_reference_ranges(sheep.Breed, current_age_months)
 
-        model_label = 'LightGBM 模型' if prediction_source == 'lightgbm' else '線性回歸模型'
-        if pred_interval['q10'] is not None and pred_interval['q90'] is not None:
-            interval_text = f"{pred_interval['q10']:.2f} - {pred_interval['q90']:.2f} 公斤"
-        else:
-            interval_text = '暫無可用資料'
-        
-        # 準備 LLM 提示詞
-        prompt = f"""# 角色扮演指令
-你是一位資深的智慧牧場營養學專家「領頭羊博士」，兼具ESG永續經營的顧問視角。請用繁體中文，以專業、溫暖且數據驅動的語氣進行分析，並將各部分回覆控制在2-3句話內。
-
-# 羊隻資料
-- 耳號: {sheep.EarNum}
-- 品種: {sheep.Breed or '未指定'}
-- 性別: {sheep.Sex or '未指定'}
-- 目前月齡: {current_age_months or '未知'} 個月
-
-# 數據品質評估 (由我方系統提供)
-- 數據品質狀況: {data_quality_report['status']}
-- 評估說明: {data_quality_report['message']}
-
-# 統計分析結果 (由我方系統提供)
-- 預測目標: {target_days} 天後的體重
-- 預測模型: {model_label}
-- 預測體重: {predicted_weight:.2f} 公斤
-- 模型平均日增重: {average_daily_gain:.3f} 公斤/天
-- 預測信賴區間 (q10-q90): {interval_text}
-
-# 領域知識錨點 (由我方系統提供)
-- 參考指標: 根據文獻，{sheep.Breed or '一般山羊'}品種的山羊在此月齡，健康的日增重範圍約為 {breed_ranges['min']} 到 {breed_ranges['max']} 公斤/天。
-
-# 你的任務
-請基於以上所有資訊，特別是「數據品質評估」和「領域知識錨點」，生成一份包含以下三部分的分析報告：
-
-1. **生長潛力解讀**: 結合數據品質，解讀預測體重。將「模型平均日增重」與「參考指標」進行比較，判斷其增長趨勢（例如：優於預期、符合標準、略顯緩慢、因數據品質有限建議謹慎看待）。
-2. **飼養管理與ESG建議**: 根據生長情況，提供1-2項具體建議。**請務必在建議中融入ESG理念**，例如如何透過精準飼餵減少浪費（環境E），或如何調整管理方式提升動物福利（社會S）。
-3. **透明度與提醒**: 根據數據品質，提供一個客製化的提醒。如果品質好，則肯定數據記錄的價值；如果品質差，則鼓勵用戶更頻繁、準確地記錄數據以獲得更可靠的分析。
+        model_label, interval_text = _describe_prediction_model(prediction_source, pred_interval)
 
-請用 Markdown 格式回覆，並確保內容專業且易懂。"""
+        # 準備 LLM 提示詞
+        prompt = _build_growth_analysis_prompt(
+            sheep, target_days, current_age_months, data_quality_report,
+            model_label, predicted_weight, average_daily_gain, interval_text, breed_ranges
+        )
 
         # 調用 Gemini API
         try:
@@ -948,7 +1131,7 @@ def get_prediction_chart_data(ear_tag):
 
         # 準備圖表數據
         weight_data = [record.to_dict() for record in weight_records]
-        prediction_metrics, error_message = _compute_prediction_metrics(sheep, weight_data, target_days, birth_date)
+        prediction_metrics, error_message = _get_prediction_metrics(sheep, weight_data, target_days, birth_date)
         if error_message:
             return jsonify(error=error_message), 400
 
@@ -1018,3 +1201,287 @@ def get_prediction_chart_data(ear_tag):
     except Exception as e:
         current_app.logger.error(f"圖表數據API錯誤: {e}", exc_info=True)
         return jsonify(error=f"系統錯誤: {str(e)}"), 500
+
+
+BATCH_SYNC_MAX_SHEEP = 200
+BATCH_MAX_SHEEP = 5000
+
+
+def _batch_sheep_query(user_id, ear_tags=None, breeds=None, statuses=None, eligible_only=True):
+    """依耳號清單或品種／狀態建立批次預測的羊隻查詢。"""
+    query = Sheep.query.filter(Sheep.user_id == user_id)
+    if ear_tags:
+        query = query.filter(Sheep.EarNum.in_(ear_tags))
+    if breeds:
+        query = query.filter(Sheep.Breed.in_(breeds))
+    if statuses:
+        query = query.filter(Sheep.status.in_(statuses))
+    if eligible_only:
+        # BirthDate 以 YYYY-MM-DD 字串儲存，字典序即日期序
+        today = date.today()
+        query = query.filter(
+            Sheep.BirthDate >= (today - timedelta(days=MAX_ELIGIBLE_AGE_DAYS)).strftime('%Y-%m-%d'),
+            Sheep.BirthDate <= (today - timedelta(days=MIN_ELIGIBLE_AGE_DAYS)).strftime('%Y-%m-%d'),
+        )
+    return query
+
+
+def _select_batch_sheep(user_id, ear_tags=None, breeds=None, statuses=None, eligible_only=True):
+    """取得批次預測的羊隻，數量上限為 BATCH_MAX_SHEEP。"""
+    query = _batch_sheep_query(user_id, ear_tags, breeds, statuses, eligible_only)
+    return query.order_by(Sheep.EarNum.asc()).limit(BATCH_MAX_SHEEP).all()
+
+
+def _load_weight_histories(user_id, sheep_ids):
+    """以單一查詢載入多隻羊的體重歷史，依 sheep_id 分組。"""
+    histories = {sheep_id: [] for sheep_id in sheep_ids}
+    if not sheep_ids:
+        return histories
+    records = SheepHistoricalData.query.filter(
+        SheepHistoricalData.user_id == user_id,
+        SheepHistoricalData.sheep_id.in_(sheep_ids),
+        SheepHistoricalData.record_type == 'Body_Weight_kg'
+    ).order_by(SheepHistoricalData.sheep_id.asc(), SheepHistoricalData.record_date.asc()).all()
+    for record in records:
+        histories.setdefault(record.sheep_id, []).append(record.to_dict())
+    return histories
+
+
+def _predict_stacked_lgbm(candidates, target_days):
+    """將多隻羊的特徵矩陣堆疊後一次推論，回傳 {sheep_id: (feature_warning, curves)}。"""
+    if not candidates or not _ensure_lgbm_models() or _lgbm_models.get('main') is None:
+        return {}
+
+    frames = []
+    spans = []
+    for sheep, current_days in candidates:
+        _, age_series, future_dates = _forecast_axis(current_days, target_days)
+        frame, feature_warning = _build_lgbm_inputs(sheep, age_series, future_dates)
+        if frame is None:
+            continue
+        frames.append(frame)
+        spans.append((sheep.id, feature_warning, len(frame)))
+
+    if not frames:
+        return {}
+
+    if len(frames) == 1:
+        stacked = frames[0]
+    elif isinstance(frames[0], np.ndarray):
+        stacked = np.vstack(frames)
+    else:
+        stacked = pd.concat(frames, ignore_index=True)
+    pred_values, q10_values, q90_values = _predict_lgbm_curves(stacked)
+
+    results = {}
+    cursor = 0
+    for sheep_id, feature_warning, row_count in spans:
+        window = slice(cursor, cursor + row_count)
+        results[sheep_id] = (feature_warning, (
+            pred_values[window],
+            q10_values[window] if q10_values is not None else None,
+            q90_values[window] if q90_values is not None else None,
+        ))
+        cursor += row_count
+    return results
+
+
+def _batch_ai_prompt(sheep, target_days, data_quality_report, metrics):
+    """組合批次結果中單隻羊的 AI 生長分析提示詞。"""
+    current_age_months = calculate_age_in_months(sheep.BirthDate)
+    breed_ranges = get_breed_reference_ranges(sheep.Breed, current_age_months)
+    model_label, interval_text = _describe_prediction_model(metrics['prediction_source'], metrics['pred_interval'])
+    return _build_growth_analysis_prompt(
+        sheep, target_days, current_age_months, data_quality_report,
+        model_label, metrics['predicted_weight'], metrics['average_daily_gain'], interval_text, breed_ranges
+    )
+
+
+def _batch_ai_analysis(prompts, api_key):
+    """並行產生批次 AI 生長分析；回傳與 ``prompts`` 對應的 ``(分析文字, 錯誤訊息)`` 清單。"""
+    ai_results = call_gemini_api_many(prompts, api_key, generation_config_override={"temperature": 0.6})
+    return [
+        (None, ai_result['error']) if 'error' in ai_result else (ai_result.get('text', ''), None)
+        for ai_result in ai_results
+    ]
+
+
+def compute_batch_predictions(user_id, ear_tags=None, breeds=None, statuses=None, target_days=30,
+                              eligible_only=True, include_daily_forecasts=False,
+                              include_ai_analysis=False, api_key=None):
+    """批次計算多隻羊的生長預測。
+
+    體重歷史以一次分組查詢載入，LightGBM 則對堆疊後的特徵矩陣各呼叫一次
+    predict；AI 分析為選用，需同時提供 ``api_key``，各羊的提示詞會並行送出。
+    """
+    sheep_list = _select_batch_sheep(user_id, ear_tags, breeds, statuses, eligible_only)
+    histories = _load_weight_histories(user_id, [sheep.id for sheep in sheep_list])
+
+    prepared = []
+    results = []
+    for sheep in sheep_list:
+        birth_date, current_days, applicability_error = _validate_prediction_applicability(sheep, target_days)
+        if applicability_error:
+            results.append({'ear_tag': sheep.EarNum, 'success': False, 'error': applicability_error})
+            continue
+        weight_data = histories.get(sheep.id, [])
+        data_quality_report = data_quality_check(weight_data)
+        if data_quality_report['status'] == 'Error':
+            results.append({
+                'ear_tag': sheep.EarNum,
+                'success': False,
+                'error': "數據不足以進行預測",
+                'data_quality_report': data_quality_report
+            })
+            continue
+        prepared.append((sheep, birth_date, current_days, weight_data, data_quality_report))
+
+    lgbm_candidates = [
+        (sheep, current_days)
+        for sheep, _, current_days, _, _ in prepared
+        if not (AGE_DAYS_OOD_THRESHOLD and current_days + target_days > AGE_DAYS_OOD_THRESHOLD)
+    ]
+    try:
+        stacked_predictions = _predict_stacked_lgbm(lgbm_candidates, target_days)
+    except Exception as exc:  # pragma: no cover - 需實際模型才會觸發
+        current_app.logger.warning(f"批次 LightGBM 推論失敗，改為逐隻計算: {exc}")
+        stacked_predictions = {}
+
+    ai_pending = []
+    for sheep, birth_date, current_days, weight_data, data_quality_report in prepared:
+        metrics, error_message = _compute_prediction_metrics(
+            sheep, weight_data, target_days, birth_date,
+            precomputed_lgbm=stacked_predictions.get(sheep.id)
+        )
+        if error_message:
+            results.append({'ear_tag': sheep.EarNum, 'success': False, 'error': error_message})
+            continue
+
+        pred_interval = metrics['pred_interval']
+        entry = {
+            'ear_tag': sheep.EarNum,
+            'success': True,
+            'breed': sheep.Breed,
+            'current_age_days': current_days,
+            'predicted_weight': round(metrics['predicted_weight'], 2),
+            'average_daily_gain': round(metrics['average_daily_gain'], 3),
+            'pred_interval': {
+                'q10': round(pred_interval['q10'], 2) if pred_interval['q10'] is not None else None,
+                'q90': round(pred_interval['q90'], 2) if pred_interval['q90'] is not None else None
+            },
+            'prediction_source': metrics['prediction_source'],
+            'prediction_warning': metrics['prediction_warning'],
+            'data_quality_report': data_quality_report,
+            'historical_data_count': len(weight_data)
+        }
+        if include_daily_forecasts:
+            entry['daily_forecasts'] = metrics.get('daily_forecasts')
+            entry['daily_confidence_band'] = metrics.get('daily_confidence_band')
+        if include_ai_analysis and api_key:
+            ai_pending.append((entry, _batch_ai_prompt(sheep, target_days, data_quality_report, metrics)))
+        results.append(entry)
+
+    if ai_pending:
+        analyses = _batch_ai_analysis([prompt for _, prompt in ai_pending], api_key)
+        for (entry, _), (analysis, error) in zip(ai_pending, analyses):
+            entry['ai_analysis'], entry['ai_error'] = analysis, error
+
+    succeeded = sum(1 for entry in results if entry['success'])
+    return {
+        'target_days': target_days,
+        'requested': len(sheep_list),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'truncated': len(sheep_list) >= BATCH_MAX_SHEEP,
+        'results': results
+    }
+
+
+@bp.route('/batch', methods=['POST'])
+@login_required
+def create_batch_prediction():
+    """批次生長預測：少量羊隻同步回傳，數量較多或指定 async 時排入背景任務。"""
+    from app.tasks import enqueue_batch_growth_prediction  # 避免循環匯入
+
+    try:
+        request_model = BatchPredictionRequestModel(**(request.get_json(silent=True) or {}))
+    except ValidationError as exc:
+        return jsonify(create_error_response('請求資料驗證失敗', exc.errors())), 400
+
+    # 背景任務的參數會存入 Redis，金鑰不放入其中
+    options = request_model.model_dump(exclude={'run_async'})
+
+    run_async = request_model.run_async
+    if not run_async:
+        selected = _batch_sheep_query(
+            current_user.id, request_model.ear_tags, request_model.breeds,
+            request_model.statuses, request_model.eligible_only
+        ).count()
+        run_async = selected > BATCH_SYNC_MAX_SHEEP
+
+    if run_async:
+        # 背景任務一律使用伺服器設定的 GOOGLE_API_KEY，不使用請求頭的金鑰
+        if request_model.include_ai_analysis and not current_app.config.get('GOOGLE_API_KEY'):
+            return jsonify(error="伺服器未設定 GOOGLE_API_KEY，背景批次預測無法產生 AI 分析"), 503
+        job = enqueue_batch_growth_prediction(current_user.id, options)
+        return jsonify({'job_id': job.id, 'status': 'queued'}), 202
+
+    api_key = request.headers.get('X-Api-Key')
+    if request_model.include_ai_analysis and not api_key:
+        return jsonify(error="未提供API金鑰於請求頭中 (X-Api-Key)"), 401
+
+    try:
+        return jsonify(compute_batch_predictions(
+            current_user.id, **options,
+            api_key=api_key if request_model.include_ai_analysis else None
+        ))
+    except Exception as e:
+        current_app.logger.error(f"批次預測API錯誤: {e}", exc_info=True)
+        return jsonify(error=f"系統錯誤: {str(e)}"), 500
+
+
+@bp.route('/batch/<string:job_id>', methods=['GET'])
+@login_required
+def get_batch_prediction(job_id):
+    """查詢背景批次預測結果。"""
+    from app.tasks import get_task_queue  # 避免循環匯入
+
+    stored = get_prediction_batch_result(job_id)
+    if stored is not None:
+        if stored.get('user_id') != current_user.id:
+            return jsonify(error="找不到指定的批次預測任務"), 404
+        return jsonify({'job_id': job_id, 'status': 'finished', 'result': stored.get('result')})
+
+    job = get_task_queue().fetch_job(job_id)
+    if job is None or not job.args or job.args[0] != current_user.id:
+        return jsonify(error="找不到指定的批次預測任務"), 404
+    if job.status == 'failed':
+        return jsonify({'job_id': job_id, 'status': 'failed', 'error': '批次預測任務執行失敗'}), 500
+    return jsonify({'job_id': job_id, 'status': job.status}), 202
+
+
+@bp.route('/models', methods=['GET'])
+@login_required
+def get_model_status():
+    """查詢 LightGBM 模型載入狀態與版本。"""
+    _ensure_lgbm_models()
+    return jsonify(model_registry.status())
+
+
+@bp.route('/models/reload', methods=['POST'])
+@login_required
+def reload_models():
+    """重新載入模型檔案（僅限管理員），成功後通知其他 worker 於下次檢查時跟進。"""
+    admin_token = current_app.config.get('MODEL_ADMIN_TOKEN')
+    provided = request.headers.get('X-Admin-Token') or ''
+    if not admin_token or not hmac.compare_digest(provided.encode('utf-8'), admin_token.encode('utf-8')):
+        return jsonify(error="僅限管理員重新載入模型"), 403
+
+    reloaded = model_registry.publish_reload(current_app.extensions['redis_client'])
+    ready = _ensure_lgbm_models()
+    status = model_registry.status()
+    if not reloaded or not ready:
+        # 重新載入失敗時仍沿用先前的模型，但須回報錯誤
+        status['error'] = f"模型重新載入失敗: {status['error']}"
+        return jsonify(status), 503
+    return jsonify(status)
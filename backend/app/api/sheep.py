@@ -5,7 +5,8 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from pydantic import ValidationError
 
-from app.cache import clear_dashboard_cache
+from app.cache import clear_bi_cache, clear_prediction_cache, clear_sheep_context_cache
+from app.services.dashboard_aggregates import refresh_dashboard_sheep
 from app.models import db, Sheep, SheepEvent, SheepHistoricalData
 from app.schemas import (
     SheepCreateModel, SheepUpdateModel, SheepEventCreateModel,
@@ -89,7 +90,9 @@ def add_sheep():
         new_sheep = Sheep(user_id=current_user.id, **sheep_dict)
         db.session.add(new_sheep)
         db.session.commit()
-        clear_dashboard_cache(current_user.id)
+        refresh_dashboard_sheep(current_user.id, new_sheep.id)
+        clear_sheep_context_cache(current_user.id, new_sheep.EarNum)
+        clear_bi_cache(current_user.id)  # 分群分析包含羊隻欄位
         return jsonify(
             success=True, 
             message="羊隻資料新增成功", 
@@ -136,6 +139,7 @@ def update_sheep(ear_num):
     try:
         # 只處理在 Pydantic 模型中定義且有值的欄位
         update_dict = update_data.model_dump(exclude_unset=True)
+        old_ear_num = sheep.EarNum  # 耳號變更時新舊耳號的背景快照都要失效
         
         for key, value in update_dict.items():
             # 確保欄位存在於資料庫模型中
@@ -165,7 +169,10 @@ def update_sheep(ear_num):
         
         sheep.last_updated = datetime.utcnow()
         db.session.commit()
-        clear_dashboard_cache(current_user.id)
+        refresh_dashboard_sheep(current_user.id, sheep.id)
+        clear_prediction_cache(sheep.id)
+        clear_sheep_context_cache(current_user.id, old_ear_num, sheep.EarNum)
+        clear_bi_cache(current_user.id)  # 分群分析包含羊隻欄位
         return jsonify(
             success=True, 
             message="羊隻資料更新成功，並已自動記錄歷史數據。", 
@@ -184,9 +191,13 @@ def delete_sheep(ear_num):
     if not sheep:
         return jsonify(error="找不到該耳號的羊隻或您沒有權限"), 404
     try:
+        sheep_id = sheep.id
         db.session.delete(sheep)
         db.session.commit()
-        clear_dashboard_cache(current_user.id)
+        refresh_dashboard_sheep(current_user.id, sheep_id)
+        clear_prediction_cache(sheep_id)
+        clear_sheep_context_cache(current_user.id, ear_num)
+        clear_bi_cache(current_user.id)  # 分群分析包含羊隻欄位
         return jsonify(success=True, message="羊隻資料刪除成功")
     except Exception as e:
         db.session.rollback()
@@ -225,7 +236,8 @@ def add_sheep_event(ear_num):
         db.session.flush()
         _log_significant_event('create', new_event, ear_num=sheep.EarNum)
         db.session.commit()
-        clear_dashboard_cache(current_user.id)
+        refresh_dashboard_sheep(current_user.id, sheep.id)
+        clear_sheep_context_cache(current_user.id, sheep.EarNum)
         return jsonify(success=True, message="羊隻事件新增成功", event=new_event.to_dict()), 201
     except Exception as e:
         db.session.rollback()
@@ -278,7 +290,8 @@ def update_event(event_id):
                 metadata={'changed_fields': changed_fields},
             )
         db.session.commit()
-        clear_dashboard_cache(current_user.id)
+        refresh_dashboard_sheep(current_user.id, event.sheep_id)
+        clear_sheep_context_cache(current_user.id, event.sheep.EarNum)
         return jsonify(success=True, message="事件更新成功", event=event.to_dict())
     except Exception as e:
         db.session.rollback()
@@ -293,10 +306,12 @@ def delete_event(event_id):
         return jsonify(error="權限不足"), 403
 
     try:
+        sheep_id, ear_num = event.sheep_id, event.sheep.EarNum
         _log_significant_event('delete', event)
         db.session.delete(event)
         db.session.commit()
-        clear_dashboard_cache(current_user.id)
+        refresh_dashboard_sheep(current_user.id, sheep_id)
+        clear_sheep_context_cache(current_user.id, ear_num)
         return jsonify(success=True, message="事件刪除成功")
     except Exception as e:
         db.session.rollback()
@@ -320,9 +335,14 @@ def delete_sheep_history(record_id):
     if record.user_id != current_user.id:
         return jsonify(error="您沒有權限刪除此記錄"), 403
     try:
+        sheep_id = record.sheep_id
+        sheep = Sheep.query.get(sheep_id)
         db.session.delete(record)
         db.session.commit()
-        clear_dashboard_cache(current_user.id)
+        refresh_dashboard_sheep(current_user.id, sheep_id)
+        clear_prediction_cache(sheep_id)
+        if sheep:
+            clear_sheep_context_cache(current_user.id, sheep.EarNum)
         return jsonify(success=True, message="歷史數據刪除成功")
     except Exception as e:
         db.session.rollback()
@@ -1,19 +1,48 @@
 import hashlib
 import json
-from typing import Any, Optional
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, TypeVar
 
 from flask import current_app
 
-# 可調整 TTL（秒）
+# 可調整 TTL（秒）：超過軟性 TTL 仍回傳舊資料並排入背景刷新，超過硬性 TTL 才需同步重算
 CACHE_TTL_SECONDS = 90
-BI_CACHE_TTL_SECONDS = 180
+CACHE_HARD_TTL_SECONDS = 15 * 60
+# BI 快取鍵值帶資料世代，資料寫入即失效，因此 TTL 可以放長
+BI_CACHE_TTL_SECONDS = 6 * 60 * 60
+BI_CACHE_HARD_TTL_SECONDS = 24 * 60 * 60
 BI_RATE_LIMIT = 30
 BI_RATE_WINDOW_SECONDS = 60
 
 _CACHE_KEY = "dashboard-cache:{user_id}"
+_FARM_REPORT_CACHE_KEY = "farm-report-cache:{user_id}"
 _LOCK_KEY = "dashboard-lock:{user_id}"
-_BI_CACHE_KEY = "bi-cache:{user_id}:{fingerprint}"
+_DASHBOARD_STATE_KEY = "dashboard-state:{user_id}"
+_DASHBOARD_STATE_META_FIELD = "_meta"
+_DASHBOARD_STATE_GENERATION_KEY = "dashboard-state-gen:{user_id}"
+DASHBOARD_STATE_TTL_SECONDS = 24 * 60 * 60
+_BI_CACHE_KEY = "bi-cache:{user_id}:{generation}:{fingerprint}"
+_BI_GENERATION_KEY = "bi-gen:{user_id}"
 _BI_RATE_KEY = "bi-rate:{user_id}:{endpoint}"
+_SINGLE_FLIGHT_LOCK_KEY = "single-flight-lock:{name}"
+_SINGLE_FLIGHT_DONE_KEY = "single-flight-done:{name}"
+SINGLE_FLIGHT_WAIT_SECONDS = 10
+SINGLE_FLIGHT_NOTIFY_TTL_SECONDS = 5
+_CACHE_REFRESH_KEY = "cache-refresh:{name}"
+CACHE_REFRESH_CLAIM_TTL_SECONDS = 5 * 60
+_PREDICTION_BATCH_KEY = "prediction-batch:{job_id}"
+_PREDICTION_CACHE_KEY = "prediction-cache:{sheep_id}:{generation}:{target_days}:{fingerprint}"
+_PREDICTION_GENERATION_KEY = "prediction-gen:{sheep_id}"
+PREDICTION_BATCH_TTL_SECONDS = 24 * 60 * 60
+PREDICTION_CACHE_TTL_SECONDS = 6 * 60 * 60
+_CHAT_CONTEXT_KEY = "chat-context:{user_id}:{session_id}"
+CHAT_CONTEXT_TTL_SECONDS = 6 * 60 * 60
+_SHEEP_CONTEXT_KEY = "sheep-context:{user_id}:{user_generation}:{ear_num}:{generation}"
+_SHEEP_CONTEXT_USER_GENERATION_KEY = "sheep-context-gen:{user_id}"
+_SHEEP_CONTEXT_GENERATION_KEY = "sheep-context-gen:{user_id}:{ear_num}"
+SHEEP_CONTEXT_TTL_SECONDS = 30 * 60
+
+T = TypeVar('T')
 
 
 def _get_redis_client():
@@ -23,9 +52,218 @@ def _get_redis_client():
     return redis_client
 
 
+def _dump_entry(payload: Any, soft_ttl: int) -> str:
+    return json.dumps({'payload': payload, 'fresh_until': time.time() + soft_ttl}, default=str)
+
+
+def _load_entry(raw: Optional[str]) -> Optional[Tuple[Any, bool]]:
+    """解析快取內容，回傳 ``(資料, 是否仍在軟性 TTL 內)``；格式不符時視為未命中。"""
+    if not raw:
+        return None
+    try:
+        entry = json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(entry, dict) or 'payload' not in entry or 'fresh_until' not in entry:
+        return None
+    return entry['payload'], time.time() < entry['fresh_until']
+
+
+def _payload_of(entry: Optional[Tuple[Any, bool]]) -> Optional[Any]:
+    return entry[0] if entry is not None else None
+
+
+def request_cache_refresh(name: str, enqueue: Callable[[], Any]) -> bool:
+    """為 ``name`` 排入一次背景刷新；同一鍵值已有刷新在排隊或執行時不重複排入。"""
+    client = _get_redis_client()
+    claim_key = _CACHE_REFRESH_KEY.format(name=name)
+    if not client.set(claim_key, '1', nx=True, ex=CACHE_REFRESH_CLAIM_TTL_SECONDS):
+        return False
+    try:
+        enqueue()
+    except Exception:
+        client.delete(claim_key)
+        current_app.logger.warning('背景刷新排入失敗：%s', name, exc_info=True)
+        return False
+    return True
+
+
+def release_cache_refresh(name: str) -> None:
+    """背景刷新結束後呼叫，允許之後再次排入。"""
+    client = _get_redis_client()
+    client.delete(_CACHE_REFRESH_KEY.format(name=name))
+
+
+def _serve_cached(name: str, entry: Optional[Tuple[Any, bool]], enqueue_refresh: Callable[[], Any]) -> Optional[Any]:
+    if entry is None:
+        return None
+    payload, fresh = entry
+    if not fresh:
+        request_cache_refresh(name, enqueue_refresh)
+    return payload
+
+
+def get_dashboard_cache_entry(user_id: int) -> Optional[Tuple[Any, bool]]:
+    client = _get_redis_client()
+    return _load_entry(client.get(_CACHE_KEY.format(user_id=user_id)))
+
+
 def get_dashboard_cache(user_id: int) -> Optional[Any]:
+    return _payload_of(get_dashboard_cache_entry(user_id))
+
+
+def set_dashboard_cache(user_id: int, payload: Any, generation: Optional[str] = None) -> None:
+    """寫入儀表板快取；``generation`` 為計算前讀到的儀表板狀態世代，期間有寫入就不保留結果。"""
+    if generation is not None and get_dashboard_state_generation(user_id) != generation:
+        return
+    client = _get_redis_client()
+    key = _CACHE_KEY.format(user_id=user_id)
+    client.setex(key, CACHE_HARD_TTL_SECONDS, _dump_entry(payload, CACHE_TTL_SECONDS))
+    # 寫入者可能在比對後、寫入前已清除過快取
+    if generation is not None and get_dashboard_state_generation(user_id) != generation:
+        client.delete(key)
+
+
+def clear_dashboard_cache(user_id: int) -> None:
+    client = _get_redis_client()
+    client.delete(_CACHE_KEY.format(user_id=user_id))
+
+
+def get_farm_report_cache_entry(user_id: int) -> Optional[Tuple[Any, bool]]:
+    client = _get_redis_client()
+    return _load_entry(client.get(_FARM_REPORT_CACHE_KEY.format(user_id=user_id)))
+
+
+def set_farm_report_cache(user_id: int, payload: Any) -> None:
+    client = _get_redis_client()
+    client.setex(
+        _FARM_REPORT_CACHE_KEY.format(user_id=user_id),
+        CACHE_HARD_TTL_SECONDS,
+        _dump_entry(payload, CACHE_TTL_SECONDS),
+    )
+
+
+def clear_farm_report_cache(user_id: int) -> None:
     client = _get_redis_client()
-    raw = client.get(_CACHE_KEY.format(user_id=user_id))
+    client.delete(_FARM_REPORT_CACHE_KEY.format(user_id=user_id))
+
+
+def _lead_flight(client, lock, done_key: str, read: Callable[[], Optional[T]], compute: Callable[[], T]) -> T:
+    try:
+        client.delete(done_key)
+        # 取得鎖之前可能剛有另一位領頭者完成
+        value = read()
+        if value is None:
+            value = compute()
+        return value
+    finally:
+        try:
+            lock.release()
+        except Exception:  # pragma: no cover - 鎖已逾時由他人持有
+            pass
+        client.rpush(done_key, '1')
+        client.expire(done_key, SINGLE_FLIGHT_NOTIFY_TTL_SECONDS)
+
+
+def single_flight(
+    name: str,
+    read: Callable[[], Optional[T]],
+    compute: Callable[[], T],
+    *,
+    lock_ttl: int = CACHE_TTL_SECONDS,
+    wait_seconds: float = SINGLE_FLIGHT_WAIT_SECONDS,
+) -> T:
+    """合併同一 ``name`` 的併發重算：只有取得鎖的呼叫者執行 ``compute``，其餘等待完成通知後以 ``read`` 取值。
+
+    ``compute`` 須自行寫入快取，讓 ``read`` 之後讀得到結果。等待期間領頭者失敗會由下一位等待者接手；
+    等待逾時則自行計算。
+    """
+    value = read()
+    if value is not None:
+        return value
+
+    client = _get_redis_client()
+    lock = client.lock(_SINGLE_FLIGHT_LOCK_KEY.format(name=name), timeout=lock_ttl)
+    done_key = _SINGLE_FLIGHT_DONE_KEY.format(name=name)
+    if lock.acquire(blocking=False):
+        return _lead_flight(client, lock, done_key, read, compute)
+
+    deadline = time.monotonic() + wait_seconds
+    while time.monotonic() < deadline:
+        popped = client.blpop(done_key, timeout=1)
+        if popped:
+            # 把通知傳給下一位等待者
+            client.rpush(done_key, popped[1])
+            client.expire(done_key, SINGLE_FLIGHT_NOTIFY_TTL_SECONDS)
+        value = read()
+        if value is not None:
+            return value
+        if lock.acquire(blocking=False):
+            return _lead_flight(client, lock, done_key, read, compute)
+        if popped:
+            time.sleep(0.05)
+    return compute()
+
+
+def get_or_compute_dashboard_cache(user_id: int, compute: Callable[[], Any]) -> Any:
+    """讀取儀表板快取；過期但未逾硬性 TTL 時回傳舊資料並排入背景刷新，未命中則以 single-flight 重算。"""
+    from app.tasks import enqueue_dashboard_cache_refresh  # 避免循環匯入
+
+    name = f"dashboard:{user_id}"
+    cached = _serve_cached(name, get_dashboard_cache_entry(user_id), lambda: enqueue_dashboard_cache_refresh(user_id))
+    if cached is not None:
+        return cached
+
+    def compute_and_store():
+        generation = get_dashboard_state_generation(user_id)
+        payload = compute()
+        set_dashboard_cache(user_id, payload, generation)
+        return payload
+
+    return single_flight(name, read=lambda: get_dashboard_cache(user_id), compute=compute_and_store)
+
+
+def get_or_compute_farm_report_cache(user_id: int, compute: Callable[[], Any]) -> Any:
+    """牧場報告快取，語意同 :func:`get_or_compute_dashboard_cache`。"""
+    from app.tasks import enqueue_farm_report_cache_refresh  # 避免循環匯入
+
+    name = f"farm-report:{user_id}"
+    cached = _serve_cached(
+        name, get_farm_report_cache_entry(user_id), lambda: enqueue_farm_report_cache_refresh(user_id)
+    )
+    if cached is not None:
+        return cached
+
+    def compute_and_store():
+        payload = compute()
+        set_farm_report_cache(user_id, payload)
+        return payload
+
+    return single_flight(
+        name,
+        read=lambda: _payload_of(get_farm_report_cache_entry(user_id)),
+        compute=compute_and_store,
+    )
+
+
+def get_dashboard_state(user_id: int) -> Optional[Tuple[Dict[str, Any], Dict[int, Any]]]:
+    """讀取儀表板逐羊彙總狀態，回傳 ``(中繼資料, {羊隻 id: 條目})``；尚未建立時回傳 None。"""
+    client = _get_redis_client()
+    raw = client.hgetall(_DASHBOARD_STATE_KEY.format(user_id=user_id))
+    meta_raw = raw.pop(_DASHBOARD_STATE_META_FIELD, None)
+    if not meta_raw:
+        return None
+    try:
+        meta = json.loads(meta_raw)
+        entries = {int(sheep_id): json.loads(entry) for sheep_id, entry in raw.items()}
+    except (TypeError, ValueError):
+        return None
+    return meta, entries
+
+
+def get_dashboard_state_meta(user_id: int) -> Optional[Dict[str, Any]]:
+    client = _get_redis_client()
+    raw = client.hget(_DASHBOARD_STATE_KEY.format(user_id=user_id), _DASHBOARD_STATE_META_FIELD)
     if not raw:
         return None
     try:
@@ -34,18 +272,52 @@ def get_dashboard_cache(user_id: int) -> Optional[Any]:
         return None
 
 
-def set_dashboard_cache(user_id: int, payload: Any) -> None:
+def set_dashboard_state(user_id: int, meta: Dict[str, Any], entries: Dict[int, Any]) -> None:
+    """整份重建儀表板狀態；中繼資料最後寫入，讀取端看到它時條目已齊全。"""
     client = _get_redis_client()
-    client.setex(
-        _CACHE_KEY.format(user_id=user_id),
-        CACHE_TTL_SECONDS,
-        json.dumps(payload),
-    )
+    key = _DASHBOARD_STATE_KEY.format(user_id=user_id)
+    client.delete(key)
+    if entries:
+        client.hset(key, mapping={
+            str(sheep_id): json.dumps(entry, ensure_ascii=False, default=str)
+            for sheep_id, entry in entries.items()
+        })
+    client.hset(key, _DASHBOARD_STATE_META_FIELD, json.dumps(meta))
+    client.expire(key, DASHBOARD_STATE_TTL_SECONDS)
 
 
-def clear_dashboard_cache(user_id: int) -> None:
+def update_dashboard_state(user_id: int, entries: Dict[int, Optional[Any]]) -> None:
+    """只覆寫指定羊隻的條目；值為 None 代表該羊隻已刪除。"""
     client = _get_redis_client()
-    client.delete(_CACHE_KEY.format(user_id=user_id))
+    key = _DASHBOARD_STATE_KEY.format(user_id=user_id)
+    updated = {
+        str(sheep_id): json.dumps(entry, ensure_ascii=False, default=str)
+        for sheep_id, entry in entries.items()
+        if entry is not None
+    }
+    removed = [str(sheep_id) for sheep_id, entry in entries.items() if entry is None]
+    if updated:
+        client.hset(key, mapping=updated)
+    if removed:
+        client.hdel(key, *removed)
+
+
+def get_dashboard_state_generation(user_id: int) -> str:
+    """儀表板狀態的寫入世代；整份重建前後比對，期間有寫入就不發布重建結果。"""
+    client = _get_redis_client()
+    return str(client.get(_DASHBOARD_STATE_GENERATION_KEY.format(user_id=user_id)) or 0)
+
+
+def bump_dashboard_state_generation(user_id: int) -> None:
+    """羊隻資料寫入後遞增世代，讓進行中的整份重建放棄發布。"""
+    client = _get_redis_client()
+    client.incr(_DASHBOARD_STATE_GENERATION_KEY.format(user_id=user_id))
+
+
+def clear_dashboard_state(user_id: int) -> None:
+    client = _get_redis_client()
+    bump_dashboard_state_generation(user_id)
+    client.delete(_DASHBOARD_STATE_KEY.format(user_id=user_id))
 
 
 def get_user_lock(user_id: int):
@@ -62,10 +334,95 @@ def _fingerprint_payload(payload: Any) -> str:
     return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
 
 
+def get_bi_cache_generation(user_id: int) -> str:
+    """目前的 BI 資料世代；財務或羊隻資料寫入後遞增，舊世代的快取即不再命中。"""
+    client = _get_redis_client()
+    return str(client.get(_BI_GENERATION_KEY.format(user_id=user_id)) or 0)
+
+
+def bi_cache_name(user_id: int, payload: Any, generation: str) -> str:
+    return f"bi:{user_id}:{generation}:{_fingerprint_payload(payload)}"
+
+
+def _bi_cache_key(user_id: int, payload: Any, generation: str) -> str:
+    return _BI_CACHE_KEY.format(user_id=user_id, generation=generation, fingerprint=_fingerprint_payload(payload))
+
+
+def get_bi_cache_entry(user_id: int, payload: Any, generation: Optional[str] = None) -> Optional[Tuple[Any, bool]]:
+    client = _get_redis_client()
+    if generation is None:
+        generation = get_bi_cache_generation(user_id)
+    return _load_entry(client.get(_bi_cache_key(user_id, payload, generation)))
+
+
 def get_bi_cache(user_id: int, payload: Any) -> Optional[Any]:
+    """讀取 BI 快取；超過軟性 TTL 時仍回傳舊資料，並排入背景刷新。"""
+    from app.tasks import enqueue_bi_cache_refresh  # 避免循環匯入
+
+    generation = get_bi_cache_generation(user_id)
+    return _serve_cached(
+        bi_cache_name(user_id, payload, generation),
+        get_bi_cache_entry(user_id, payload, generation),
+        lambda: enqueue_bi_cache_refresh(user_id, payload, generation),
+    )
+
+
+def set_bi_cache(user_id: int, payload: Any, response: Any, generation: Optional[str] = None) -> None:
+    """寫入 BI 快取；``generation`` 應為開始計算前讀到的世代，避免把寫入前的結果存進新世代。"""
+    client = _get_redis_client()
+    if generation is None:
+        generation = get_bi_cache_generation(user_id)
+    client.setex(
+        _bi_cache_key(user_id, payload, generation),
+        BI_CACHE_HARD_TTL_SECONDS,
+        _dump_entry(response, BI_CACHE_TTL_SECONDS),
+    )
+
+
+def clear_bi_cache(*user_ids: int) -> None:
+    """遞增使用者的 BI 資料世代，使既有 BI 快取全部失效。"""
+    client = _get_redis_client()
+    for user_id in set(user_ids):
+        client.incr(_BI_GENERATION_KEY.format(user_id=user_id))
+
+
+def get_or_compute_bi_cache(user_id: int, payload: Any, compute: Callable[[], Any]) -> Any:
+    """BI 查詢快取未命中時以 single-flight 只重算一次並寫回。"""
+    generation = get_bi_cache_generation(user_id)
+
+    def compute_and_store():
+        response = compute()
+        set_bi_cache(user_id, payload, response, generation)
+        return response
+
+    return single_flight(
+        bi_cache_name(user_id, payload, generation),
+        read=lambda: _payload_of(get_bi_cache_entry(user_id, payload, generation)),
+        compute=compute_and_store,
+    )
+
+
+def check_bi_rate_limit(user_id: int, endpoint: str) -> bool:
+    client = _get_redis_client()
+    key = _BI_RATE_KEY.format(user_id=user_id, endpoint=endpoint)
+    current = client.incr(key)
+    if current == 1:
+        client.expire(key, BI_RATE_WINDOW_SECONDS)
+    return current <= BI_RATE_LIMIT
+
+
+def set_prediction_batch_result(job_id: str, user_id: int, result: Any) -> None:
     client = _get_redis_client()
-    fingerprint = _fingerprint_payload(payload)
-    raw = client.get(_BI_CACHE_KEY.format(user_id=user_id, fingerprint=fingerprint))
+    client.setex(
+        _PREDICTION_BATCH_KEY.format(job_id=job_id),
+        PREDICTION_BATCH_TTL_SECONDS,
+        json.dumps({'user_id': user_id, 'result': result}, default=str),
+    )
+
+
+def get_prediction_batch_result(job_id: str) -> Optional[Any]:
+    client = _get_redis_client()
+    raw = client.get(_PREDICTION_BATCH_KEY.format(job_id=job_id))
     if not raw:
         return None
     try:
@@ -74,20 +431,121 @@ def get_bi_cache(user_id: int, payload: Any) -> Optional[Any]:
         return None
 
 
-def set_bi_cache(user_id: int, payload: Any, response: Any) -> None:
+def _prediction_generation(client, sheep_id: int) -> str:
+    return str(client.get(_PREDICTION_GENERATION_KEY.format(sheep_id=sheep_id)) or 0)
+
+
+def get_prediction_cache(sheep_id: int, target_days: int, fingerprint: str) -> Optional[Any]:
+    client = _get_redis_client()
+    key = _PREDICTION_CACHE_KEY.format(
+        sheep_id=sheep_id,
+        generation=_prediction_generation(client, sheep_id),
+        target_days=target_days,
+        fingerprint=fingerprint,
+    )
+    raw = client.get(key)
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+
+
+def set_prediction_cache(sheep_id: int, target_days: int, fingerprint: str, metrics: Any) -> None:
+    client = _get_redis_client()
+    key = _PREDICTION_CACHE_KEY.format(
+        sheep_id=sheep_id,
+        generation=_prediction_generation(client, sheep_id),
+        target_days=target_days,
+        fingerprint=fingerprint,
+    )
+    client.setex(key, PREDICTION_CACHE_TTL_SECONDS, json.dumps(metrics, default=str))
+
+
+def clear_prediction_cache(*sheep_ids: int) -> None:
+    """遞增羊隻的預測快取世代，使既有預測結果全部失效。"""
+    client = _get_redis_client()
+    for sheep_id in set(sheep_ids):
+        client.incr(_PREDICTION_GENERATION_KEY.format(sheep_id=sheep_id))
+
+
+def get_chat_context_cache(user_id: int, session_id: str) -> Optional[Any]:
+    client = _get_redis_client()
+    raw = client.get(_CHAT_CONTEXT_KEY.format(user_id=user_id, session_id=session_id))
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+
+
+def set_chat_context_cache(user_id: int, session_id: str, payload: Any) -> None:
     client = _get_redis_client()
-    fingerprint = _fingerprint_payload(payload)
     client.setex(
-        _BI_CACHE_KEY.format(user_id=user_id, fingerprint=fingerprint),
-        BI_CACHE_TTL_SECONDS,
-        json.dumps(response, default=str),
+        _CHAT_CONTEXT_KEY.format(user_id=user_id, session_id=session_id),
+        CHAT_CONTEXT_TTL_SECONDS,
+        json.dumps(payload, ensure_ascii=False),
     )
 
 
-def check_bi_rate_limit(user_id: int, endpoint: str) -> bool:
+def clear_chat_context_cache(user_id: int, session_id: str) -> None:
     client = _get_redis_client()
-    key = _BI_RATE_KEY.format(user_id=user_id, endpoint=endpoint)
-    current = client.incr(key)
-    if current == 1:
-        client.expire(key, BI_RATE_WINDOW_SECONDS)
-    return current <= BI_RATE_LIMIT
+    client.delete(_CHAT_CONTEXT_KEY.format(user_id=user_id, session_id=session_id))
+
+
+def _sheep_context_keys(client, user_id: int, ear_nums: Iterable[str]) -> Dict[str, str]:
+    ear_nums = list(dict.fromkeys(ear_nums))
+    generations = client.mget(
+        [_SHEEP_CONTEXT_USER_GENERATION_KEY.format(user_id=user_id)]
+        + [_SHEEP_CONTEXT_GENERATION_KEY.format(user_id=user_id, ear_num=ear_num) for ear_num in ear_nums]
+    )
+    user_generation = generations[0] or 0
+    return {
+        ear_num: _SHEEP_CONTEXT_KEY.format(
+            user_id=user_id,
+            user_generation=user_generation,
+            ear_num=ear_num,
+            generation=generation or 0,
+        )
+        for ear_num, generation in zip(ear_nums, generations[1:])
+    }
+
+
+def get_sheep_context_cache(user_id: int, ear_nums: Iterable[str]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """讀取羊隻背景快照，回傳 ``(命中的快照, 各耳號的世代鍵)``。
+
+    回填時請沿用這裡取得的世代鍵，讀取資料庫期間若有寫入遞增世代，舊資料只會寫進已失效的鍵。
+    """
+    client = _get_redis_client()
+    keys = _sheep_context_keys(client, user_id, ear_nums)
+    if not keys:
+        return {}, keys
+    snapshots = {}
+    for ear_num, raw in zip(keys, client.mget(list(keys.values()))):
+        if not raw:
+            continue
+        try:
+            snapshots[ear_num] = json.loads(raw)
+        except json.JSONDecodeError:
+            continue
+    return snapshots, keys
+
+
+def set_sheep_context_cache(keys: Dict[str, str], snapshots: Dict[str, Any]) -> None:
+    client = _get_redis_client()
+    for ear_num, snapshot in snapshots.items():
+        key = keys.get(ear_num)
+        if key:
+            client.setex(key, SHEEP_CONTEXT_TTL_SECONDS, json.dumps(snapshot, ensure_ascii=False, default=str))
+
+
+def clear_sheep_context_cache(user_id: int, *ear_nums: str) -> None:
+    """遞增指定耳號的背景快照世代；未指定耳號時使該使用者的全部快照失效。"""
+    client = _get_redis_client()
+    if not ear_nums:
+        client.incr(_SHEEP_CONTEXT_USER_GENERATION_KEY.format(user_id=user_id))
+        return
+    for ear_num in set(ear_nums):
+        client.incr(_SHEEP_CONTEXT_GENERATION_KEY.format(user_id=user_id, ear_num=ear_num))
@@ -63,14 +63,24 @@ class InMemoryRedis:
         with self._mutex:
             self._purge(key)
             value = self._data.get(key)
-            if isinstance(value, list):
+            if isinstance(value, (list, dict)):
                 return None
             return value  # type: ignore[return-value]
 
-    def set(self, key: str, value: str) -> None:
+    def mget(self, keys) -> list[Optional[str]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: str, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
         with self._mutex:
+            self._purge(key)
+            if nx and key in self._data:
+                return None
             self._data[key] = value
-            self._expirations.pop(key, None)
+            if ex is not None:
+                self._expirations[key] = time.time() + ex
+            else:
+                self._expirations.pop(key, None)
+            return True
 
     def setex(self, key: str, ttl: int, value: str) -> None:
         with self._mutex:
@@ -146,3 +156,51 @@ class InMemoryRedis:
             if deadline is not None and time.time() >= deadline:
                 return None
             time.sleep(0.05)
+
+    # Hash helpers
+    def _get_hash(self, key: str) -> dict:
+        self._purge(key)
+        value = self._data.get(key)
+        if value is None:
+            value = {}
+            self._data[key] = value
+        if not isinstance(value, dict):
+            raise TypeError(f"Key {key} is not hash-backed")
+        return value
+
+    def hset(self, name: str, key: Optional[str] = None, value: Optional[str] = None, mapping: Optional[dict] = None) -> int:
+        with self._mutex:
+            hash_value = self._get_hash(name)
+            items = dict(mapping or {})
+            if key is not None:
+                items[key] = value
+            added = sum(1 for field in items if field not in hash_value)
+            hash_value.update(items)
+            return added
+
+    def hget(self, name: str, key: str) -> Optional[str]:
+        with self._mutex:
+            self._purge(name)
+            value = self._data.get(name)
+            if not isinstance(value, dict):
+                return None
+            return value.get(key)
+
+    def hgetall(self, name: str) -> dict:
+        with self._mutex:
+            self._purge(name)
+            value = self._data.get(name)
+            if not isinstance(value, dict):
+                return {}
+            return dict(value)
+
+    def hdel(self, name: str, *keys: str) -> int:
+        with self._mutex:
+            self._purge(name)
+            value = self._data.get(name)
+            if not isinstance(value, dict):
+                return 0
+            removed = sum(1 for key in keys if value.pop(key, None) is not None)
+            if not value:
+                self._data.pop(name, None)
+            return removed
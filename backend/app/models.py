@@ -15,6 +15,7 @@ class User(UserMixin, db.Model):
     sheep = db.relationship('Sheep', backref='owner', lazy='dynamic', cascade="all, delete-orphan")
     events = db.relationship('SheepEvent', backref='owner', lazy='dynamic', cascade="all, delete-orphan")
     chat_history = db.relationship('ChatHistory', backref='owner', lazy='dynamic', cascade="all, delete-orphan")
+    chat_summaries = db.relationship('ChatSessionSummary', backref='owner', lazy='dynamic', cascade="all, delete-orphan")
     event_type_options = db.relationship('EventTypeOption', backref='owner', lazy='dynamic', cascade="all, delete-orphan")
     event_description_options = db.relationship('EventDescriptionOption', backref='owner', lazy='dynamic', cascade="all, delete-orphan")
     product_batches = db.relationship('ProductBatch', backref='owner', lazy='dynamic', cascade="all, delete-orphan")
@@ -236,6 +237,36 @@ class RevenueEntry(FinanceEntryMixin, db.Model):
     pass
 
 
+class FinanceMonthlyRollupMixin:
+    """財務明細的月彙總：每位使用者、月份與分類/品種/胎次/生產階段組合一列，BI 查詢由此取代掃描明細。"""
+    __abstract__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    month = db.Column(db.Date, nullable=False)
+    category = db.Column(db.String(100), nullable=False)
+    breed = db.Column(db.String(100))
+    lactation_number = db.Column(db.Integer)
+    production_stage = db.Column(db.String(100))
+
+    total_amount = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+
+    @declared_attr
+    def __table_args__(cls):  # type: ignore[override]
+        return (
+            db.Index(f'ix_{cls.__tablename__}_user_month', 'user_id', 'month'),
+        )
+
+
+class CostMonthlyRollup(FinanceMonthlyRollupMixin, db.Model):
+    pass
+
+
+class RevenueMonthlyRollup(FinanceMonthlyRollupMixin, db.Model):
+    pass
+
+
 class ChatHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -244,11 +275,34 @@ class ChatHistory(db.Model):
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     ear_num_context = db.Column(db.String(100))
+
+    __table_args__ = (
+        db.Index('ix_chat_history_user_session_id', 'user_id', 'session_id', 'id'),
+    )
     
     def __repr__(self):
         return f'<Chat {self.session_id} - {self.role}>'
 
 
+class ChatSessionSummary(db.Model):
+    """聊天工作階段的滾動摘要：``summarized_through_id`` 之前（含）的訊息已併入 ``summary``。"""
+    __tablename__ = 'chat_session_summary'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    session_id = db.Column(db.String(100), nullable=False)
+    summary = db.Column(db.Text, nullable=False, default='')
+    summarized_through_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'session_id', name='uq_chat_session_summary_user_session'),
+    )
+
+    def __repr__(self):
+        return f'<ChatSummary {self.session_id} through {self.summarized_through_id}>'
+
+
 class VerifiableLog(db.Model):
     __tablename__ = 'verifiable_log'
 
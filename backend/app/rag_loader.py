@@ -1,19 +1,19 @@
 """Lightweight vector store for Retrieval-Augmented Generation lookups."""
 from __future__ import annotations
 
-import base64
-import io
+import hashlib
 import json
 import logging
 import math
 import os
 import subprocess
 import threading
+import time
+from collections.abc import Sequence
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 import numpy as np
-import pandas as pd
 from flask import current_app, has_app_context
 
 from .ai import EmbeddingError, embed_query
@@ -40,14 +40,44 @@ def _detect_repo_root() -> Path:
 _REPO_ROOT = _detect_repo_root()
 _DEFAULT_VECTOR_PATH = _REPO_ROOT / "docs" / "rag_vectors" / "corpus.parquet"
 
-_VECTOR_CACHE: List[Dict[str, object]] = []
+
+
+class _VectorSnapshot(NamedTuple):
+    """Chunks plus the index and matrix built from them, published as one reference.
+
+    Readers take ``_SNAPSHOT`` once and use only its fields, so a concurrent
+    refresh can never pair the chunks of one load with the index of another.
+    """
+
+    vectors: Sequence[Dict[str, object]]
+    index: "faiss.Index" | None  # type: ignore[name-defined]
+    matrix: np.ndarray | None
+    description: str | None
+
+
+_EMPTY_SNAPSHOT = _VectorSnapshot([], None, None, None)
+_SNAPSHOT = _EMPTY_SNAPSHOT
 _VECTOR_MTIME: float | None = None
 _VECTOR_LOCK = threading.Lock()
 _VECTOR_MISSING_WARNED = False
-_FAISS_INDEX: "faiss.Index" | None = None  # type: ignore[name-defined]
-_EMBEDDING_MATRIX: np.ndarray | None = None
 _FAISS_UNAVAILABLE_WARNED = False
+_VECTOR_VERSION: str | None = None
+# ensure_vectors serves the in-process snapshot without locking, stat() or Redis
+# until this many seconds have passed since the last full freshness check.
+_VECTOR_CHECK_INTERVAL = float(os.environ.get("RAG_VERSION_CHECK_INTERVAL", "30"))
+_VECTOR_CHECKED_AT: float | None = None
+_VECTOR_CHECKED_PATH: Path | None = None
+# Redis layout: a small JSON manifest names the current version; the metadata
+# table (parquet bytes) and the raw float32 matrix split into fixed-size chunks
+# live under version-scoped keys so readers never see a half-written snapshot.
 _REDIS_CACHE_KEY = "rag:vectors"
+_REDIS_MANIFEST_KEY = f"{_REDIS_CACHE_KEY}:manifest"
+_REDIS_CHUNK_BYTES = 4 * 1024 * 1024
+_INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+# faiss warns when k-means sees fewer than 39 training points per centroid.
+_MIN_POINTS_PER_CENTROID = 39
+# Approximate indexes fetch this many candidates per requested hit before exact re-ranking.
+_RERANK_FACTOR = 8
 _RAG_STATUS: Dict[str, object] = {
     "available": False,
     "message": "RAG 向量尚未載入",
@@ -68,94 +98,266 @@ def _update_status(*, available: bool, message: str, detail: str | None = None)
     _RAG_STATUS["detail"] = detail
 
 
-def load_vectors(path: str | os.PathLike[str] = _DEFAULT_VECTOR_PATH) -> List[Dict[str, object]]:
-    """Load vectors from a parquet file into memory."""
-    resolved_path = Path(path)
-    if not resolved_path.exists():
-        raise FileNotFoundError(resolved_path)
+class ChunkTable(Sequence):
+    """Column-oriented RAG chunks: one embedding matrix plus metadata columns.
+
+    Rows are materialised as dicts only when indexed, so loading never loops
+    over chunks in Python. ``embeddings`` may be a read-only ``np.memmap``
+    shared by every worker through the OS page cache.
+    """
+
+    __slots__ = ("texts", "docs", "chunk_indices", "metas", "embeddings")
+
+    def __init__(self, texts, docs, chunk_indices, metas, embeddings: np.ndarray) -> None:
+        self.texts = texts
+        self.docs = docs
+        self.chunk_indices = chunk_indices
+        self.metas = metas
+        self.embeddings = embeddings
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        meta = self.metas[position] if self.metas is not None else None
+        return {
+            "text": self.texts[position],
+            "doc": self.docs[position],
+            "idx": int(self.chunk_indices[position]),
+            "meta": {} if meta is None else _safe_json(meta),
+            "embedding": self.embeddings[position],
+        }
+
+
+def vector_store_paths(path: str | os.PathLike[str]) -> Tuple[Path, Path]:
+    """Return the ``(embeddings .npy, metadata .parquet)`` sidecars of a vector parquet."""
+    resolved = Path(path)
+    stem = resolved.with_suffix("")
+    return stem.with_name(f"{stem.name}.embeddings.npy"), stem.with_name(f"{stem.name}.meta.parquet")
+
 
-    df = pd.read_parquet(resolved_path)
+def _vector_store_is_fresh(path: Path) -> bool:
+    embeddings_path, meta_path = vector_store_paths(path)
+    if not (embeddings_path.exists() and meta_path.exists()):
+        return False
+    if not path.exists():
+        return True
+    source_mtime = path.stat().st_mtime
+    return min(embeddings_path.stat().st_mtime, meta_path.stat().st_mtime) >= source_mtime
+
+
+def _column_values(table, name: str):
+    if name not in table.column_names:
+        return None
+    return table.column(name).to_numpy(zero_copy_only=False)
+
+
+def read_vector_parquet(path: str | os.PathLike[str]) -> ChunkTable:
+    """Decode a parquet snapshot column-wise into a :class:`ChunkTable`."""
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path)
     required_columns = {"doc_path", "chunk_index", "text", "embedding"}
-    missing = required_columns.difference(df.columns)
+    missing = required_columns.difference(table.column_names)
     if missing:
         raise ValueError(f"Missing required columns in vector store: {missing}")
 
-    vectors: List[Dict[str, object]] = []
-    for row in df.itertuples(index=False):
-        embedding_values = getattr(row, "embedding")
-        vector = np.asarray(embedding_values, dtype=np.float32)
-        meta = getattr(row, "meta", {})
-        vectors.append(
-            {
-                "text": getattr(row, "text"),
-                "embedding": vector,
-                "doc": getattr(row, "doc_path"),
-                "idx": int(getattr(row, "chunk_index")),
-                "meta": meta if isinstance(meta, dict) else _safe_json(meta),
-            }
+    count = table.num_rows
+    embedding_column = table.column("embedding").combine_chunks()
+    if count:
+        lengths = pc.list_value_length(embedding_column).to_numpy(zero_copy_only=False)
+        if lengths.min() != lengths.max():
+            raise ValueError("Embeddings in vector store have inconsistent dimensions")
+        flat = embedding_column.flatten().to_numpy(zero_copy_only=False)
+        embeddings = np.ascontiguousarray(flat, dtype=np.float32).reshape(count, int(lengths[0]))
+    else:
+        embeddings = np.empty((0, 0), dtype=np.float32)
+
+    return ChunkTable(
+        _column_values(table, "text"),
+        _column_values(table, "doc_path"),
+        _column_values(table, "chunk_index"),
+        _column_values(table, "meta"),
+        embeddings,
+    )
+
+
+def _metadata_table(vectors: ChunkTable):
+    import pyarrow as pa
+
+    metas = vectors.metas if vectors.metas is not None else [None] * len(vectors)
+    return pa.table(
+        {
+            "doc_path": pa.array(vectors.docs, type=pa.string()),
+            "chunk_index": pa.array(vectors.chunk_indices, type=pa.int64()),
+            "text": pa.array(vectors.texts, type=pa.string()),
+            "meta": pa.array(
+                [meta if meta is None or isinstance(meta, str) else json.dumps(meta, ensure_ascii=False) for meta in metas],
+                type=pa.string(),
+            ),
+        }
+    )
+
+
+def _chunk_table_from_metadata(meta_table, embeddings: np.ndarray) -> ChunkTable:
+    if meta_table.num_rows != embeddings.shape[0]:
+        raise ValueError(
+            f"Vector store mismatch: metadata={meta_table.num_rows} embeddings={embeddings.shape[0]}"
         )
-    return vectors
+    return ChunkTable(
+        _column_values(meta_table, "text"),
+        _column_values(meta_table, "doc_path"),
+        _column_values(meta_table, "chunk_index"),
+        _column_values(meta_table, "meta"),
+        embeddings,
+    )
+
+
+def write_vector_store(vectors: ChunkTable, path: str | os.PathLike[str]) -> None:
+    """Write the memory-mappable sidecars for ``path`` (atomically replaced)."""
+    import pyarrow.parquet as pq
+
+    embeddings_path, meta_path = vector_store_paths(path)
+    meta_table = _metadata_table(vectors)
+
+    tmp_embeddings = embeddings_path.with_name(embeddings_path.name + ".tmp")
+    tmp_meta = meta_path.with_name(meta_path.name + ".tmp")
+    with open(tmp_embeddings, "wb") as handle:
+        np.save(handle, np.ascontiguousarray(vectors.embeddings, dtype=np.float32), allow_pickle=False)
+    pq.write_table(meta_table, tmp_meta)
+    os.replace(tmp_embeddings, embeddings_path)
+    os.replace(tmp_meta, meta_path)
 
 
-def ensure_vectors(path: str | os.PathLike[str] = _DEFAULT_VECTOR_PATH) -> List[Dict[str, object]]:
+def load_vector_store(path: str | os.PathLike[str]) -> ChunkTable:
+    """Open the sidecars of ``path``; the embedding matrix is memory-mapped read-only."""
+    import pyarrow.parquet as pq
+
+    embeddings_path, meta_path = vector_store_paths(path)
+    embeddings = np.load(embeddings_path, mmap_mode="r", allow_pickle=False)
+    return _chunk_table_from_metadata(pq.read_table(meta_path), embeddings)
+
+
+def load_vectors(path: str | os.PathLike[str] = _DEFAULT_VECTOR_PATH) -> ChunkTable:
+    """Load vectors, preferring the memory-mapped sidecars over the parquet snapshot.
+
+    When the sidecars are missing or older than the parquet file they are
+    regenerated best effort, so later worker starts can map them directly.
+    """
+    resolved_path = Path(path)
+    if _vector_store_is_fresh(resolved_path):
+        return load_vector_store(resolved_path)
+    if not resolved_path.exists():
+        raise FileNotFoundError(resolved_path)
+
+    vectors = read_vector_parquet(resolved_path)
+    try:
+        write_vector_store(vectors, resolved_path)
+        return load_vector_store(resolved_path)
+    except OSError as exc:
+        LOGGER.info("Could not write memory-mapped RAG store next to %s: %s", resolved_path, exc)
+        return vectors
+
+
+def ensure_vectors(path: str | os.PathLike[str] = _DEFAULT_VECTOR_PATH) -> Sequence[Dict[str, object]]:
     """Ensure vectors are available, sharing cached state across workers via Redis when possible."""
-    global _VECTOR_CACHE, _VECTOR_MTIME, _VECTOR_MISSING_WARNED
     resolved_path = Path(path)
+    if _vector_check_is_recent(resolved_path):
+        return _SNAPSHOT.vectors
 
     with _VECTOR_LOCK:
-        redis_client = _get_redis_client()
-        redis_payload = _load_cache_from_redis(redis_client) if redis_client else None
-
-        file_exists = resolved_path.exists()
-        file_mtime = resolved_path.stat().st_mtime if file_exists else None
-
-        if file_exists and _VECTOR_CACHE and _VECTOR_MTIME == file_mtime:
-            return _VECTOR_CACHE
-
-        if redis_payload:
-            cached_vectors, cached_matrix, cached_mtime = redis_payload
-            if not file_exists or (
-                file_mtime is not None
-                and cached_mtime is not None
-                and math.isclose(file_mtime, cached_mtime, rel_tol=0.0, abs_tol=1e-6)
-            ):
-                _VECTOR_CACHE = cached_vectors
+        if _vector_check_is_recent(resolved_path):
+            return _SNAPSHOT.vectors
+        try:
+            return _refresh_vectors(resolved_path)
+        finally:
+            _mark_vector_check(resolved_path)
+
+
+def _vector_check_is_recent(resolved_path: Path) -> bool:
+    checked_at = _VECTOR_CHECKED_AT
+    return (
+        checked_at is not None
+        and _VECTOR_CHECKED_PATH == resolved_path
+        and time.monotonic() - checked_at < _VECTOR_CHECK_INTERVAL
+    )
+
+
+def _mark_vector_check(resolved_path: Path) -> None:
+    global _VECTOR_CHECKED_AT, _VECTOR_CHECKED_PATH
+    _VECTOR_CHECKED_PATH = resolved_path
+    _VECTOR_CHECKED_AT = time.monotonic()
+
+
+def _refresh_vectors(resolved_path: Path) -> Sequence[Dict[str, object]]:
+    """Full freshness check (file mtime, Redis manifest); caller holds ``_VECTOR_LOCK``."""
+    global _SNAPSHOT, _VECTOR_MTIME, _VECTOR_VERSION, _VECTOR_MISSING_WARNED
+    file_exists = resolved_path.exists()
+    file_mtime = resolved_path.stat().st_mtime if file_exists else None
+
+    if file_exists and _SNAPSHOT.vectors and _VECTOR_MTIME == file_mtime:
+        return _SNAPSHOT.vectors
+
+    redis_client = _get_redis_client()
+    manifest = _load_redis_manifest(redis_client) if redis_client else None
+
+    if manifest:
+        cached_mtime = manifest.get("mtime")
+        published = (
+            file_mtime is not None
+            and cached_mtime is not None
+            and math.isclose(file_mtime, cached_mtime, rel_tol=0.0, abs_tol=1e-6)
+        )
+        if (published or not file_exists) and _SNAPSHOT.vectors and manifest["version"] == _VECTOR_VERSION:
+            return _SNAPSHOT.vectors
+        if published:
+            # The local file is what Redis holds; map its sidecars so workers share
+            # the matrix pages instead of each copying it out of Redis.
+            _load_from_disk(resolved_path, redis_client, file_mtime, version=manifest["version"])
+            return _SNAPSHOT.vectors
+        if not file_exists:
+            cached_vectors = _load_cache_from_redis(redis_client, manifest)
+            if cached_vectors is not None:
+                _SNAPSHOT = _build_snapshot(cached_vectors, cached_vectors.embeddings)
                 _VECTOR_MTIME = cached_mtime
+                _VECTOR_VERSION = manifest["version"]
                 _VECTOR_MISSING_WARNED = False
-                _rebuild_index(_VECTOR_CACHE, cached_matrix)
                 _update_status(
-                    available=bool(_VECTOR_CACHE),
+                    available=bool(cached_vectors),
                     message=(
-                        f"RAG 向量已從 Redis 快取載入（{len(_VECTOR_CACHE)} 筆）"
-                        if _VECTOR_CACHE
+                        f"RAG 向量已從 Redis 快取載入（{len(cached_vectors)} 筆）"
+                        if cached_vectors
                         else "RAG 向量為空，功能將以降級模式執行"
                     ),
                     detail="redis-cache",
                 )
-                LOGGER.info("Loaded %s RAG chunks from Redis cache", len(_VECTOR_CACHE))
-                return _VECTOR_CACHE
+                LOGGER.info("Loaded %s RAG chunks from Redis cache", len(cached_vectors))
+                return cached_vectors
 
-        if file_exists:
-            _load_from_disk(resolved_path, redis_client, file_mtime)
-            return _VECTOR_CACHE
+    if file_exists:
+        _load_from_disk(resolved_path, redis_client, file_mtime)
+        return _SNAPSHOT.vectors
 
-        if not _VECTOR_MISSING_WARNED:
-            _attempt_git_lfs_pull()
-            if resolved_path.exists():
-                file_mtime = resolved_path.stat().st_mtime
-                _load_from_disk(resolved_path, redis_client, file_mtime)
-            else:
-                LOGGER.error(
-                    "RAG 檔案遺失於 %s，RAG 功能將會被禁用", resolved_path
-                )
-                _update_status(
-                    available=False,
-                    message="RAG 檔案遺失，RAG 功能將會被禁用",
-                    detail=str(resolved_path),
-                )
-                _VECTOR_MISSING_WARNED = True
+    if not _VECTOR_MISSING_WARNED:
+        _attempt_git_lfs_pull()
+        if resolved_path.exists():
+            file_mtime = resolved_path.stat().st_mtime
+            _load_from_disk(resolved_path, redis_client, file_mtime)
+        else:
+            LOGGER.error(
+                "RAG 檔案遺失於 %s，RAG 功能將會被禁用", resolved_path
+            )
+            _update_status(
+                available=False,
+                message="RAG 檔案遺失，RAG 功能將會被禁用",
+                detail=str(resolved_path),
+            )
+            _VECTOR_MISSING_WARNED = True
 
-        return _VECTOR_CACHE
+    return _SNAPSHOT.vectors
 
 
 def rag_query(
@@ -168,7 +370,9 @@ def rag_query(
     if not query:
         return []
 
-    vectors = ensure_vectors()
+    ensure_vectors()
+    # Read the published snapshot exactly once; a refresh replaces it wholesale.
+    vectors, index, embeddings, _ = _SNAPSHOT
     if not vectors:
         return []
 
@@ -178,22 +382,18 @@ def rag_query(
         LOGGER.warning("Failed to embed query for RAG lookup: %s", exc)
         return []
 
-    if not _FAISS_AVAILABLE:
-        return _linear_search(query_vector, vectors, top_k=top_k, min_sim=min_sim)
-
-    index = _FAISS_INDEX
-    embeddings = _EMBEDDING_MATRIX
+    if not _FAISS_AVAILABLE or (index is None and embeddings is not None):
+        return _linear_search(query_vector, vectors, embeddings, top_k=top_k, min_sim=min_sim)
     if index is None or embeddings is None:
         return []
 
-    query_vector = np.asarray(query_vector, dtype=np.float32)
+    query_vector = np.array(query_vector, dtype=np.float32)  # cached vectors are read-only
     faiss.normalize_L2(query_vector.reshape(1, -1))
 
-    search_k = min(len(vectors), top_k * 2)
-    distances, indices = index.search(query_vector.reshape(1, -1), search_k)
+    scores, candidates = search_index(index, embeddings, query_vector, min(len(vectors), top_k * 2))
 
     results: List[Dict[str, object]] = []
-    for score, idx in zip(distances[0], indices[0]):
+    for score, idx in zip(scores, candidates):
         if idx < 0:
             continue
         if score < min_sim:
@@ -227,146 +427,154 @@ def _get_redis_client() -> object | None:
     if not has_app_context():
         return None
     try:
-        return current_app.extensions.get("redis_client")
+        # Embedding chunks are raw bytes, so prefer the client that does not decode responses.
+        extensions = current_app.extensions
+        return extensions.get("redis_binary_client") or extensions.get("redis_client")
     except Exception:  # pragma: no cover - safety net for misconfigured app contexts
         return None
 
 
-def _load_cache_from_redis(
-    redis_client: object | None,
-) -> Optional[Tuple[List[Dict[str, object]], np.ndarray, Optional[float]]]:
+def _redis_chunk_key(version: str, position: int) -> str:
+    return f"{_REDIS_CACHE_KEY}:{version}:emb:{position}"
+
+
+def _redis_meta_key(version: str) -> str:
+    return f"{_REDIS_CACHE_KEY}:{version}:meta"
+
+
+def _load_redis_manifest(redis_client: object | None) -> Optional[Dict[str, object]]:
+    """Fetch the small manifest only; the snapshot itself is read separately."""
     if redis_client is None:
         return None
 
     try:
-        raw = redis_client.get(_REDIS_CACHE_KEY)
+        raw = redis_client.get(_REDIS_MANIFEST_KEY)
     except Exception as exc:  # pragma: no cover - redis misconfiguration
-        LOGGER.warning("Failed to fetch RAG cache from Redis: %s", exc)
+        LOGGER.warning("Failed to fetch RAG manifest from Redis: %s", exc)
         return None
 
     if not raw:
         return None
-
     if isinstance(raw, bytes):
         raw = raw.decode("utf-8")
 
     try:
-        payload = json.loads(raw)
-    except (TypeError, ValueError) as exc:
-        LOGGER.warning("Invalid RAG cache payload in Redis: %s", exc)
+        manifest = json.loads(raw)
+        manifest["rows"] = int(manifest["rows"])
+        manifest["dim"] = int(manifest["dim"])
+        manifest["chunks"] = int(manifest["chunks"])
+        manifest["mtime"] = float(manifest["mtime"]) if manifest.get("mtime") is not None else None
+        if not manifest.get("version"):
+            return None
+    except (TypeError, ValueError, KeyError) as exc:
+        LOGGER.warning("Invalid RAG manifest in Redis: %s", exc)
         return None
+    return manifest
 
-    metadata = payload.get("metadata")
-    embeddings_b64 = payload.get("embeddings")
-    mtime_value = payload.get("mtime")
-    if not metadata or embeddings_b64 is None:
-        return None
 
-    try:
-        embeddings_bytes = base64.b64decode(embeddings_b64)
-    except (ValueError, TypeError) as exc:
-        LOGGER.warning("Failed to decode cached embeddings: %s", exc)
-        return None
-
-    try:
-        matrix = np.load(io.BytesIO(embeddings_bytes), allow_pickle=False)
-    except Exception as exc:  # pragma: no cover - corrupted cache
-        LOGGER.warning("Failed to load cached embedding matrix: %s", exc)
-        return None
+def _load_cache_from_redis(redis_client: object, manifest: Dict[str, object]) -> Optional[ChunkTable]:
+    """Stream the chunked matrix into one preallocated array and decode the metadata table."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
-    matrix = np.asarray(matrix, dtype=np.float32)
-    if matrix.ndim == 1:
-        if matrix.size == 0:
-            matrix = matrix.reshape(0, 0)
-        else:
-            matrix = matrix.reshape(1, -1)
-
-    if len(metadata) != len(matrix):
-        LOGGER.warning(
-            "Cached RAG payload mismatch: metadata=%s embeddings=%s", len(metadata), len(matrix)
-        )
-        return None
-
-    vectors: List[Dict[str, object]] = []
-    for meta_item, vector in zip(metadata, matrix):
-        if not isinstance(meta_item, dict):
-            LOGGER.warning("Skipping corrupted metadata item in RAG cache: %r", meta_item)
-            continue
-
-        text = meta_item.get("text", "")
-        doc = meta_item.get("doc", "unknown")
-        idx_value = meta_item.get("idx", 0)
-        chunk_meta = meta_item.get("meta", {})
-
-        if not isinstance(chunk_meta, dict):
-            chunk_meta = _safe_json(chunk_meta)
-
-        try:
-            chunk_index = int(idx_value)
-        except (TypeError, ValueError):
-            chunk_index = 0
-
-        vectors.append(
-            {
-                "text": text,
-                "doc": doc,
-                "idx": chunk_index,
-                "meta": chunk_meta,
-                "embedding": np.asarray(vector, dtype=np.float32),
-            }
-        )
+    version = manifest["version"]
+    rows, dim = manifest["rows"], manifest["dim"]
+    matrix = np.empty((rows, dim), dtype=np.float32)
+    buffer = matrix.reshape(-1).view(np.uint8)
+    offset = 0
 
     try:
-        cached_mtime = float(mtime_value) if mtime_value is not None else None
-    except (TypeError, ValueError):
-        cached_mtime = None
-
-    return vectors, matrix, cached_mtime
+        for position in range(manifest["chunks"]):
+            chunk = redis_client.get(_redis_chunk_key(version, position))
+            if chunk is None or not isinstance(chunk, (bytes, bytearray)):
+                LOGGER.warning("RAG cache chunk %s of version %s missing in Redis", position, version)
+                return None
+            size = len(chunk)
+            if offset + size > buffer.size:
+                LOGGER.warning("RAG cache chunks exceed the manifest size for version %s", version)
+                return None
+            buffer[offset:offset + size] = np.frombuffer(chunk, dtype=np.uint8)
+            offset += size
+        if offset != buffer.size:
+            LOGGER.warning("RAG cache for version %s is incomplete: %s/%s bytes", version, offset, buffer.size)
+            return None
+
+        meta_raw = redis_client.get(_redis_meta_key(version))
+        if meta_raw is None or not isinstance(meta_raw, (bytes, bytearray)):
+            return None
+        meta_table = pq.read_table(pa.BufferReader(meta_raw))
+        return _chunk_table_from_metadata(meta_table, matrix)
+    except Exception as exc:  # pragma: no cover - corrupted cache or decoding client
+        LOGGER.warning("Failed to load RAG cache from Redis: %s", exc)
+        return None
 
 
 def _cache_in_redis(
     redis_client: object,
-    vectors: List[Dict[str, object]],
+    vectors: ChunkTable,
     mtime: float | None,
     embeddings: np.ndarray | None,
-) -> None:
+) -> Optional[str]:
+    """Publish the snapshot as binary chunks and return its version hash."""
     if redis_client is None:
-        return
+        return None
 
-    try:
-        # Persist the full snapshot without a TTL; mtime-based invalidation keeps the cache fresh.
-        metadata = [
-            {
-                "text": item["text"],
-                "doc": item["doc"],
-                "idx": item["idx"],
-                "meta": item.get("meta", {}),
-            }
-            for item in vectors
-        ]
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
+    try:
+        # Persist without a TTL; the manifest version/mtime keeps the cache fresh.
         if embeddings is None:
-            if vectors:
-                embeddings = np.vstack([item["embedding"] for item in vectors]).astype(np.float32)
-            else:
-                embeddings = np.empty((0, 0), dtype=np.float32)
-        else:
-            embeddings = np.asarray(embeddings, dtype=np.float32)
-
-        buffer = io.BytesIO()
-        np.save(buffer, embeddings, allow_pickle=False)
-        payload = json.dumps(
-            {
-                "metadata": metadata,
-                "embeddings": base64.b64encode(buffer.getvalue()).decode("ascii"),
-                "mtime": mtime,
-            },
-            ensure_ascii=False,
+            embeddings = vectors.embeddings
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(vectors), -1) if len(vectors) else np.empty((0, 0), dtype=np.float32)
+        raw = matrix.reshape(-1).view(np.uint8)
+
+        sink = pa.BufferOutputStream()
+        pq.write_table(_metadata_table(vectors), sink)
+        meta_bytes = sink.getvalue().to_pybytes()
+
+        digest = hashlib.sha256()
+        digest.update(f"{matrix.shape}".encode("utf-8"))
+        digest.update(raw)
+        digest.update(meta_bytes)
+        version = digest.hexdigest()[:16]
+
+        previous = _load_redis_manifest(redis_client)
+        if previous and previous["version"] == version:
+            if previous.get("mtime") != mtime:
+                previous["mtime"] = mtime
+                redis_client.set(_REDIS_MANIFEST_KEY, json.dumps(previous))
+            return version
+
+        chunk_count = 0
+        for offset in range(0, raw.size, _REDIS_CHUNK_BYTES):
+            redis_client.set(_redis_chunk_key(version, chunk_count), raw[offset:offset + _REDIS_CHUNK_BYTES].tobytes())
+            chunk_count += 1
+        redis_client.set(_redis_meta_key(version), meta_bytes)
+        redis_client.set(
+            _REDIS_MANIFEST_KEY,
+            json.dumps(
+                {
+                    "version": version,
+                    "mtime": mtime,
+                    "rows": int(matrix.shape[0]),
+                    "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+                    "chunks": chunk_count,
+                }
+            ),
         )
 
-        redis_client.set(_REDIS_CACHE_KEY, payload)
+        redis_client.delete(_REDIS_CACHE_KEY)  # legacy single-key JSON snapshot
+        if previous:
+            for position in range(previous["chunks"]):
+                redis_client.delete(_redis_chunk_key(previous["version"], position))
+            redis_client.delete(_redis_meta_key(previous["version"]))
+        return version
     except Exception as exc:  # pragma: no cover - cache best effort
         LOGGER.warning("Failed to persist RAG cache to Redis: %s", exc)
+        return None
 
 
 def _attempt_git_lfs_pull() -> None:
@@ -402,28 +610,36 @@ def _load_from_disk(
     resolved_path: Path,
     redis_client: object | None,
     file_mtime: float | None,
+    *,
+    version: str | None = None,
 ) -> None:
-    """Load vectors from disk and synchronise Redis cache."""
-    global _VECTOR_CACHE, _VECTOR_MTIME, _VECTOR_MISSING_WARNED
+    """Load vectors from disk and synchronise Redis cache.
+
+    ``version`` is the Redis manifest version already published for this
+    file; it is recorded as-is instead of republishing the snapshot.
+    """
+    global _SNAPSHOT, _VECTOR_MTIME, _VECTOR_VERSION, _VECTOR_MISSING_WARNED
     try:
-        _VECTOR_CACHE = load_vectors(resolved_path)
-        _rebuild_index(_VECTOR_CACHE)
+        vectors = load_vectors(resolved_path)
+        snapshot = _build_snapshot(vectors, vectors.embeddings)
+        _SNAPSHOT = snapshot
         if file_mtime is None:
             file_mtime = resolved_path.stat().st_mtime
         _VECTOR_MTIME = file_mtime
         _VECTOR_MISSING_WARNED = False
-        if redis_client is not None:
-            _cache_in_redis(redis_client, _VECTOR_CACHE, file_mtime, _EMBEDDING_MATRIX)
+        _VECTOR_VERSION = version
+        if redis_client is not None and version is None:
+            _VECTOR_VERSION = _cache_in_redis(redis_client, vectors, file_mtime, snapshot.matrix)
         _update_status(
-            available=bool(_VECTOR_CACHE),
+            available=bool(vectors),
             message=(
-                f"RAG 向量載入完成（{len(_VECTOR_CACHE)} 筆）"
-                if _VECTOR_CACHE
+                f"RAG 向量載入完成（{len(vectors)} 筆）"
+                if vectors
                 else "RAG 向量為空，功能將以降級模式執行"
             ),
             detail=str(resolved_path),
         )
-        LOGGER.info("Loaded %s RAG chunks from %s", len(_VECTOR_CACHE), resolved_path)
+        LOGGER.info("Loaded %s RAG chunks from %s", len(vectors), resolved_path)
     except Exception as exc:  # pragma: no cover - defensive logging
         LOGGER.error("Failed to load RAG vectors from %s: %s", resolved_path, exc)
         _update_status(
@@ -434,52 +650,186 @@ def _load_from_disk(
         _clear_cache(reset_status=False)
 
 
-def _rebuild_index(vectors: List[Dict[str, object]], embeddings: Optional[np.ndarray] = None) -> None:
-    """Build or refresh the FAISS index from in-memory vectors."""
-    global _FAISS_INDEX, _EMBEDDING_MATRIX
+def _env_int(name: str, default: int) -> int:
+    raw = os.environ.get(name)
+    if raw in (None, ""):
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        LOGGER.warning("Ignoring invalid %s=%r; using %s", name, raw, default)
+        return default
+
+
+def index_config() -> Dict[str, object]:
+    """Read the ANN index settings from the environment.
+
+    ``RAG_INDEX_TYPE`` selects ``flat`` (exact, default), ``ivf_flat``, ``hnsw`` or
+    ``ivf_pq``. ``RAG_IVF_NLIST=0`` lets the list count scale with the corpus
+    (about ``4 * sqrt(n)``).
+    """
+    index_type = os.environ.get("RAG_INDEX_TYPE", "flat").strip().lower()
+    if index_type not in _INDEX_TYPES:
+        LOGGER.warning("Unknown RAG_INDEX_TYPE=%r; falling back to flat", index_type)
+        index_type = "flat"
+    return {
+        "type": index_type,
+        "nlist": _env_int("RAG_IVF_NLIST", 0),
+        "nprobe": _env_int("RAG_IVF_NPROBE", 8),
+        "hnsw_m": _env_int("RAG_HNSW_M", 32),
+        "ef_construction": _env_int("RAG_HNSW_EF_CONSTRUCTION", 80),
+        "ef_search": _env_int("RAG_HNSW_EF_SEARCH", 128),
+        "pq_m": _env_int("RAG_PQ_M", 16),
+        "pq_nbits": _env_int("RAG_PQ_NBITS", 8),
+    }
+
+
+def _resolve_nlist(requested: int, count: int) -> int:
+    if requested > 0:
+        return requested
+    return max(1, min(int(4 * math.sqrt(count)), count // _MIN_POINTS_PER_CENTROID))
+
+
+def _resolve_pq_m(requested: int, dimension: int) -> int:
+    """Largest sub-quantizer count <= ``requested`` that divides the dimension."""
+    for candidate in range(max(1, min(requested, dimension)), 0, -1):
+        if dimension % candidate == 0:
+            return candidate
+    return 1
+
+
+def build_faiss_index(
+    embeddings: np.ndarray, config: Optional[Dict[str, object]] = None
+) -> Tuple["faiss.Index", str]:  # type: ignore[name-defined]
+    """Build (and train when required) an inner-product index over L2-normalised rows.
+
+    Corpora too small to train the requested structure fall back to an exact
+    ``IndexFlatIP``. Returns the index and a short description for logging.
+    """
+    config = config or index_config()
+    count, dimension = embeddings.shape
+    index_type = config["type"]
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, int(config["hnsw_m"]), metric)
+        index.hnsw.efConstruction = int(config["ef_construction"])
+        index.hnsw.efSearch = int(config["ef_search"])
+        index.add(embeddings)
+        return index, f"hnsw(M={config['hnsw_m']}, efSearch={config['ef_search']})"
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = _resolve_nlist(int(config["nlist"]), count)
+        min_points = nlist * _MIN_POINTS_PER_CENTROID
+        if index_type == "ivf_pq":
+            min_points = max(min_points, 2 ** int(config["pq_nbits"]))
+        if count >= min_points:
+            quantizer = faiss.IndexFlatIP(dimension)
+            if index_type == "ivf_pq":
+                pq_m = _resolve_pq_m(int(config["pq_m"]), dimension)
+                index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, int(config["pq_nbits"]), metric)
+                description = f"ivf_pq(nlist={nlist}, m={pq_m}, nbits={config['pq_nbits']}"
+            else:
+                index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+                description = f"ivf_flat(nlist={nlist}"
+            index.train(embeddings)
+            index.add(embeddings)
+            index.nprobe = min(int(config["nprobe"]), nlist)
+            return index, f"{description}, nprobe={index.nprobe})"
+        LOGGER.info(
+            "RAG corpus has %s vectors (< %s needed to train %s); using exact search",
+            count,
+            min_points,
+            index_type,
+        )
+
+    index = faiss.IndexFlatIP(dimension)
+    index.add(embeddings)
+    return index, "flat"
+
+
+def search_index(
+    index: "faiss.Index",  # type: ignore[name-defined]
+    embeddings: np.ndarray,
+    query_vector: np.ndarray,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return ``(scores, indices)`` of the best ``k`` rows for a normalised query.
+
+    Approximate indexes (notably PQ) only estimate similarities, so a wider
+    candidate list is re-scored exactly against ``embeddings``; ``min_sim``
+    thresholds therefore keep their meaning whatever the index type.
+    """
+    query = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+    if isinstance(index, faiss.IndexFlat):
+        distances, indices = index.search(query, k)
+        return distances[0], indices[0]
+
+    _, indices = index.search(query, min(index.ntotal, k * _RERANK_FACTOR))
+    candidates = indices[0][indices[0] >= 0]
+    scores = embeddings[candidates] @ query[0]
+    order = top_k_indices(scores, k)
+    return scores[order], candidates[order]
+
+
+def _build_snapshot(
+    vectors: Sequence[Dict[str, object]], embeddings: Optional[np.ndarray] = None
+) -> _VectorSnapshot:
+    """Build the FAISS index over ``vectors``; the caller publishes the result in one assignment."""
     if not vectors:
-        _FAISS_INDEX = None
-        _EMBEDDING_MATRIX = None
-        return
+        return _EMPTY_SNAPSHOT
 
     if embeddings is None:
         embeddings = np.vstack([item["embedding"] for item in vectors]).astype(np.float32)
     else:
-        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = np.asanyarray(embeddings, dtype=np.float32)
+    embeddings = _normalise_rows(embeddings)
 
-    if _FAISS_AVAILABLE:
-        faiss.normalize_L2(embeddings)
-        index = faiss.IndexFlatIP(embeddings.shape[1])
-        index.add(embeddings)
-        _FAISS_INDEX = index
+    config = index_config()
+    if _FAISS_AVAILABLE and not (config["type"] == "flat" and isinstance(embeddings, np.memmap)):
+        index, description = build_faiss_index(np.ascontiguousarray(embeddings), config)
+        LOGGER.info("Built RAG index %s over %s vectors", description, len(embeddings))
     else:
-        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
-        norms[norms == 0.0] = 1.0
-        embeddings = embeddings / norms
-        _FAISS_INDEX = None
-    _EMBEDDING_MATRIX = embeddings
+        # Exact search over a memory-mapped matrix stays on the shared pages
+        # instead of copying every vector into a private IndexFlatIP.
+        index, description = None, "linear"
+    return _VectorSnapshot(vectors, index, embeddings, description)
+
+
+def _normalise_rows(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalise rows, returning the input untouched (e.g. a memmap) when it already is."""
+    if embeddings.size == 0:
+        return embeddings
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    nonzero = norms != 0.0
+    if np.allclose(norms[nonzero], 1.0, atol=1e-4):
+        return embeddings
+    norms[~nonzero] = 1.0
+    return (embeddings / norms).astype(np.float32)
 
 
 def _clear_cache(*, reset_status: bool = True) -> None:
-    global _VECTOR_CACHE, _VECTOR_MTIME, _FAISS_INDEX, _EMBEDDING_MATRIX
-    _VECTOR_CACHE = []
+    global _SNAPSHOT, _VECTOR_MTIME, _VECTOR_VERSION, _VECTOR_CHECKED_AT, _VECTOR_CHECKED_PATH
+    _SNAPSHOT = _EMPTY_SNAPSHOT
     _VECTOR_MTIME = None
-    _FAISS_INDEX = None
-    _EMBEDDING_MATRIX = None
+    _VECTOR_VERSION = None
+    _VECTOR_CHECKED_AT = None
+    _VECTOR_CHECKED_PATH = None
     if reset_status:
         _update_status(available=False, message="RAG 向量尚未載入", detail=None)
 
 
 def _linear_search(
     query_vector: np.ndarray,
-    vectors: List[Dict[str, object]],
+    vectors: Sequence[Dict[str, object]],
+    embeddings: Optional[np.ndarray] = None,
     *,
     top_k: int,
     min_sim: float,
 ) -> List[Dict[str, object]]:
-    """Fallback cosine similarity search when FAISS is unavailable."""
+    """Exact cosine similarity search, used without FAISS or over a memory-mapped matrix."""
     global _FAISS_UNAVAILABLE_WARNED
-    if not _FAISS_UNAVAILABLE_WARNED:
+    if not _FAISS_AVAILABLE and not _FAISS_UNAVAILABLE_WARNED:
         LOGGER.warning(
             "faiss-cpu not available; using linear scan fallback. Install the dependency for better RAG performance."
         )
@@ -488,7 +838,6 @@ def _linear_search(
     if not vectors:
         return []
 
-    embeddings = _EMBEDDING_MATRIX
     if embeddings is None:
         embeddings = np.vstack([item["embedding"] for item in vectors]).astype(np.float32)
     query = np.asarray(query_vector, dtype=np.float32)
@@ -497,7 +846,7 @@ def _linear_search(
         query = query / norm
 
     scores = embeddings @ query
-    top_indices = np.argsort(scores)[::-1]
+    top_indices = top_k_indices(scores, top_k)
 
     results: List[Dict[str, object]] = []
     for idx in top_indices:
@@ -518,3 +867,15 @@ def _linear_search(
             break
 
     return results
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` highest scores in descending order, via ``argpartition``."""
+    count = scores.shape[0]
+    if k <= 0 or count == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < count:
+        candidates = np.argpartition(scores, count - k)[count - k:]
+    else:
+        candidates = np.arange(count)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
@@ -120,6 +120,19 @@ class AgentChatModel(BaseModel):
     ear_num_context: Optional[str] = Field(None, description="羊隻耳號上下文")
 
 
+# === 生長預測相關模型 ===
+class BatchPredictionRequestModel(BaseModel):
+    """批次生長預測請求模型"""
+    ear_tags: Optional[List[str]] = Field(None, max_length=5000, description="耳號清單")
+    breeds: Optional[List[str]] = Field(None, description="品種過濾")
+    statuses: Optional[List[str]] = Field(None, description="生理狀態過濾")
+    target_days: int = Field(30, ge=7, le=365, description="預測天數")
+    eligible_only: bool = Field(True, description="僅包含 60-365 日齡的羊隻")
+    include_daily_forecasts: bool = Field(False, description="是否回傳每日預測曲線")
+    include_ai_analysis: bool = Field(False, description="是否產生 AI 分析")
+    run_async: bool = Field(False, description="是否強制以背景任務執行")
+
+
 # === Analytics 報告模型 ===
 
 
@@ -0,0 +1,251 @@
+"""Bounded conversation context for the agent chat endpoints.
+
+Only the most recent messages are replayed verbatim, capped both by count
+(``CHAT_HISTORY_MAX_TURNS``) and by an estimated token budget
+(``CHAT_HISTORY_TOKEN_BUDGET``). When a session outgrows either limit, the
+oldest messages are folded into a running summary stored in
+``ChatSessionSummary``. Each compaction only summarises the messages leaving
+the window plus the previous summary, and it trims the window to half of the
+limits so the summary is refreshed every few turns rather than on every turn.
+
+Building the prompt never calls the summariser: an over-long session is
+replayed as the summary plus the newest slice, and the endpoints run
+:func:`compact_chat_history` after the reply has been sent. Messages stay in
+the context until a summary covering them is stored, so a failed summary
+call is retried with the same turns instead of dropping them.
+
+The assembled context is cached in Redis per session and extended in place
+after each exchange, so a regular turn costs one indexed ``max(id)`` lookup
+instead of reloading the whole history.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.cache import clear_chat_context_cache, get_chat_context_cache, set_chat_context_cache
+from app.models import ChatHistory, ChatSessionSummary
+from app.utils import call_gemini_api
+
+LOGGER = logging.getLogger(__name__)
+
+CHAT_HISTORY_MAX_MESSAGES = int(os.environ.get("CHAT_HISTORY_MAX_TURNS", "10")) * 2
+CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get("CHAT_HISTORY_TOKEN_BUDGET", "4000"))
+SUMMARY_MAX_CHARS = 600
+# Share of the limits kept verbatim right after a compaction.
+_COMPACT_RATIO = 0.5
+# Upper bound on unsummarised rows read when rebuilding a context from the
+# database; anything older is skipped rather than summarised.
+_MAX_REBUILD_MESSAGES = 200
+
+_ROLE_LABELS = {"user": "使用者", "model": "領頭羊博士"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: one token per CJK character, one per four other characters."""
+    cjk = sum(1 for char in text if "⺀" <= char <= "鿿" or "豈" <= char <= "﫿")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _messages_tokens(messages: Iterable[Dict[str, Any]]) -> int:
+    return sum(estimate_tokens(message["content"]) for message in messages)
+
+
+def _latest_message_id(user_id: int, session_id: str) -> int:
+    latest = (
+        db.session.query(func.max(ChatHistory.id))
+        .filter(ChatHistory.user_id == user_id, ChatHistory.session_id == session_id)
+        .scalar()
+    )
+    return latest or 0
+
+
+def _load_from_db(user_id: int, session_id: str) -> Dict[str, Any]:
+    summary_row = ChatSessionSummary.query.filter_by(user_id=user_id, session_id=session_id).first()
+    summarized_through = summary_row.summarized_through_id if summary_row else 0
+    rows = (
+        ChatHistory.query.filter(
+            ChatHistory.user_id == user_id,
+            ChatHistory.session_id == session_id,
+            ChatHistory.id > summarized_through,
+        )
+        .order_by(ChatHistory.id.desc())
+        .limit(_MAX_REBUILD_MESSAGES)
+        .all()
+    )
+    rows.reverse()
+    return {
+        "summary": summary_row.summary if summary_row else "",
+        "summarized_through_id": summarized_through,
+        "messages": [{"id": row.id, "role": row.role, "content": row.content} for row in rows],
+        "last_id": rows[-1].id if rows else summarized_through,
+    }
+
+
+def _cache_get(user_id: int, session_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        return get_chat_context_cache(user_id, session_id)
+    except Exception as exc:  # pragma: no cover - cache best effort
+        LOGGER.warning("Failed to read chat context cache: %s", exc)
+        return None
+
+
+def _cache_set(user_id: int, session_id: str, context: Dict[str, Any]) -> None:
+    try:
+        set_chat_context_cache(user_id, session_id, context)
+    except Exception as exc:  # pragma: no cover - cache best effort
+        LOGGER.warning("Failed to write chat context cache: %s", exc)
+
+
+def _needs_compaction(context: Dict[str, Any]) -> bool:
+    messages = context["messages"]
+    return len(messages) > CHAT_HISTORY_MAX_MESSAGES or _messages_tokens(messages) > CHAT_HISTORY_TOKEN_BUDGET
+
+
+def _split_window(messages: List[Dict[str, Any]]) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split into ``(folded, kept)`` where ``kept`` is the newest slice within the reduced limits."""
+    max_messages = max(2, int(CHAT_HISTORY_MAX_MESSAGES * _COMPACT_RATIO))
+    max_tokens = int(CHAT_HISTORY_TOKEN_BUDGET * _COMPACT_RATIO)
+    kept_count = 0
+    tokens = 0
+    for message in reversed(messages):
+        message_tokens = estimate_tokens(message["content"])
+        if kept_count and (kept_count >= max_messages or tokens + message_tokens > max_tokens):
+            break
+        kept_count += 1
+        tokens += message_tokens
+    split = len(messages) - kept_count
+    # Start the verbatim window on a user turn so question and answer stay together.
+    while split < len(messages) - 1 and messages[split]["role"] != "user":
+        split += 1
+    return messages[:split], messages[split:]
+
+
+def _summarise(previous_summary: str, messages: List[Dict[str, Any]], api_key: str) -> Optional[str]:
+    transcript = "\n".join(
+        f"{_ROLE_LABELS.get(message['role'], message['role'])}: {message['content']}" for message in messages
+    )
+    prompt = (
+        "請將以下牧場 AI 顧問與使用者的新增對話整併進既有摘要，輸出更新後的完整摘要。\n"
+        "務必保留：使用者的牧場狀況、提到的羊隻耳號與健康或生產狀況、已給出的建議，以及尚未解決的問題。\n"
+        f"請以繁體中文條列，總長不超過 {SUMMARY_MAX_CHARS} 字，只輸出摘要本身。\n\n"
+        f"--- 既有摘要 ---\n{previous_summary or '（無）'}\n\n"
+        f"--- 新增對話 ---\n{transcript}"
+    )
+    result = call_gemini_api(
+        prompt, api_key, generation_config_override={"temperature": 0.2, "max_output_tokens": 1024}
+    )
+    text = (result.get("text") or "").strip()
+    if "error" in result or not text:
+        LOGGER.warning("Chat summary update failed: %s", result.get("error", "empty response"))
+        return None
+    return text[: SUMMARY_MAX_CHARS * 2]
+
+
+def _store_summary(user_id: int, session_id: str, summary: str, summarized_through_id: int) -> bool:
+    try:
+        row = ChatSessionSummary.query.filter_by(user_id=user_id, session_id=session_id).first()
+        if row is None:
+            row = ChatSessionSummary(user_id=user_id, session_id=session_id)
+            db.session.add(row)
+        row.summary = summary
+        row.summarized_through_id = summarized_through_id
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Another request created the summary row concurrently; its result wins.
+        db.session.rollback()
+        return False
+
+
+def _load_context(user_id: int, session_id: str) -> Dict[str, Any]:
+    context = _cache_get(user_id, session_id)
+    if context is None or context.get("last_id") != _latest_message_id(user_id, session_id):
+        context = _load_from_db(user_id, session_id)
+        _cache_set(user_id, session_id, context)
+    return context
+
+
+def _to_contents(context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    contents: List[Dict[str, Any]] = []
+    if context["summary"]:
+        contents.append({"role": "user", "parts": [{"text": f"[先前對話摘要]\n{context['summary']}"}]})
+        contents.append({"role": "model", "parts": [{"text": "好的，我會延續先前對話的內容回答。"}]})
+    for message in context["messages"]:
+        contents.append({"role": message["role"], "parts": [{"text": message["content"]}]})
+    return contents
+
+
+def build_chat_history(user_id: int, session_id: str) -> List[Dict[str, Any]]:
+    """Return the Gemini contents replaying this session: running summary, then recent turns.
+
+    No LLM call happens here; a session awaiting compaction is replayed with
+    its newest slice only, so the prompt stays bounded.
+    """
+    context = _load_context(user_id, session_id)
+    if _needs_compaction(context):
+        _, kept = _split_window(context["messages"])
+        context = dict(context, messages=kept)
+    return _to_contents(context)
+
+
+def compact_chat_history(user_id: int, session_id: str, api_key: str) -> bool:
+    """Fold the oldest turns into the running summary; run it after the reply is sent.
+
+    Returns ``True`` when a new summary was stored. On failure the context is
+    left untouched, so the next call summarises the same turns again.
+    """
+    context = _load_context(user_id, session_id)
+    if not _needs_compaction(context):
+        return False
+    folded, kept = _split_window(context["messages"])
+    if not folded:
+        return False
+
+    summary = _summarise(context["summary"], folded, api_key)
+    if summary is None:
+        return False
+    if not _store_summary(user_id, session_id, summary, folded[-1]["id"]):
+        return False
+    _cache_set(
+        user_id,
+        session_id,
+        dict(context, summary=summary, summarized_through_id=folded[-1]["id"], messages=kept),
+    )
+    return True
+
+
+def record_chat_exchange(user_id: int, session_id: str, entries: Iterable[ChatHistory]) -> None:
+    """Append freshly committed entries to the cached context, or drop it if it went stale."""
+    entries = sorted(entries, key=lambda entry: entry.id)
+    if not entries:
+        return
+    context = _cache_get(user_id, session_id)
+    if context is None:
+        return
+
+    newer = (
+        ChatHistory.query.filter(
+            ChatHistory.user_id == user_id,
+            ChatHistory.session_id == session_id,
+            ChatHistory.id > context["last_id"],
+        ).count()
+    )
+    if newer != len(entries) or entries[0].id <= context["last_id"]:
+        # Another request wrote to this session in between; rebuild on the next turn.
+        try:
+            clear_chat_context_cache(user_id, session_id)
+        except Exception as exc:  # pragma: no cover - cache best effort
+            LOGGER.warning("Failed to clear chat context cache: %s", exc)
+        return
+
+    context["messages"].extend(
+        {"id": entry.id, "role": entry.role, "content": entry.content} for entry in entries
+    )
+    context["last_id"] = entries[-1].id
+    _cache_set(user_id, session_id, context)
@@ -0,0 +1,92 @@
+"""Image handling for the agent chat endpoints.
+
+Uploaded photos are kept as raw bytes end to end: the request stream is read
+once with a hard size cap and the bytes are handed to the GenAI client as an
+``inline_data`` part, which wraps them in ``genai_types.Part`` without a
+base64 round trip.
+
+Large photos are optionally downscaled before upload. JPEG files are decoded
+through Pillow's draft mode, which lets the decoder scale by 1/2, 1/4 or 1/8
+while reading, so a phone photo never materialises at full resolution.
+Other formats are only decoded when their pixel count is below
+``CHAT_IMAGE_MAX_DECODE_PIXELS``, so memory stays bounded regardless of the
+input. The re-encoded image is used only if it is actually smaller.
+"""
+from __future__ import annotations
+
+import io
+import logging
+import os
+from typing import IO, Optional, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+CHAT_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+# Longest edge sent to the model; ``0`` disables downscaling altogether.
+CHAT_IMAGE_MAX_DIMENSION = int(os.environ.get("CHAT_IMAGE_MAX_DIMENSION", "1536"))
+# Smaller files within the dimension limit are forwarded untouched.
+CHAT_IMAGE_RECOMPRESS_MIN_BYTES = int(os.environ.get("CHAT_IMAGE_RECOMPRESS_MIN_BYTES", str(1024 * 1024)))
+CHAT_IMAGE_JPEG_QUALITY = int(os.environ.get("CHAT_IMAGE_JPEG_QUALITY", "85"))
+# Non-JPEG images above this size are sent as-is rather than fully decoded.
+CHAT_IMAGE_MAX_DECODE_PIXELS = int(os.environ.get("CHAT_IMAGE_MAX_DECODE_PIXELS", str(40_000_000)))
+
+
+def read_upload(stream: IO[bytes], max_bytes: Optional[int] = None) -> Optional[bytes]:
+    """Read an upload stream once, returning ``None`` when it exceeds ``max_bytes``.
+
+    At most ``max_bytes + 1`` bytes are read, so oversized uploads are
+    rejected without loading them completely.
+    """
+    if max_bytes is None:
+        max_bytes = CHAT_IMAGE_MAX_BYTES
+    data = stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        return None
+    return data
+
+
+def _has_alpha(image) -> bool:
+    return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def prepare_image(data: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """Return ``(bytes, mime_type)`` to upload, downscaling large photos when possible."""
+    max_dimension = CHAT_IMAGE_MAX_DIMENSION
+    if max_dimension <= 0:
+        return data, mime_type
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # pragma: no cover - Pillow ships with the backend requirements
+        return data, mime_type
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            if len(data) < CHAT_IMAGE_RECOMPRESS_MIN_BYTES and max(width, height) <= max_dimension:
+                return data, mime_type
+            if getattr(image, "is_animated", False):
+                return data, mime_type
+            if image.format == "JPEG":
+                image.draft("RGB", (max_dimension, max_dimension))
+            elif width * height > CHAT_IMAGE_MAX_DECODE_PIXELS:
+                return data, mime_type
+
+            resized = ImageOps.exif_transpose(image)
+            resized.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+            output = io.BytesIO()
+            if _has_alpha(resized):
+                resized.save(output, format="PNG", optimize=True)
+                new_mime_type = "image/png"
+            else:
+                resized.convert("RGB").save(
+                    output, format="JPEG", quality=CHAT_IMAGE_JPEG_QUALITY, optimize=True
+                )
+                new_mime_type = "image/jpeg"
+    except Exception as exc:  # Pillow raises a variety of errors for corrupt or exotic files
+        LOGGER.warning("Chat image could not be downscaled, sending original: %s", exc)
+        return data, mime_type
+
+    if output.tell() >= len(data):
+        return data, mime_type
+    return output.getvalue(), new_mime_type
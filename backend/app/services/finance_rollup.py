@@ -0,0 +1,192 @@
+"""Monthly finance rollups backing the BI endpoints.
+
+``cost_monthly_rollup`` and ``revenue_monthly_rollup`` hold the summed amount
+and entry count of the finance entries per user, month, category, breed,
+lactation number and production stage. Finance writes apply their deltas in
+the same transaction as the entry change (:func:`apply_rollup_changes`), so
+the BI queries can read whole months from the rollups and only scan raw
+entries for the partial months at the edges of a requested time range.
+
+The BI side always sums rollup rows, so a duplicate bucket created by two
+concurrent first writes still yields correct totals; deltas are applied to a
+single row of a bucket. ``flask finance-rollups rebuild`` recomputes the
+tables from the raw entries, for example after a manual data fix.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Date, and_, cast, delete, func, insert, select, update
+
+from app import db
+from app.cache import clear_bi_cache
+from app.models import CostEntry, CostMonthlyRollup, RevenueEntry, RevenueMonthlyRollup, User
+
+ROLLUP_MODELS = {
+    CostEntry: CostMonthlyRollup,
+    RevenueEntry: RevenueMonthlyRollup,
+}
+DIMENSIONS = ("category", "breed", "lactation_number", "production_stage")
+
+# (user_id, month, category, breed, lactation_number, production_stage)
+Bucket = Tuple[int, date, str, Optional[str], Optional[int], Optional[str]]
+
+
+def month_floor(value: datetime) -> datetime:
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(value: datetime) -> datetime:
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def full_month_window(
+    start: Optional[datetime], end: Optional[datetime]
+) -> Optional[Tuple[Optional[datetime], Optional[datetime]]]:
+    """Return ``(lower, upper)`` bounding the whole months inside ``[start, end]``.
+
+    ``lower`` is inclusive and ``upper`` exclusive; either is ``None`` when the
+    range is open on that side. Returns ``None`` when no whole month is covered.
+    """
+    lower = None
+    if start is not None:
+        lower = month_floor(start)
+        if lower != start:
+            lower = _next_month(lower)
+    upper = None if end is None else month_floor(end + timedelta(microseconds=1))
+    if lower is not None and upper is not None and lower >= upper:
+        return None
+    return lower, upper
+
+
+def entry_bucket(entry) -> Tuple[Bucket, Decimal]:
+    """Snapshot the rollup bucket and amount of an entry; take it before mutating the entry."""
+    bucket = (
+        entry.user_id,
+        month_floor(entry.recorded_at).date(),
+        entry.category,
+        entry.breed,
+        entry.lactation_number,
+        entry.production_stage,
+    )
+    return bucket, Decimal(str(entry.amount))
+
+
+def _bucket_condition(rollup, bucket: Bucket):
+    user_id, month, *dimensions = bucket
+    conditions = [rollup.user_id == user_id, rollup.month == month]
+    for name, value in zip(DIMENSIONS, dimensions):
+        column = getattr(rollup, name)
+        conditions.append(column.is_(None) if value is None else column == value)
+    return and_(*conditions)
+
+
+def apply_rollup_changes(
+    entry_model: Type[CostEntry | RevenueEntry],
+    removed: Iterable[Tuple[Bucket, Decimal]] = (),
+    added: Iterable[Tuple[Bucket, Decimal]] = (),
+) -> None:
+    """Move entries out of and into their rollup buckets; the caller commits.
+
+    ``removed`` and ``added`` are :func:`entry_bucket` snapshots. An update is
+    a removal of the old snapshot plus an addition of the new one.
+    """
+    deltas: Dict[Bucket, List] = defaultdict(lambda: [Decimal("0"), 0])
+    for bucket, amount in removed:
+        deltas[bucket][0] -= amount
+        deltas[bucket][1] -= 1
+    for bucket, amount in added:
+        deltas[bucket][0] += amount
+        deltas[bucket][1] += 1
+
+    rollup = ROLLUP_MODELS[entry_model]
+    for bucket, (amount, count) in deltas.items():
+        if not amount and not count:
+            continue
+        row_id = db.session.scalar(
+            select(rollup.id).where(_bucket_condition(rollup, bucket)).order_by(rollup.id).limit(1)
+        )
+        if row_id is None:
+            user_id, month, *dimensions = bucket
+            db.session.add(rollup(
+                user_id=user_id,
+                month=month,
+                total_amount=amount,
+                entry_count=count,
+                **dict(zip(DIMENSIONS, dimensions)),
+            ))
+            continue
+        # Increment in SQL so concurrent writers to the same bucket do not lose updates.
+        db.session.execute(
+            update(rollup)
+            .where(rollup.id == row_id)
+            .values(total_amount=rollup.total_amount + amount, entry_count=rollup.entry_count + count)
+            .execution_options(synchronize_session=False)
+        )
+        if count < 0:
+            db.session.execute(
+                delete(rollup)
+                .where(rollup.id == row_id, rollup.entry_count <= 0, rollup.total_amount == 0)
+                .execution_options(synchronize_session=False)
+            )
+
+
+def _month_expression(column):
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == "sqlite":
+        return func.date(column, "start of month")
+    return cast(func.date_trunc("month", column), Date)
+
+
+def rebuild_rollups(user_id: Optional[int] = None) -> Dict[str, int]:
+    """Recompute the rollup tables from the raw entries, for one user or everyone.
+
+    The affected users' BI caches are invalidated as well. Returns the number
+    of rollup rows written per table.
+    """
+    written = {}
+    for entry_model, rollup in ROLLUP_MODELS.items():
+        clear = delete(rollup)
+        if user_id is not None:
+            clear = clear.where(rollup.user_id == user_id)
+        db.session.execute(clear)
+
+        month = _month_expression(entry_model.recorded_at)
+        dimensions = [getattr(entry_model, name) for name in DIMENSIONS]
+        grouped = select(
+            entry_model.user_id,
+            month,
+            *dimensions,
+            func.sum(entry_model.amount),
+            func.count(entry_model.id),
+        ).group_by(entry_model.user_id, month, *dimensions)
+        if user_id is not None:
+            grouped = grouped.where(entry_model.user_id == user_id)
+
+        result = db.session.execute(
+            insert(rollup).from_select(
+                ["user_id", "month", *DIMENSIONS, "total_amount", "entry_count"], grouped
+            )
+        )
+        written[rollup.__tablename__] = result.rowcount
+    db.session.commit()
+    # A rebuild usually follows a manual data fix, so cached BI answers are stale too.
+    user_ids = [user_id] if user_id is not None else db.session.scalars(select(User.id)).all()
+    clear_bi_cache(*user_ids)
+    return written
+
+
+finance_rollup_cli = AppGroup("finance-rollups", help="Maintain the monthly finance rollup tables.")
+
+
+@finance_rollup_cli.command("rebuild")
+@click.option("--user-id", type=int, default=None, help="Only rebuild the rollups of this user.")
+def rebuild_command(user_id: Optional[int]) -> None:
+    """Recompute the rollups from the raw cost and revenue entries."""
+    for table, rows in rebuild_rollups(user_id).items():
+        click.echo(f"{table}: {rows} rows")
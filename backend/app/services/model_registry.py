@@ -0,0 +1,194 @@
+"""Registry for the LightGBM growth-prediction models.
+
+The registry loads the main and quantile models once per process and keeps
+them behind a lock so request threads never race on the first load. Calling
+``preload`` from ``create_app`` loads them before a pre-forking server (for
+example ``gunicorn --preload``) forks its workers, so children share the
+model pages copy-on-write. No inference runs at preload time, which keeps
+LightGBM's OpenMP runtime untouched in the parent process.
+
+Each model may be stored as a native LightGBM text dump (``<name>.txt``),
+which loads faster and without pickle, or as the original joblib pickle.
+Failed loads are retried after ``retry_interval`` seconds instead of being
+remembered forever.
+"""
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+RELOAD_GENERATION_KEY = "lgbm-model-registry:generation"
+
+
+class ModelRegistry:
+    """Thread-safe, lazily or eagerly loaded LightGBM model set."""
+
+    def __init__(
+        self,
+        model_dir: Path,
+        model_files: Dict[str, str],
+        *,
+        required: tuple[str, ...] = ('main',),
+        retry_interval: float = 60.0,
+        generation_check_interval: float = 30.0,
+    ):
+        self.model_dir = Path(model_dir)
+        self.model_files = dict(model_files)
+        self.required = required
+        self.retry_interval = retry_interval
+        self.generation_check_interval = generation_check_interval
+
+        self.models: Dict[str, Any] = {}
+        self.formats: Dict[str, str] = {}
+        self.version: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.warnings: List[str] = []
+
+        self._lock = threading.Lock()
+        self._last_attempt: Optional[float] = None
+        self._generation: Optional[str] = None
+        self._generation_checked_at = 0.0
+
+    # --- paths & formats ---------------------------------------------------
+    def _candidate_paths(self, key: str) -> List[tuple[str, Path]]:
+        stem = Path(self.model_files[key]).stem
+        return [
+            ('lightgbm_text', self.model_dir / f'{stem}.txt'),
+            ('joblib', self.model_dir / self.model_files[key]),
+        ]
+
+    def _resolve_path(self, key: str) -> tuple[Optional[str], Optional[Path]]:
+        for fmt, path in self._candidate_paths(key):
+            if path.exists():
+                return fmt, path
+        return None, None
+
+    @staticmethod
+    def _load_file(fmt: str, path: Path):
+        if fmt == 'lightgbm_text':
+            import lightgbm
+
+            return lightgbm.Booster(model_file=str(path))
+        import joblib
+
+        return joblib.load(path)
+
+    @staticmethod
+    def _hash_file(path: Path, digest) -> None:
+        with open(path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+    # --- loading -----------------------------------------------------------
+    @property
+    def is_loaded(self) -> bool:
+        return bool(self.models)
+
+    def load(self, force: bool = False) -> bool:
+        """Load all models; returns ``True`` when the required ones are ready.
+
+        A forced reload that fails keeps serving the previously loaded models
+        but still returns ``False`` and records ``last_error``.
+        """
+        with self._lock:
+            if self.models and not force:
+                return True
+            if (
+                not force
+                and self.last_error
+                and self._last_attempt is not None
+                and time.monotonic() - self._last_attempt < self.retry_interval
+            ):
+                return False
+            return self._load_locked()
+
+    def _load_locked(self) -> bool:
+        self._last_attempt = time.monotonic()
+        warnings: List[str] = []
+
+        if importlib.util.find_spec('lightgbm') is None:  # pragma: no cover - 需實際環境才會觸發
+            self.last_error = "LightGBM 套件未安裝"
+            return False
+
+        loaded: Dict[str, Any] = {}
+        formats: Dict[str, str] = {}
+        digest = hashlib.sha256()
+        try:
+            for key in self.model_files:
+                fmt, path = self._resolve_path(key)
+                if path is None:
+                    if key in self.required:
+                        self.last_error = f"找不到主要模型檔案 {self.model_files[key]}"
+                        return False
+                    warnings.append(f"量化模型檔案 {self.model_files[key]} 不存在")
+                    continue
+                loaded[key] = self._load_file(fmt, path)
+                formats[key] = fmt
+                digest.update(f'{key}:{fmt}:'.encode('utf-8'))
+                self._hash_file(path, digest)
+        except Exception as exc:  # pragma: no cover - 需實際模型才會觸發
+            self.last_error = f"載入 LightGBM 模型失敗: {exc}"
+            return False
+
+        self.models = loaded
+        self.formats = formats
+        self.version = digest.hexdigest()[:16]
+        self.loaded_at = time.time()
+        self.last_error = None
+        self.warnings = warnings
+        return True
+
+    def preload(self, logger=None) -> bool:
+        """Eagerly load the models at startup, logging instead of raising."""
+        ready = self.load()
+        if logger is not None:
+            if ready:
+                logger.info("LightGBM models preloaded (version %s)", self.version)
+            else:
+                logger.warning("LightGBM model preload skipped: %s", self.last_error)
+        return ready
+
+    # --- cross-process reload ----------------------------------------------
+    def publish_reload(self, redis_client) -> bool:
+        """Force a reload here and, when it succeeds, ask other workers to follow."""
+        if not self.load(force=True):
+            return False
+        generation = redis_client.incr(RELOAD_GENERATION_KEY)
+        self._generation = str(generation)
+        self._generation_checked_at = time.monotonic()
+        return True
+
+    def sync_generation(self, redis_client) -> bool:
+        """Reload when another worker published a reload; checked at most every N seconds."""
+        now = time.monotonic()
+        if now - self._generation_checked_at < self.generation_check_interval:
+            return False
+        self._generation_checked_at = now
+        try:
+            generation = str(redis_client.get(RELOAD_GENERATION_KEY) or 0)
+        except Exception:  # pragma: no cover - Redis 失效時維持現有模型
+            return False
+        if self._generation is None:
+            self._generation = generation
+            return False
+        if generation == self._generation:
+            return False
+        self._generation = generation
+        self.load(force=True)
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'loaded': self.is_loaded,
+            'version': self.version,
+            'formats': dict(self.formats),
+            'models': sorted(self.models),
+            'loaded_at': self.loaded_at,
+            'error': self.last_error,
+            'warnings': list(self.warnings),
+        }
@@ -1,20 +1,64 @@
-"""A minimal RQ-like queue implementation for demo and tests."""
+"""A minimal RQ-like queue implementation for demo and tests.
+
+Without a connection jobs live in process memory. With a Redis connection
+each job is stored as a JSON record (import path of the function, arguments,
+status) and its id is pushed onto a Redis list, so the web processes that
+enqueue and the ``run_worker.py`` process that drains the queue share the
+same jobs and job status.
+"""
 from __future__ import annotations
 
+import importlib
+import json
+import logging
 import time
 import uuid
 from collections import deque
 from typing import Any, Deque, Dict, Optional
 
+LOGGER = logging.getLogger(__name__)
+
+# Finished and failed job records stay readable for a day, like RQ's result TTL.
+JOB_TTL_SECONDS = 24 * 60 * 60
+
+
+def _import_path(func) -> str:
+    qualname = getattr(func, "__qualname__", "")
+    if not qualname or "<" in qualname:
+        raise ValueError(f"{func!r} is not importable and cannot be queued through Redis")
+    return f"{func.__module__}:{qualname}"
+
+
+def _resolve(path: str):
+    module_name, _, qualname = path.partition(":")
+    target: Any = importlib.import_module(module_name)
+    for attribute in qualname.split("."):
+        target = getattr(target, attribute)
+    return target
+
 
 class SimpleJob:
-    def __init__(self, func, args: tuple[Any, ...], kwargs: dict[str, Any], description: Optional[str]):
-        self.id = uuid.uuid4().hex
+    def __init__(
+        self,
+        func,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+        description: Optional[str],
+        job_id: Optional[str] = None,
+        queue: Optional["SimpleQueue"] = None,
+        status: str = "queued",
+        enqueued_at: Optional[float] = None,
+        error: Optional[str] = None,
+    ):
+        self.id = job_id or uuid.uuid4().hex
         self.func = func
         self.args = args
         self.kwargs = kwargs
         self.description = description
-        self.enqueued_at = time.time()
+        self.enqueued_at = enqueued_at or time.time()
+        self.status = status
+        self.error = error
+        self._queue = queue
         self._result: Any = None
 
     @property
@@ -22,9 +66,33 @@ class SimpleJob:
         return f"{self.func.__module__}.{self.func.__name__}"
 
     def perform(self) -> Any:
-        self._result = self.func(*self.args, **self.kwargs)
+        self._set_status("started")
+        try:
+            self._result = self.func(*self.args, **self.kwargs)
+        except Exception as exc:
+            self._set_status("failed", error=f"{type(exc).__name__}: {exc}")
+            raise
+        self._set_status("finished")
         return self._result
 
+    def _set_status(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        if self._queue is not None:
+            self._queue._save(self)
+
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "func": _import_path(self.func),
+            "args": list(self.args),
+            "kwargs": self.kwargs,
+            "description": self.description,
+            "status": self.status,
+            "enqueued_at": self.enqueued_at,
+            "error": self.error,
+        }
+
 
 class SimpleQueue:
     def __init__(self, name: str = "default", connection: Any = None):
@@ -33,33 +101,97 @@ class SimpleQueue:
         self._jobs: Dict[str, SimpleJob] = {}
         self._pending: Deque[str] = deque()
 
-    def enqueue(self, func, *args, description: Optional[str] = None, **kwargs) -> SimpleJob:
-        job = SimpleJob(func, args, kwargs, description)
-        self._jobs[job.id] = job
-        self._pending.append(job.id)
+    @property
+    def pending_key(self) -> str:
+        return f"simple-queue:{self.name}:pending"
+
+    def job_key(self, job_id: str) -> str:
+        return f"simple-queue:{self.name}:job:{job_id}"
+
+    def enqueue(
+        self,
+        func,
+        *args,
+        description: Optional[str] = None,
+        job_id: Optional[str] = None,
+        **kwargs,
+    ) -> SimpleJob:
+        if self.connection is None:
+            job = SimpleJob(func, args, kwargs, description, job_id=job_id)
+            self._jobs[job.id] = job
+            self._pending.append(job.id)
+            return job
+
+        job = SimpleJob(func, args, kwargs, description, job_id=job_id, queue=self)
+        self._save(job)
+        self.connection.rpush(self.pending_key, job.id)
         return job
 
     def fetch_job(self, job_id: str) -> Optional[SimpleJob]:
-        return self._jobs.get(job_id)
+        if self.connection is None:
+            return self._jobs.get(job_id)
+        raw = self.connection.get(self.job_key(job_id))
+        if raw is None:
+            return None
+        record = json.loads(raw)
+        return SimpleJob(
+            _resolve(record["func"]),
+            tuple(record["args"]),
+            record["kwargs"],
+            record["description"],
+            job_id=record["id"],
+            queue=self,
+            status=record["status"],
+            enqueued_at=record["enqueued_at"],
+            error=record.get("error"),
+        )
 
     def pop_job(self) -> Optional[SimpleJob]:
-        if not self._pending:
-            return None
-        job_id = self._pending.popleft()
-        return self._jobs.get(job_id)
+        if self.connection is None:
+            if not self._pending:
+                return None
+            job_id = self._pending.popleft()
+            return self._jobs.get(job_id)
+
+        while True:
+            job_id = self.connection.lpop(self.pending_key)
+            if job_id is None:
+                return None
+            job = self.fetch_job(job_id)
+            if job is not None:  # expired records are skipped
+                return job
+
+    def _save(self, job: SimpleJob) -> None:
+        if self.connection is None:
+            return
+        self.connection.set(self.job_key(job.id), json.dumps(job.to_record()), ex=JOB_TTL_SECONDS)
 
 
 class SimpleWorker:
-    def __init__(self, queue: SimpleQueue, sleep: float = 1.0):
+    def __init__(self, queue: SimpleQueue, sleep: float = 1.0, app: Any = None):
         self.queue = queue
         self.sleep = sleep
+        # With a Flask app each job runs in its own app context, so the
+        # database session is torn down between jobs.
+        self.app = app
 
     def work(self, burst: bool = False) -> None:
         while True:
             job = self.queue.pop_job()
             if job:
-                job.perform()
+                self.execute(job)
                 continue
             if burst:
                 break
             time.sleep(self.sleep)
+
+    def execute(self, job: SimpleJob) -> None:
+        try:
+            if self.app is None:
+                job.perform()
+            else:
+                with self.app.app_context():
+                    job.perform()
+        except Exception:
+            # A failing job is recorded on the job and must not stop the worker.
+            LOGGER.exception("Job %s (%s) failed", job.id, job.func_name)
@@ -1,6 +1,7 @@
 """背景任務與工作隊列工具"""
 from __future__ import annotations
 
+import uuid
 from typing import Any, Dict
 
 from flask import current_app
@@ -66,3 +67,111 @@ def enqueue_verifiable_log_verification():
         verify_verifiable_log_chain,
         description='Verify verifiable ledger chain integrity',
     )
+
+
+def run_batch_growth_prediction(user_id: int, batch_id: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """背景任務：批次計算羊隻生長預測並將結果寫入 Redis。"""
+
+    from app.api.prediction import compute_batch_predictions  # 避免循環匯入
+    from app.cache import set_prediction_batch_result
+
+    # API 金鑰不隨任務參數寫入 Redis，執行時改用伺服器設定的金鑰
+    api_key = current_app.config.get('GOOGLE_API_KEY') if options.get('include_ai_analysis') else None
+    result = compute_batch_predictions(user_id, **options, api_key=api_key)
+    if options.get('include_ai_analysis') and not api_key:
+        result['ai_error'] = '伺服器未設定 GOOGLE_API_KEY，背景任務未產生 AI 分析'
+    set_prediction_batch_result(batch_id, user_id, result)
+    current_app.logger.info(
+        'Batch growth prediction %s finished — %s/%s succeeded',
+        batch_id,
+        result['succeeded'],
+        result['requested'],
+    )
+    return result
+
+
+def enqueue_batch_growth_prediction(user_id: int, options: Dict[str, Any]):
+    """將批次生長預測排入背景任務。"""
+
+    queue = get_task_queue()
+    batch_id = uuid.uuid4().hex
+    return queue.enqueue(
+        run_batch_growth_prediction,
+        user_id,
+        batch_id,
+        options,
+        job_id=batch_id,
+        description=f'Batch growth prediction for user {user_id}',
+    )
+
+
+def refresh_dashboard_cache(user_id: int) -> None:
+    """背景任務：重算儀表板並寫回快取（由過期快取觸發）。"""
+
+    from app.cache import get_dashboard_state_generation, release_cache_refresh, set_dashboard_cache  # 避免循環匯入
+    from app.services.dashboard_aggregates import load_dashboard
+
+    try:
+        generation = get_dashboard_state_generation(user_id)
+        set_dashboard_cache(user_id, load_dashboard(user_id), generation)
+    finally:
+        release_cache_refresh(f'dashboard:{user_id}')
+
+
+def enqueue_dashboard_cache_refresh(user_id: int):
+    """將儀表板快取刷新排入背景任務。"""
+
+    queue = get_task_queue()
+    return queue.enqueue(
+        refresh_dashboard_cache,
+        user_id,
+        description=f'Refresh dashboard cache for user {user_id}',
+    )
+
+
+def refresh_farm_report_cache(user_id: int) -> None:
+    """背景任務：重算牧場報告並寫回快取。"""
+
+    from app.api.dashboard import build_farm_report  # 避免循環匯入
+    from app.cache import release_cache_refresh, set_farm_report_cache
+
+    try:
+        set_farm_report_cache(user_id, build_farm_report(user_id))
+    finally:
+        release_cache_refresh(f'farm-report:{user_id}')
+
+
+def enqueue_farm_report_cache_refresh(user_id: int):
+    """將牧場報告快取刷新排入背景任務。"""
+
+    queue = get_task_queue()
+    return queue.enqueue(
+        refresh_farm_report_cache,
+        user_id,
+        description=f'Refresh farm report cache for user {user_id}',
+    )
+
+
+def refresh_bi_cache(user_id: int, payload: Dict[str, Any], generation: str) -> None:
+    """背景任務：依原始查詢重算 BI 結果，寫回排入時的資料世代。"""
+
+    from app.api.bi import compute_bi_response  # 避免循環匯入
+    from app.cache import bi_cache_name, release_cache_refresh, set_bi_cache
+
+    try:
+        set_bi_cache(user_id, payload, compute_bi_response(user_id, payload), generation)
+    finally:
+        release_cache_refresh(bi_cache_name(user_id, payload, generation))
+
+
+def enqueue_bi_cache_refresh(user_id: int, payload: Dict[str, Any], generation: str):
+    """將 BI 快取刷新排入背景任務。"""
+
+    queue = get_task_queue()
+    return queue.enqueue(
+        refresh_bi_cache,
+        user_id,
+        payload,
+        generation,
+        description=f"Refresh BI {payload.get('endpoint')} cache for user {user_id}",
+    )
@@ -3,13 +3,18 @@ from datetime import date, datetime
 from typing import Any
 
 from flask import current_app
+from sqlalchemy import func
 
+from . import db
+from .cache import get_sheep_context_cache, set_sheep_context_cache
 from .models import Sheep, SheepEvent, SheepHistoricalData
 from .ai.genai_client import (
     GenAIClientError,
     GenAIPromptBlocked,
     GenAIResponse,
     generate_content,
+    generate_content_many,
+    stream_content,
 )
 
 
@@ -26,8 +31,12 @@ def normalise_json_payload(value: Any) -> Any:
         return {str(key): normalise_json_payload(val) for key, val in value.items()}
     return value
 
-def call_gemini_api(prompt_text, api_key, generation_config_override=None, safety_settings_override=None):
-    """通用 Gemini API 調用函數 (基於 google-genai SDK)。"""
+def call_gemini_api(prompt_text, api_key, generation_config_override=None, safety_settings_override=None, cache_policy=None):
+    """通用 Gemini API 調用函數 (基於 google-genai SDK)。
+
+    ``cache_policy`` 為回應快取策略名稱（見 ``app.ai.response_cache``），僅適用於結果可重用的提示詞；
+    命中快取時回傳值會帶 ``cached: True``。
+    """
 
     try:
         response: GenAIResponse = generate_content(
@@ -35,45 +44,159 @@ def call_gemini_api(prompt_text, api_key, generation_config_override=None, safet
             api_key=api_key,
             generation_config_override=generation_config_override,
             safety_settings_override=safety_settings_override,
+            cache_policy=cache_policy,
         )
-        finish_reason = response.finish_reason or "UNKNOWN"
-        return {"text": response.text, "finish_reason": finish_reason}
-    except GenAIPromptBlocked as exc:
+        return _gemini_result(response)
+    except GenAIClientError as exc:
+        return _gemini_error(exc)
+    except Exception as exc:  # pragma: no cover - defensive logging
+        current_app.logger.error("處理 API 請求時發生未知錯誤", exc_info=True)
+        return {"error": f"處理 API 請求時發生未知錯誤: {exc}"}
+
+
+def call_gemini_api_many(prompts, api_key, generation_config_override=None, safety_settings_override=None,
+                         cache_policy=None, max_concurrency=None):
+    """並行呼叫多個 Gemini 提示詞（同時進行數量受 ``max_concurrency`` 限制）。
+
+    回傳與 ``prompts`` 順序相同的清單，每一項的格式與 :func:`call_gemini_api` 相同；
+    單一提示詞失敗只會讓該項帶有 ``error``，不影響其他項目。
+    """
+
+    try:
+        responses = generate_content_many(
+            list(prompts),
+            max_concurrency=max_concurrency,
+            api_key=api_key,
+            generation_config_override=generation_config_override,
+            safety_settings_override=safety_settings_override,
+            cache_policy=cache_policy,
+        )
+    except GenAIClientError as exc:
+        return [_gemini_error(exc) for _ in prompts]
+    except Exception as exc:  # pragma: no cover - defensive logging
+        current_app.logger.error("處理並行 API 請求時發生未知錯誤", exc_info=True)
+        return [{"error": f"處理 API 請求時發生未知錯誤: {exc}"} for _ in prompts]
+    return [
+        _gemini_error(response) if isinstance(response, GenAIClientError) else _gemini_result(response)
+        for response in responses
+    ]
+
+
+def _gemini_result(response: GenAIResponse) -> dict:
+    finish_reason = response.finish_reason or "UNKNOWN"
+    return {"text": response.text, "finish_reason": finish_reason, "cached": response.cached}
+
+
+def _gemini_error(exc: GenAIClientError) -> dict:
+    if isinstance(exc, GenAIPromptBlocked):
         ratings = [rating.model_dump(mode="json") for rating in exc.safety_ratings]
         return {
             "error": f"提示詞被拒絕。原因：{exc.block_reason}。安全評級: {ratings}",
         }
+    return {"error": str(exc)}
+
+
+def stream_gemini_api(prompt_text, api_key, generation_config_override=None, safety_settings_override=None):
+    """串流版 Gemini API 調用：逐段產出 ``{"text": 片段}``，失敗時產出一次 ``{"error": 訊息}`` 後結束。"""
+
+    try:
+        for fragment in stream_content(
+            prompt_text,
+            api_key=api_key,
+            generation_config_override=generation_config_override,
+            safety_settings_override=safety_settings_override,
+        ):
+            yield {"text": fragment}
     except GenAIClientError as exc:
-        return {"error": str(exc)}
+        yield _gemini_error(exc)
     except Exception as exc:  # pragma: no cover - defensive logging
-        current_app.logger.error("處理 API 請求時發生未知錯誤", exc_info=True)
-        return {"error": f"處理 API 請求時發生未知錯誤: {exc}"}
+        current_app.logger.error("處理串流 API 請求時發生未知錯誤", exc_info=True)
+        yield {"error": f"處理 API 請求時發生未知錯誤: {exc}"}
+
+
+SHEEP_CONTEXT_EVENT_LIMIT = 5
+SHEEP_CONTEXT_HISTORY_LIMIT = 10
+
+
+def _latest_rows_per_sheep(model, sheep_ids, order_by, limit, *criteria):
+    """以視窗函數一次查出每隻羊最新的 ``limit`` 筆記錄，依羊隻 id 分組回傳。"""
+    row_number = func.row_number().over(partition_by=model.sheep_id, order_by=order_by).label('row_number')
+    ranked = (
+        db.session.query(model.id.label('id'), row_number)
+        .filter(model.sheep_id.in_(sheep_ids), *criteria)
+        .subquery()
+    )
+    rows = (
+        model.query.join(ranked, model.id == ranked.c.id)
+        .filter(ranked.c.row_number <= limit)
+        .order_by(model.sheep_id, ranked.c.row_number)
+        .all()
+    )
+    grouped = {sheep_id: [] for sheep_id in sheep_ids}
+    for row in rows:
+        grouped[row.sheep_id].append(row.to_dict())
+    return grouped
+
+
+def _load_sheep_contexts(ear_nums, user_id):
+    sheep_rows = Sheep.query.filter(Sheep.user_id == user_id, Sheep.EarNum.in_(ear_nums)).all()
+    if not sheep_rows:
+        return {}
+    sheep_ids = [sheep.id for sheep in sheep_rows]
+    events = _latest_rows_per_sheep(
+        SheepEvent, sheep_ids, (SheepEvent.event_date.desc(), SheepEvent.id.desc()), SHEEP_CONTEXT_EVENT_LIMIT
+    )
+    history = _latest_rows_per_sheep(
+        SheepHistoricalData,
+        sheep_ids,
+        (SheepHistoricalData.record_date.desc(), SheepHistoricalData.id.desc()),
+        SHEEP_CONTEXT_HISTORY_LIMIT,
+        SheepHistoricalData.user_id == user_id,
+    )
+    contexts = {}
+    for sheep in sheep_rows:
+        sheep_dict = sheep.to_dict()
+        sheep_dict['recent_events'] = events[sheep.id]
+        sheep_dict['history_records'] = history[sheep.id]
+        contexts[sheep.EarNum] = normalise_json_payload(sheep_dict)
+    return contexts
+
+
+def get_sheep_info_for_contexts(ear_nums, user_id):
+    """
+    批次獲取多隻羊的背景資訊，回傳 ``{耳號: 資訊}``，找不到的耳號不會出現在結果中。
+
+    先讀 Redis 中依耳號版本化的快照，未命中的羊隻以固定三次查詢一併載入後回填快取；
+    快取不可用時直接查詢資料庫。
+    """
+    ear_nums = [ear_num for ear_num in dict.fromkeys(ear_nums or []) if ear_num]
+    if not ear_nums:
+        return {}
+
+    try:
+        contexts, cache_keys = get_sheep_context_cache(user_id, ear_nums)
+    except Exception as exc:  # pragma: no cover - 快取失敗時退回資料庫
+        current_app.logger.warning(f"讀取羊隻背景快取失敗: {exc}")
+        contexts, cache_keys = {}, {}
+
+    missing = [ear_num for ear_num in ear_nums if ear_num not in contexts]
+    if missing:
+        loaded = _load_sheep_contexts(missing, user_id)
+        contexts.update(loaded)
+        if loaded and cache_keys:
+            try:
+                set_sheep_context_cache(cache_keys, loaded)
+            except Exception as exc:  # pragma: no cover - 快取失敗不影響回應
+                current_app.logger.warning(f"寫入羊隻背景快取失敗: {exc}")
+    return contexts
 
 
 def get_sheep_info_for_context(ear_num, user_id):
     """
-    獲取指定羊隻的資訊，用於組合AI提示詞。
+    獲取指定羊隻的資訊（含最近 5 筆事件與 10 筆歷史數據），用於組合AI提示詞。
     """
     if not ear_num: return None
-    
-    sheep_info = Sheep.query.filter_by(EarNum=ear_num, user_id=user_id).first()
-    if not sheep_info: return None
-    
-    sheep_dict = sheep_info.to_dict()
-    
-    # 獲取最近的5條事件記錄
-    recent_events = SheepEvent.query.filter_by(sheep_id=sheep_info.id)\
-        .order_by(SheepEvent.event_date.desc(), SheepEvent.id.desc())\
-        .limit(5).all()
-    sheep_dict['recent_events'] = [event.to_dict() for event in recent_events]
-    
-    # 獲取最近的10條歷史數據
-    history_records = SheepHistoricalData.query.filter_by(
-        sheep_id=sheep_info.id, user_id=user_id
-    ).order_by(SheepHistoricalData.record_date.desc()).limit(10).all()
-    sheep_dict['history_records'] = [rec.to_dict() for rec in history_records]
-
-    return sheep_dict
+    return get_sheep_info_for_contexts([ear_num], user_id).get(ear_num)
 
 
 def encode_image_to_base64(image_data):
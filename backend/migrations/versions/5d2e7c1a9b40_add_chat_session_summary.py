@@ -0,0 +1,29 @@
+"""add chat session summary table and chat history window index"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5d2e7c1a9b40'
+down_revision = '2b8b37a5c8f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'chat_session_summary',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+        sa.Column('session_id', sa.String(length=100), nullable=False),
+        sa.Column('summary', sa.Text(), nullable=False),
+        sa.Column('summarized_through_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'session_id', name='uq_chat_session_summary_user_session'),
+    )
+    op.create_index('ix_chat_history_user_session_id', 'chat_history', ['user_id', 'session_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_history_user_session_id', table_name='chat_history')
+    op.drop_table('chat_session_summary')
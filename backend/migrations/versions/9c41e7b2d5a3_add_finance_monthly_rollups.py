@@ -0,0 +1,48 @@
+"""add monthly finance rollup tables"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9c41e7b2d5a3'
+down_revision = '5d2e7c1a9b40'
+branch_labels = None
+depends_on = None
+
+_TABLES = (('cost_monthly_rollup', 'cost_entry'), ('revenue_monthly_rollup', 'revenue_entry'))
+
+
+def upgrade() -> None:
+    for rollup_table, entry_table in _TABLES:
+        op.create_table(
+            rollup_table,
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('month', sa.Date(), nullable=False),
+            sa.Column('category', sa.String(length=100), nullable=False),
+            sa.Column('breed', sa.String(length=100), nullable=True),
+            sa.Column('lactation_number', sa.Integer(), nullable=True),
+            sa.Column('production_stage', sa.String(length=100), nullable=True),
+            sa.Column('total_amount', sa.Numeric(16, 2), nullable=False),
+            sa.Column('entry_count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(f'ix_{rollup_table}_user_month', rollup_table, ['user_id', 'month'], unique=False)
+
+        # 以既有明細回填彙總（與 `flask finance-rollups rebuild` 相同）
+        if op.get_bind().dialect.name == 'sqlite':
+            month = "date(recorded_at, 'start of month')"
+        else:
+            month = "CAST(date_trunc('month', recorded_at) AS DATE)"
+        op.execute(
+            f"INSERT INTO {rollup_table} "
+            "(user_id, month, category, breed, lactation_number, production_stage, total_amount, entry_count) "
+            f"SELECT user_id, {month}, category, breed, lactation_number, production_stage, SUM(amount), COUNT(id) "
+            f"FROM {entry_table} "
+            f"GROUP BY user_id, {month}, category, breed, lactation_number, production_stage"
+        )
+
+
+def downgrade() -> None:
+    for rollup_table, _ in reversed(_TABLES):
+        op.drop_index(f'ix_{rollup_table}_user_month', table_name=rollup_table)
+        op.drop_table(rollup_table)
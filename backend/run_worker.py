@@ -51,7 +51,7 @@ def main():
     app = create_app()
     with app.app_context():
         queue = app.extensions['rq_queue']
-        worker = SimpleWorker(queue)
+        worker = SimpleWorker(queue, app=app)
         _start_sensor_consumer(app)
         _start_control_consumer(app)
         worker.work()
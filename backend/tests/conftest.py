@@ -191,7 +191,7 @@ def multiple_test_sheep(app, test_user):
 @pytest.fixture
 def mock_gemini_api(monkeypatch):
     """模擬 Gemini API 調用"""
-    def mock_call_gemini_api(prompt, api_key, generation_config_override=None, safety_settings_override=None):
+    def mock_call_gemini_api(prompt, api_key, generation_config_override=None, safety_settings_override=None, cache_policy=None):
         return {
             "text": "這是模擬的 AI 回應內容。根據您提供的羊隻資料，建議每日飼料需求如下：\n\n- DMI: 1.2-1.5 kg/day\n- ME: 8.5-9.5 MJ/day\n- CP: 120-140 g/day"
         }
@@ -200,6 +200,10 @@ def mock_gemini_api(monkeypatch):
     monkeypatch.setattr('app.utils.call_gemini_api', mock_call_gemini_api)
     monkeypatch.setattr('app.api.agent.call_gemini_api', mock_call_gemini_api)
     monkeypatch.setattr('app.api.prediction.call_gemini_api', mock_call_gemini_api)
+    monkeypatch.setattr(
+        'app.api.prediction.call_gemini_api_many',
+        lambda prompts, api_key, **kwargs: [mock_call_gemini_api(prompt, api_key) for prompt in prompts],
+    )
     monkeypatch.setattr('app.api.data_management.call_gemini_api', mock_call_gemini_api)
     monkeypatch.setattr('app.api.agent.rag_query', lambda *args, **kwargs: [])
     return mock_call_gemini_api
@@ -208,11 +212,15 @@ def mock_gemini_api(monkeypatch):
 @pytest.fixture
 def mock_gemini_api_error(monkeypatch):
     """模擬 Gemini API 錯誤"""
-    def mock_call_gemini_api_error(prompt, api_key, generation_config_override=None):
+    def mock_call_gemini_api_error(prompt, api_key, generation_config_override=None, cache_policy=None):
         return {"error": "API 調用失敗"}
     
     monkeypatch.setattr('app.utils.call_gemini_api', mock_call_gemini_api_error)
     monkeypatch.setattr('app.api.prediction.call_gemini_api', mock_call_gemini_api_error)
+    monkeypatch.setattr(
+        'app.api.prediction.call_gemini_api_many',
+        lambda prompts, api_key, **kwargs: [mock_call_gemini_api_error(prompt, api_key) for prompt in prompts],
+    )
     monkeypatch.setattr('app.api.data_management.call_gemini_api', mock_call_gemini_api_error)
     monkeypatch.setattr('app.api.agent.rag_query', lambda *args, **kwargs: [])
     return mock_call_gemini_api_error
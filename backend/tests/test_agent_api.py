@@ -317,3 +317,92 @@ class TestAgentAPI:
         data = json.loads(response.data)
         assert 'field_errors' in data
         assert field in data['field_errors']
+
+
+def _parse_sse(body: bytes) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.decode('utf-8').strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class TestAgentStreaming:
+    """SSE 串流端點測試"""
+
+    @pytest.fixture
+    def stream_fragments(self, monkeypatch):
+        calls = []
+
+        def fake_stream(prompt, api_key, generation_config_override=None, safety_settings_override=None):
+            calls.append(prompt)
+            for fragment in ['## 飼養建議\n', '- 保持**通風**', '<script>alert(1)</script>']:
+                yield {'text': fragment}
+
+        monkeypatch.setattr('app.api.agent.stream_gemini_api', fake_stream)
+        monkeypatch.setattr('app.api.agent.rag_query', lambda *args, **kwargs: [])
+        return calls
+
+    def test_chat_stream_emits_deltas_and_persists_history(self, authenticated_client, stream_fragments):
+        response = authenticated_client.post('/api/agent/chat/stream', json={
+            'api_key': 'test-api-key',
+            'message': '串流測試',
+            'session_id': 'stream-session-001',
+        })
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        assert response.headers['X-Accel-Buffering'] == 'no'
+
+        events = _parse_sse(response.data)
+        assert [name for name, _ in events] == ['delta', 'delta', 'delta', 'done']
+        assert events[2][1]['markdown'] == '&lt;script>alert(1)&lt;/script>'
+        done_html = events[-1][1]['reply_html']
+        assert '<strong>通風</strong>' in done_html
+        assert '<script>' not in done_html
+
+        entries = ChatHistory.query.filter_by(session_id='stream-session-001').order_by(ChatHistory.id).all()
+        assert [entry.role for entry in entries] == ['user', 'model']
+        assert entries[0].content == '串流測試'
+        assert entries[1].content.endswith('<script>alert(1)</script>')
+
+    def test_chat_stream_error_skips_history(self, authenticated_client, monkeypatch):
+        def failing_stream(*args, **kwargs):
+            yield {'text': '部分'}
+            yield {'error': 'API 調用失敗'}
+
+        monkeypatch.setattr('app.api.agent.stream_gemini_api', failing_stream)
+        monkeypatch.setattr('app.api.agent.rag_query', lambda *args, **kwargs: [])
+
+        response = authenticated_client.post('/api/agent/chat/stream', json={
+            'api_key': 'test-api-key',
+            'message': '串流測試',
+            'session_id': 'stream-session-002',
+        })
+
+        events = _parse_sse(response.data)
+        assert events[-1] == ('error', {'error': 'API 調用失敗'})
+        assert ChatHistory.query.filter_by(session_id='stream-session-002').count() == 0
+
+    def test_chat_stream_validation_error(self, authenticated_client, stream_fragments):
+        response = authenticated_client.post('/api/agent/chat/stream', json={
+            'api_key': 'test-api-key',
+            'message': '缺少 session',
+        })
+
+        assert response.status_code == 400
+        assert 'field_errors' in json.loads(response.data)
+        assert stream_fragments == []
+
+    def test_recommendation_stream(self, authenticated_client, stream_fragments):
+        response = authenticated_client.post('/api/agent/recommendation/stream', json={
+            'api_key': 'test-api-key',
+            'EarNum': 'STREAM001',
+            'Body_Weight_kg': 40.0,
+        })
+
+        assert response.status_code == 200
+        events = _parse_sse(response.data)
+        assert events[-1][0] == 'done'
+        assert '<h2>飼養建議</h2>' in events[-1][1]['recommendation_html']
+        assert 'STREAM001' in stream_fragments[0]
@@ -1,8 +1,11 @@
 from datetime import datetime, timedelta
 from decimal import Decimal
 
+import pytest
+
 from app import db
 from app.models import CostEntry, RevenueEntry
+from app.services.finance_rollup import apply_rollup_changes, entry_bucket
 
 
 def _create_finance_entries(user_id, sheep, days_offset=0):
@@ -29,6 +32,8 @@ def _create_finance_entries(user_id, sheep, days_offset=0):
     )
     db.session.add(cost)
     db.session.add(revenue)
+    apply_rollup_changes(CostEntry, added=[entry_bucket(cost)])
+    apply_rollup_changes(RevenueEntry, added=[entry_bucket(revenue)])
 
 
 def test_cohort_analysis_endpoint(app, authenticated_client, multiple_test_sheep):
@@ -82,3 +87,83 @@ def test_cost_benefit_endpoint(app, authenticated_client, multiple_test_sheep):
         db.session.query(CostEntry).delete()
         db.session.query(RevenueEntry).delete()
         db.session.commit()
+
+
+@pytest.mark.parametrize('time_range', [None, 'last_30_days'])
+def test_stale_bi_result_is_served_while_refreshing_in_background(
+    app, authenticated_client, multiple_test_sheep, monkeypatch, time_range
+):
+    from app.simple_queue import SimpleQueue, SimpleWorker
+
+    with app.app_context():
+        user_id = multiple_test_sheep[0].user_id
+        _create_finance_entries(user_id, multiple_test_sheep[0])
+        db.session.commit()
+
+    payload = {'group_by': 'none', 'metrics': ['total_cost', 'total_revenue', 'net_profit']}
+    if time_range:
+        # 含 datetime 的查詢也必須能序列化進 Redis 佇列
+        now = datetime.utcnow()
+        payload['time_range'] = {
+            'start': (now - timedelta(days=30)).isoformat(),
+            'end': (now + timedelta(days=1)).isoformat(),
+        }
+    monkeypatch.setattr('app.cache.BI_CACHE_TTL_SECONDS', -1)  # 寫入後立即進入過期狀態
+    first = authenticated_client.post('/api/bi/cost-benefit', json=payload).get_json()
+
+    with app.app_context():
+        _create_finance_entries(user_id, multiple_test_sheep[1])
+        db.session.commit()
+
+    for _ in range(2):
+        stale = authenticated_client.post('/api/bi/cost-benefit', json=payload).get_json()
+        assert stale == first
+
+    from app.api import bi as bi_module
+
+    refreshes = []
+    compute = bi_module.compute_bi_response
+
+    def counting_compute(*args, **kwargs):
+        refreshes.append(args[0])
+        return compute(*args, **kwargs)
+
+    monkeypatch.setattr(bi_module, 'compute_bi_response', counting_compute)
+    monkeypatch.setattr('app.cache.BI_CACHE_TTL_SECONDS', 6 * 60 * 60)
+    # 與 run_worker.py 相同：另建佇列實例，由 worker 從 Redis 取出任務執行
+    worker_queue = SimpleQueue(app.config['RQ_QUEUE_NAME'], connection=app.extensions['redis_client'])
+    SimpleWorker(worker_queue, sleep=0, app=app).work(burst=True)
+    assert refreshes == [user_id]  # 同一鍵值只排入一次
+
+    refreshed = authenticated_client.post('/api/bi/cost-benefit', json=payload).get_json()
+    assert refreshed['summary']['total_cost'] == first['summary']['total_cost'] * 2
+
+
+def test_finance_write_invalidates_cached_bi_result(authenticated_client, test_sheep):
+    payload = {'group_by': 'none', 'metrics': ['total_cost', 'total_revenue', 'net_profit']}
+    entry = {'recorded_at': '2024-03-05T08:00:00', 'category': 'feed', 'amount': 100, 'sheep_id': test_sheep.id}
+
+    authenticated_client.post('/api/finance/costs', json=entry)
+    assert authenticated_client.post('/api/bi/cost-benefit', json=payload).get_json()['summary']['total_cost'] == 100.0
+
+    created = authenticated_client.post('/api/finance/costs', json={**entry, 'amount': 50}).get_json()
+    assert authenticated_client.post('/api/bi/cost-benefit', json=payload).get_json()['summary']['total_cost'] == 150.0
+
+    authenticated_client.put(f"/api/finance/costs/{created['id']}", json={'amount': 70})
+    assert authenticated_client.post('/api/bi/cost-benefit', json=payload).get_json()['summary']['total_cost'] == 170.0
+
+    authenticated_client.delete(f"/api/finance/costs/{created['id']}")
+    assert authenticated_client.post('/api/bi/cost-benefit', json=payload).get_json()['summary']['total_cost'] == 100.0
+
+
+def test_bi_result_computed_before_a_write_is_not_cached_for_the_new_generation(app, test_user):
+    from app.cache import clear_bi_cache, get_bi_cache, get_or_compute_bi_cache
+
+    payload = {'endpoint': 'cost-benefit', 'payload': {}}
+
+    def compute_then_write():
+        clear_bi_cache(test_user.id)  # 計算期間發生寫入
+        return {'summary': 'old'}
+
+    assert get_or_compute_bi_cache(test_user.id, payload, compute_then_write) == {'summary': 'old'}
+    assert get_bi_cache(test_user.id, payload) is None
@@ -22,3 +22,120 @@ def test_dashboard_cache_roundtrip(app):
 
         clear_dashboard_cache(1)
         assert get_dashboard_cache(1) is None
+
+
+def test_prediction_cache_generation_invalidation(app):
+    from app.cache import clear_prediction_cache, get_prediction_cache, set_prediction_cache
+
+    with app.app_context():
+        current_app.extensions["redis_client"] = InMemoryRedis()
+
+        set_prediction_cache(7, 30, "abc", {"predicted_weight": 21.5})
+        assert get_prediction_cache(7, 30, "abc") == {"predicted_weight": 21.5}
+        assert get_prediction_cache(7, 60, "abc") is None
+        assert get_prediction_cache(7, 30, "other") is None
+
+        clear_prediction_cache(8)
+        assert get_prediction_cache(7, 30, "abc") == {"predicted_weight": 21.5}
+
+        clear_prediction_cache(7)
+        assert get_prediction_cache(7, 30, "abc") is None
+
+
+def _run_concurrently(app, count, target):
+    import threading
+
+    results, errors = [], []
+
+    def worker():
+        with app.app_context():
+            try:
+                results.append(target())
+            except Exception as exc:  # pragma: no cover - surfaced by the assertion below
+                errors.append(exc)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=15)
+    assert errors == []
+    return results
+
+
+def test_single_flight_coalesces_concurrent_misses(app):
+    import time
+
+    from app.cache import single_flight
+
+    store, calls = {}, []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.3)
+        store["value"] = {"answer": 42}
+        return store["value"]
+
+    results = _run_concurrently(app, 5, lambda: single_flight("test:coalesce", lambda: store.get("value"), compute))
+
+    assert len(calls) == 1
+    assert results == [{"answer": 42}] * 5
+
+
+def test_single_flight_waiter_takes_over_after_leader_failure(app):
+    import time
+
+    from app.cache import single_flight
+
+    store, calls = {}, []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        if len(calls) == 1:
+            raise RuntimeError("leader failed")
+        store["value"] = "ok"
+        return "ok"
+
+    def call():
+        try:
+            return single_flight("test:failover", lambda: store.get("value"), compute)
+        except RuntimeError:
+            return "failed"
+
+    results = _run_concurrently(app, 3, call)
+
+    assert len(calls) == 2
+    assert sorted(results) == ["failed", "ok", "ok"]
+
+
+def test_stale_dashboard_cache_is_served_and_refreshed_once(app, monkeypatch):
+    from app.cache import get_or_compute_dashboard_cache
+    from app.simple_queue import SimpleQueue, SimpleWorker
+
+    def fail():
+        raise AssertionError("stale entries must not be recomputed inline")
+
+    refreshed = []
+
+    def load_dashboard(user_id):
+        refreshed.append(user_id)
+        return {"value": "new"}
+
+    with app.app_context():
+        monkeypatch.setattr("app.cache.CACHE_TTL_SECONDS", -1)
+        set_dashboard_cache(7, {"value": "old"})
+
+        assert get_or_compute_dashboard_cache(7, fail) == {"value": "old"}
+        assert get_or_compute_dashboard_cache(7, fail) == {"value": "old"}
+
+        monkeypatch.setattr("app.cache.CACHE_TTL_SECONDS", 90)
+        monkeypatch.setattr("app.services.dashboard_aggregates.load_dashboard", load_dashboard)
+        # 與 run_worker.py 相同：另建佇列實例，由 worker 從 Redis 取出任務執行
+        worker_queue = SimpleQueue(app.config["RQ_QUEUE_NAME"], connection=current_app.extensions["redis_client"])
+        SimpleWorker(worker_queue, sleep=0, app=app).work(burst=True)
+        assert refreshed == [7]  # 兩次過期讀取只排入一次刷新
+
+        assert get_or_compute_dashboard_cache(7, fail) == {"value": "new"}
+        # 刷新完成後釋放去重標記，下次過期可再次排入
+        assert current_app.extensions["redis_client"].get("cache-refresh:dashboard:7") is None
@@ -0,0 +1,165 @@
+import pytest
+
+from app import db
+from app.models import ChatHistory, ChatSessionSummary
+from app.services import chat_context
+
+
+@pytest.fixture
+def summaries(monkeypatch):
+    """Stub the summariser LLM call and record the prompts it receives."""
+    prompts = []
+
+    def fake_call(prompt, api_key, generation_config_override=None, **kwargs):
+        prompts.append(prompt)
+        return {"text": f"摘要#{len(prompts)}"}
+
+    monkeypatch.setattr(chat_context, "call_gemini_api", fake_call)
+    monkeypatch.setattr(chat_context, "CHAT_HISTORY_MAX_MESSAGES", 8)
+    monkeypatch.setattr(chat_context, "CHAT_HISTORY_TOKEN_BUDGET", 10_000)
+    return prompts
+
+
+def _add_turns(user_id, session_id, start, count):
+    entries = []
+    for turn in range(start, start + count):
+        entries.append(ChatHistory(user_id=user_id, session_id=session_id, role="user", content=f"問題{turn}"))
+        entries.append(ChatHistory(user_id=user_id, session_id=session_id, role="model", content=f"回答{turn}"))
+    db.session.add_all(entries)
+    db.session.commit()
+    return entries
+
+
+def _texts(contents):
+    return [content["parts"][0]["text"] for content in contents]
+
+
+def test_short_session_is_replayed_verbatim(app, test_user, summaries):
+    _add_turns(test_user.id, "s1", 1, 2)
+
+    contents = chat_context.build_chat_history(test_user.id, "s1")
+
+    assert _texts(contents) == ["問題1", "回答1", "問題2", "回答2"]
+    assert summaries == []
+
+
+def test_long_session_keeps_latest_turns_and_folds_older_ones(app, test_user, summaries):
+    entries = _add_turns(test_user.id, "s2", 1, 5)
+
+    # Building the prompt never waits on the summariser, but stays bounded.
+    assert _texts(chat_context.build_chat_history(test_user.id, "s2")) == ["問題4", "回答4", "問題5", "回答5"]
+    assert summaries == []
+
+    assert chat_context.compact_chat_history(test_user.id, "s2", "key") is True
+    texts = _texts(chat_context.build_chat_history(test_user.id, "s2"))
+
+    assert texts[0] == "[先前對話摘要]\n摘要#1"
+    assert texts[2:] == ["問題4", "回答4", "問題5", "回答5"]
+    assert "問題1" in summaries[0] and "回答3" in summaries[0]
+    assert "問題4" not in summaries[0]
+
+    row = ChatSessionSummary.query.filter_by(user_id=test_user.id, session_id="s2").one()
+    assert row.summary == "摘要#1"
+    assert row.summarized_through_id == entries[5].id
+
+
+def test_summary_is_updated_incrementally(app, test_user, summaries):
+    _add_turns(test_user.id, "s3", 1, 5)
+    chat_context.compact_chat_history(test_user.id, "s3", "key")
+
+    _add_turns(test_user.id, "s3", 6, 2)
+    assert chat_context.compact_chat_history(test_user.id, "s3", "key") is False
+    assert len(summaries) == 1  # still within the window
+
+    _add_turns(test_user.id, "s3", 8, 1)
+    assert chat_context.compact_chat_history(test_user.id, "s3", "key") is True
+    texts = _texts(chat_context.build_chat_history(test_user.id, "s3"))
+
+    assert len(summaries) == 2
+    assert "摘要#1" in summaries[1]
+    assert "問題4" in summaries[1] and "問題1" not in summaries[1]
+    assert texts[0] == "[先前對話摘要]\n摘要#2"
+    assert texts[-2:] == ["問題8", "回答8"]
+
+
+def test_token_budget_triggers_compaction(app, test_user, summaries, monkeypatch):
+    monkeypatch.setattr(chat_context, "CHAT_HISTORY_TOKEN_BUDGET", 40)
+    db.session.add_all([
+        ChatHistory(user_id=test_user.id, session_id="s4", role="user", content="長" * 30),
+        ChatHistory(user_id=test_user.id, session_id="s4", role="model", content="答" * 30),
+        ChatHistory(user_id=test_user.id, session_id="s4", role="user", content="短問題"),
+        ChatHistory(user_id=test_user.id, session_id="s4", role="model", content="短回答"),
+    ])
+    db.session.commit()
+
+    assert _texts(chat_context.build_chat_history(test_user.id, "s4")) == ["短問題", "短回答"]
+    assert chat_context.compact_chat_history(test_user.id, "s4", "key") is True
+    assert len(summaries) == 1
+
+
+def test_failed_summary_keeps_turns_until_a_summary_succeeds(app, test_user, summaries, monkeypatch):
+    fake_call = chat_context.call_gemini_api
+    monkeypatch.setattr(chat_context, "call_gemini_api", lambda *args, **kwargs: {"error": "API 調用失敗"})
+    _add_turns(test_user.id, "s5", 1, 5)
+
+    assert chat_context.compact_chat_history(test_user.id, "s5", "key") is False
+    assert _texts(chat_context.build_chat_history(test_user.id, "s5")) == ["問題4", "回答4", "問題5", "回答5"]
+    assert ChatSessionSummary.query.filter_by(session_id="s5").count() == 0
+
+    _add_turns(test_user.id, "s5", 6, 1)
+    monkeypatch.setattr(chat_context, "call_gemini_api", fake_call)
+    assert chat_context.compact_chat_history(test_user.id, "s5", "key") is True
+
+    # The retry folds every turn the failed attempt left unsummarised.
+    assert "問題1" in summaries[0] and "回答4" in summaries[0]
+    assert _texts(chat_context.build_chat_history(test_user.id, "s5"))[2:] == ["問題5", "回答5", "問題6", "回答6"]
+
+
+def test_recorded_exchange_extends_cached_prefix(app, test_user, summaries, monkeypatch):
+    _add_turns(test_user.id, "s6", 1, 1)
+    chat_context.build_chat_history(test_user.id, "s6")
+
+    entries = _add_turns(test_user.id, "s6", 2, 1)
+    chat_context.record_chat_exchange(test_user.id, "s6", entries)
+
+    def fail_reload(*args):
+        raise AssertionError("context should come from the cache")
+
+    monkeypatch.setattr(chat_context, "_load_from_db", fail_reload)
+    assert _texts(chat_context.build_chat_history(test_user.id, "s6")) == ["問題1", "回答1", "問題2", "回答2"]
+
+
+def test_stale_cache_is_rebuilt(app, test_user, summaries):
+    _add_turns(test_user.id, "s7", 1, 1)
+    chat_context.build_chat_history(test_user.id, "s7")
+
+    _add_turns(test_user.id, "s7", 2, 1)  # written without record_chat_exchange
+
+    texts = _texts(chat_context.build_chat_history(test_user.id, "s7"))
+    assert texts == ["問題1", "回答1", "問題2", "回答2"]
+
+
+def test_chat_endpoint_sends_latest_history(authenticated_client, test_user, summaries, monkeypatch):
+    _add_turns(test_user.id, "s8", 1, 5)
+    sent = []
+
+    def fake_chat_call(prompt, api_key, generation_config_override=None, **kwargs):
+        sent.append(prompt)
+        assert summaries == [], "the summary must not run before the reply"
+        return {"text": "好的"}
+
+    monkeypatch.setattr("app.api.agent.call_gemini_api", fake_chat_call)
+    monkeypatch.setattr("app.api.agent.rag_query", lambda *args, **kwargs: [])
+
+    response = authenticated_client.post(
+        "/api/agent/chat", json={"api_key": "key", "message": "新問題", "session_id": "s8"}
+    )
+
+    assert response.status_code == 200
+    texts = [content["parts"][0]["text"] for content in sent[0]]
+    assert "問題5" in texts and "問題1" not in texts
+    assert texts[-1] == "新問題"
+
+    response.close()  # the summary runs once the response has been sent
+    assert len(summaries) == 1 and "新問題" not in summaries[0]
+    assert ChatSessionSummary.query.filter_by(user_id=test_user.id, session_id="s8").count() == 1
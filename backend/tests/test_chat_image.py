@@ -0,0 +1,115 @@
+import io
+
+from PIL import Image
+
+from app.ai import genai_client
+from app.services import chat_image
+
+
+def _encode(image, format):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def _gradient(width, height, mode="RGB"):
+    image = Image.linear_gradient("L").resize((width, height))
+    return image.convert(mode)
+
+
+def test_read_upload_stops_after_limit():
+    assert chat_image.read_upload(io.BytesIO(b"x" * 10), max_bytes=10) == b"x" * 10
+    assert chat_image.read_upload(io.BytesIO(b"x" * 11), max_bytes=10) is None
+
+
+def test_small_image_is_forwarded_untouched():
+    data = _encode(_gradient(200, 100), "JPEG")
+
+    prepared, mime_type = chat_image.prepare_image(data, "image/jpeg")
+
+    assert prepared is data
+    assert mime_type == "image/jpeg"
+
+
+def test_large_photo_is_downscaled(monkeypatch):
+    monkeypatch.setattr(chat_image, "CHAT_IMAGE_MAX_DIMENSION", 512)
+    data = _encode(_gradient(2400, 1600), "JPEG")
+
+    prepared, mime_type = chat_image.prepare_image(data, "image/jpeg")
+
+    assert mime_type == "image/jpeg"
+    assert len(prepared) < len(data)
+    with Image.open(io.BytesIO(prepared)) as image:
+        assert max(image.size) == 512
+
+
+def test_transparent_png_keeps_alpha(monkeypatch):
+    monkeypatch.setattr(chat_image, "CHAT_IMAGE_MAX_DIMENSION", 256)
+    data = _encode(_gradient(1200, 800, "RGBA"), "PNG")
+
+    prepared, mime_type = chat_image.prepare_image(data, "image/png")
+
+    assert mime_type == "image/png"
+    with Image.open(io.BytesIO(prepared)) as image:
+        assert image.mode == "RGBA"
+        assert max(image.size) == 256
+
+
+def test_unreadable_image_is_sent_as_is():
+    data = b"not really an image" * 100_000
+
+    assert chat_image.prepare_image(data, "image/png") == (data, "image/png")
+
+
+def test_raw_bytes_are_wrapped_without_base64():
+    data = b"\x89PNG raw bytes"
+
+    part = genai_client._normalise_part({"inline_data": {"mime_type": "image/png", "data": data}})
+
+    assert part.inline_data.data is data
+    assert part.inline_data.mime_type == "image/png"
+
+
+def test_chat_upload_passes_raw_bytes(authenticated_client, monkeypatch):
+    sent = []
+
+    def fake_chat_call(prompt, api_key, generation_config_override=None, **kwargs):
+        sent.append(prompt)
+        return {"text": "看起來很健康"}
+
+    monkeypatch.setattr("app.api.agent.call_gemini_api", fake_chat_call)
+    monkeypatch.setattr("app.api.agent.rag_query", lambda *args, **kwargs: [])
+    image_data = _encode(_gradient(64, 64), "PNG")
+
+    response = authenticated_client.post(
+        "/api/agent/chat",
+        data={
+            "api_key": "key",
+            "message": "這隻羊健康嗎？",
+            "session_id": "img-1",
+            "image": (io.BytesIO(image_data), "goat.png", "image/png"),
+        },
+        content_type="multipart/form-data",
+    )
+
+    assert response.status_code == 200
+    image_part = sent[0][-1]["parts"][-1]["inline_data"]
+    assert image_part == {"mime_type": "image/png", "data": image_data}
+
+
+def test_chat_upload_rejects_oversized_image(authenticated_client, monkeypatch):
+    monkeypatch.setattr(chat_image, "CHAT_IMAGE_MAX_BYTES", 16)
+
+    response = authenticated_client.post(
+        "/api/agent/chat",
+        data={
+            "api_key": "key",
+            "message": "看看",
+            "session_id": "img-2",
+            "image": (io.BytesIO(b"x" * 17), "goat.png", "image/png"),
+        },
+        content_type="multipart/form-data",
+    )
+
+    assert response.status_code == 400
+    assert "10MB" in response.get_json()["error"]
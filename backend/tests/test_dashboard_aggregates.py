@@ -0,0 +1,192 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app import db
+from app.cache import get_dashboard_state, get_dashboard_state_meta, set_dashboard_state
+from app.models import Sheep
+from app.services import dashboard_aggregates
+
+
+def _day(offset):
+    return (date.today() + timedelta(days=offset)).strftime('%Y-%m-%d')
+
+
+@pytest.fixture
+def flock(app, test_user):
+    sheep = [
+        Sheep(user_id=test_user.id, EarNum='AGG-1', status='懷孕', next_vaccination_due_date=_day(3)),
+        Sheep(user_id=test_user.id, EarNum='AGG-2', status='懷孕'),
+        Sheep(user_id=test_user.id, EarNum='AGG-3', status='泌乳中', next_deworming_due_date=_day(30)),
+    ]
+    db.session.add_all(sheep)
+    db.session.commit()
+    return {s.EarNum: s.id for s in sheep}
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Record which sheep each entry build covered (``None`` means the whole flock)."""
+    calls = []
+    original = dashboard_aggregates.build_sheep_entries
+
+    def recording_build(user_id, today, sheep_ids=None):
+        calls.append(None if sheep_ids is None else sorted(sheep_ids))
+        return original(user_id, today, sheep_ids)
+
+    monkeypatch.setattr(dashboard_aggregates, 'build_sheep_entries', recording_build)
+    return calls
+
+
+def test_first_read_builds_state_for_whole_flock(authenticated_client, test_user, flock, builds):
+    payload = authenticated_client.get('/api/dashboard/data').get_json()
+
+    assert builds == [None]
+    assert [r['ear_num'] for r in payload['reminders']] == ['AGG-1']
+    assert payload['flock_status_summary'] == [{'status': '懷孕', 'count': 2}, {'status': '泌乳中', 'count': 1}]
+    meta, entries = get_dashboard_state(test_user.id)
+    assert meta == {'as_of': date.today().isoformat()}
+    assert set(entries) == set(flock.values())
+
+
+def test_event_write_refreshes_only_that_sheep(authenticated_client, flock, builds):
+    authenticated_client.get('/api/dashboard/data')
+
+    response = authenticated_client.post('/api/sheep/AGG-2/events', json={
+        'event_date': _day(-1), 'event_type': '用藥', 'medication': '抗生素', 'withdrawal_days': 5,
+    })
+    assert response.status_code == 201
+
+    payload = authenticated_client.get('/api/dashboard/data').get_json()
+
+    assert builds == [None, [flock['AGG-2']]]
+    withdrawal = [r for r in payload['reminders'] if r['status'] == '停藥中']
+    assert withdrawal == [{'ear_num': 'AGG-2', 'type': '停藥期 (抗生素)', 'due_date': _day(4), 'status': '停藥中'}]
+
+
+def test_deleted_sheep_is_removed_from_state(authenticated_client, test_user, flock, builds):
+    authenticated_client.get('/api/dashboard/data')
+
+    assert authenticated_client.delete('/api/sheep/AGG-1').status_code == 200
+    payload = authenticated_client.get('/api/dashboard/data').get_json()
+
+    assert builds == [None, [flock['AGG-1']]]
+    assert payload['reminders'] == []
+    assert flock['AGG-1'] not in get_dashboard_state(test_user.id)[1]
+
+
+def test_state_from_previous_day_is_rebuilt(authenticated_client, test_user, flock, builds):
+    set_dashboard_state(test_user.id, {'as_of': _day(-1)}, {})
+
+    authenticated_client.put('/api/sheep/AGG-2', json={'status': '健康'})
+    assert builds == []  # stale state is not patched
+
+    payload = authenticated_client.get('/api/dashboard/data').get_json()
+
+    assert builds == [None]
+    assert {'status': '健康', 'count': 1} in payload['flock_status_summary']
+    assert get_dashboard_state_meta(test_user.id) == {'as_of': date.today().isoformat()}
+
+
+def test_rebuild_is_not_published_when_a_write_lands_meanwhile(authenticated_client, test_user, flock, monkeypatch):
+    original = dashboard_aggregates.build_sheep_entries
+    writes = []
+
+    def build_then_write(user_id, today, sheep_ids=None):
+        entries = original(user_id, today, sheep_ids)
+        if sheep_ids is None and not writes:
+            # 另一個請求在重建讀取資料後提交寫入
+            writes.append(flock['AGG-2'])
+            db.session.get(Sheep, flock['AGG-2']).status = '健康'
+            db.session.commit()
+            dashboard_aggregates.refresh_dashboard_sheep(user_id, flock['AGG-2'])
+        return entries
+
+    monkeypatch.setattr(dashboard_aggregates, 'build_sheep_entries', build_then_write)
+
+    authenticated_client.get('/api/dashboard/data')
+    assert writes and get_dashboard_state(test_user.id) is None
+
+    payload = authenticated_client.get('/api/dashboard/data').get_json()
+    assert {'status': '健康', 'count': 1} in payload['flock_status_summary']
+    assert get_dashboard_state(test_user.id)[1][flock['AGG-2']]['status'] == '健康'
+
+
+def test_assemble_applies_reminder_window_and_withdrawal_expiry():
+    today = date(2024, 5, 10)
+    entries = {
+        2: {
+            'ear_num': 'B', 'status': None, 'health_alerts': [],
+            'reminders': [{'type': '驅蟲', 'due_date': '2024-05-18'}],
+            'withdrawals': [{'type': '停藥期 (A)', 'due_date': '2024-05-09'}],
+        },
+        1: {
+            'ear_num': 'A', 'status': '懷孕', 'health_alerts': [{'ear_num': 'A', 'type': '體重下降'}],
+            'reminders': [{'type': '疫苗接種', 'due_date': '2024-05-09'}, {'type': '預產期', 'due_date': '2024-05-17'}],
+            'withdrawals': [{'type': '停藥期 (B)', 'due_date': '2024-05-10'}],
+        },
+    }
+
+    payload = dashboard_aggregates.assemble_dashboard(entries, today)
+
+    assert [(r['ear_num'], r['type'], r['status']) for r in payload['reminders']] == [
+        ('A', '疫苗接種', '已過期'),
+        ('A', '停藥期 (B)', '停藥中'),
+        ('A', '預產期', '即將到期'),
+    ]
+    assert payload['health_alerts'] == [{'ear_num': 'A', 'type': '體重下降'}]
+    assert payload['flock_status_summary'] == [{'status': '懷孕', 'count': 1}]
+
+
+def test_health_signals_are_computed_per_sheep(app, test_user):
+    from app.models import SheepHistoricalData
+
+    dropping = Sheep(user_id=test_user.id, EarNum='H-DROP', Breed='努比亞')
+    steady = Sheep(user_id=test_user.id, EarNum='H-OK', Breed='波爾', BirthDate=_day(-60))
+    milk = Sheep(user_id=test_user.id, EarNum='H-MILK')
+    db.session.add_all([dropping, steady, milk])
+    db.session.flush()
+
+    def add(sheep, record_type, offset, value):
+        db.session.add(SheepHistoricalData(
+            user_id=test_user.id, sheep_id=sheep.id, record_type=record_type, record_date=_day(offset), value=value,
+        ))
+
+    for offset, value in [(-25, 50.0), (-20, 50.0), (-10, 45.0), (-5, 44.0)]:
+        add(dropping, 'Body_Weight_kg', offset, value)
+    for offset, value in [(-28, 20.0), (-14, 23.0), (-1, 26.0), (-1, 26.2)]:
+        add(steady, 'Body_Weight_kg', offset, value)
+    for offset, value in [(-12, 4.0), (-10, 4.0), (-3, 2.0), (-2, 2.0)]:
+        add(milk, 'milk_yield_kg_day', offset, value)
+    db.session.commit()
+
+    entries = dashboard_aggregates.build_sheep_entries(test_user.id, date.today())
+    alerts = {entry['ear_num']: entry['health_alerts'] for entry in entries.values()}
+
+    assert [a['type'] for a in alerts['H-DROP']] == ['體重下降', '生長偏慢']
+    assert '下降 5.50 kg' in alerts['H-DROP'][0]['message']
+    assert '參考下限 0.08 kg/天' in alerts['H-DROP'][1]['message']
+    assert alerts['H-OK'] == []
+    assert [a['type'] for a in alerts['H-MILK']] == ['奶量變化']
+    assert '下降 2.00 kg/天' in alerts['H-MILK'][0]['message']
+
+
+def test_farm_report_is_cached_until_sheep_write(authenticated_client, flock, monkeypatch):
+    from app.api import dashboard
+
+    calls = []
+    original = dashboard.build_farm_report
+
+    def recording_report(user_id):
+        calls.append(user_id)
+        return original(user_id)
+
+    monkeypatch.setattr(dashboard, 'build_farm_report', recording_report)
+
+    assert authenticated_client.get('/api/dashboard/farm_report').get_json()['flock_composition']['total'] == 3
+    authenticated_client.get('/api/dashboard/farm_report')
+    assert len(calls) == 1
+
+    authenticated_client.delete('/api/sheep/AGG-3')
+    assert authenticated_client.get('/api/dashboard/farm_report').get_json()['flock_composition']['total'] == 2
+    assert len(calls) == 2
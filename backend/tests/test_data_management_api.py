@@ -99,7 +99,7 @@ class TestDataManagementAPI:
             {"耳號": "TEST002", "品種": "努比亞", "性別": "公"}
         ])
 
-        monkeypatch.setattr('app.api.data_management.call_gemini_api', lambda prompt, api_key, generation_config_override=None: {
+        monkeypatch.setattr('app.api.data_management.call_gemini_api', lambda prompt, api_key, generation_config_override=None, cache_policy=None: {
             "text": json.dumps({
                 "sheets": {
                     "Sheet1": {
@@ -169,7 +169,7 @@ class TestDataManagementAPI:
             {"耳號": "TEST001", "品種": "波爾"}
         ])
 
-        monkeypatch.setattr('app.api.data_management.call_gemini_api', lambda prompt, api_key, generation_config_override=None: {
+        monkeypatch.setattr('app.api.data_management.call_gemini_api', lambda prompt, api_key, generation_config_override=None, cache_policy=None: {
             "text": "這不是 JSON"
         })
 
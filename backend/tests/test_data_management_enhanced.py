@@ -349,6 +349,58 @@ class TestDataManagementEnhanced:
                 result = json.loads(response.data)
                 assert 'error' in result
 
+    def test_process_import_clears_caches_after_partial_commit(self, authenticated_client, app, test_user):
+        """測試基礎資料已提交但後續工作表失敗時，仍會清除快取"""
+        excel_content = b'\x50\x4b\x03\x04'
+
+        config = {
+            "sheets": {
+                "Basic": {
+                    "purpose": "basic_info",
+                    "columns": {"EarNum": "EarNum", "Breed": "Breed"}
+                },
+                "Kidding": {
+                    "purpose": "kidding_record",
+                    "columns": {"EarNum": "EarNum", "YeanDate": "YeanDate", "KidNum": "KidNum"}
+                }
+            }
+        }
+
+        kidding_reads = []
+
+        def mock_read_excel(xls, sheet_name, dtype):
+            df = MagicMock()
+            if sheet_name == 'Kidding':
+                kidding_reads.append(sheet_name)
+                if len(kidding_reads) > 1:  # 映射階段讀取成功，第二階段失敗
+                    raise Exception("Kidding sheet error")
+                df.where = lambda condition, other=None: df
+                df.iterrows.return_value = []
+                return df
+            df.where = lambda condition, other=None: df
+            df.iterrows.return_value = [(0, {'EarNum': 'PARTIAL001', 'Breed': '波爾羊'})]
+            return df
+
+        with patch('pandas.ExcelFile') as mock_excel, \
+                patch('pandas.read_excel', side_effect=mock_read_excel), \
+                patch('app.api.data_management.clear_bi_cache') as mock_clear_bi, \
+                patch('app.api.data_management.clear_prediction_cache') as mock_clear_prediction:
+            mock_excel.return_value.sheet_names = ['Basic', 'Kidding']
+            data = {
+                'file': (io.BytesIO(excel_content), 'partial.xlsx'),
+                'is_default_mode': 'false',
+                'mapping_config': json.dumps(config)
+            }
+            response = authenticated_client.post('/api/data/process_import',
+                                              data=data, content_type='multipart/form-data')
+
+        assert response.status_code == 500
+        with app.app_context():
+            sheep = Sheep.query.filter_by(user_id=test_user.id, EarNum='PARTIAL001').first()
+            assert sheep is not None  # 基礎資料已在失敗前提交
+            mock_clear_bi.assert_called_once_with(test_user.id)
+            mock_clear_prediction.assert_called_once_with(sheep.id)
+
     def test_process_import_with_empty_ear_num(self, authenticated_client):
         """測試導入包含空耳號的數據"""
         excel_content = b'\x50\x4b\x03\x04'
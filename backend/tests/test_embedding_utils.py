@@ -6,6 +6,13 @@ from google.genai import types as genai_types
 from app.ai import embedding
 
 
+@pytest.fixture(autouse=True)
+def _reset_query_cache():
+    embedding.clear_query_cache()
+    yield
+    embedding.clear_query_cache()
+
+
 class DummyModels:
     def __init__(self, responses):
         self._responses = list(responses)
@@ -119,7 +126,8 @@ def test_embed_documents_batches(monkeypatch):
     texts = [f"text-{i}" for i in range(embedding.BATCH_SIZE + 3)]
     vectors = embedding.embed_documents(texts)
     assert len(vectors) == len(texts)
-    assert vectors_returned == [embedding.BATCH_SIZE, 3]
+    # Batches run concurrently, so only their sizes (not call order) are deterministic.
+    assert sorted(vectors_returned, reverse=True) == [embedding.BATCH_SIZE, 3]
 
 
 def test_embed_query_requires_vector(monkeypatch):
@@ -145,3 +153,171 @@ def test_embed_no_texts_returns_empty(monkeypatch):
     monkeypatch.setenv("GOOGLE_API_KEY", "query-key")
     result = embedding.embed_documents([])
     assert result == []
+
+
+def test_embed_query_uses_memory_cache(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "query-key")
+    calls = []
+
+    def fake_perform(batch, api_key):
+        calls.append(batch[0].text)
+        return [np.array([1.0, 0.0], dtype=np.float32)]
+
+    monkeypatch.setattr(embedding, "_perform_embedding_requests", fake_perform)
+    first = embedding.embed_query("  How much  hay?\n")
+    second = embedding.embed_query("How much hay?")
+    assert calls == ["How much hay?"]
+    assert second is first
+    assert not first.flags.writeable
+    stats = embedding.get_query_cache_stats()
+    assert stats["misses"] == 1 and stats["memory_hits"] == 1
+
+
+def test_embed_query_lru_evicts_and_expires(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "query-key")
+    monkeypatch.setattr(embedding, "QUERY_CACHE_SIZE", 2)
+    monkeypatch.setattr(
+        embedding, "_perform_embedding_requests", lambda batch, api_key: [np.array([1.0], dtype=np.float32)]
+    )
+    for text in ("a", "b", "c"):
+        embedding.embed_query(text)
+    assert embedding.get_query_cache_stats()["memory_size"] == 2
+
+    embedding.embed_query("a")
+    assert embedding.get_query_cache_stats()["misses"] == 4
+
+    monkeypatch.setattr(embedding, "QUERY_CACHE_TTL", -1)
+    embedding.embed_query("d")
+    embedding.embed_query("d")
+    assert embedding.get_query_cache_stats()["misses"] == 6
+
+
+def test_embed_query_shares_vectors_through_redis(monkeypatch):
+    from app.in_memory_redis import InMemoryRedis
+
+    redis = InMemoryRedis()
+    monkeypatch.setenv("GOOGLE_API_KEY", "query-key")
+    monkeypatch.setattr(embedding, "_get_redis_client", lambda: redis)
+    vector = np.zeros(embedding.EMBEDDING_DIMENSION, dtype=np.float32)
+    vector[3] = 1.0
+    calls = []
+
+    def fake_perform(batch, api_key):
+        calls.append(batch[0].text)
+        return [vector]
+
+    monkeypatch.setattr(embedding, "_perform_embedding_requests", fake_perform)
+    embedding.embed_query("feeding schedule")
+    key = embedding._query_cache_key("feeding schedule")
+    assert embedding.EMBEDDING_MODEL in key
+    assert redis.get(key) == vector.tobytes()
+
+    embedding.clear_query_cache()  # simulate another worker with a cold LRU
+    cached = embedding.embed_query("feeding schedule")
+    np.testing.assert_array_equal(cached, vector)
+    assert calls == ["feeding schedule"]
+    assert embedding.get_query_cache_stats()["redis_hits"] == 1
+
+
+def test_embed_documents_retries_rate_limits(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "batch-key")
+    delays = []
+    monkeypatch.setattr(embedding, "_sleep", delays.append)
+    attempts = {"count": 0}
+
+    def flaky(batch, api_key):
+        attempts["count"] += 1
+        if attempts["count"] < 3:
+            raise embedding.EmbeddingError("rate limited", code=429)
+        return [np.ones(2, dtype=np.float32) for _ in batch]
+
+    monkeypatch.setattr(embedding, "_perform_embedding_requests", flaky)
+    vectors = embedding.embed_documents(["a", "b"])
+    assert len(vectors) == 2
+    assert len(delays) == 2 and delays[1] > delays[0] * 0.5
+
+    monkeypatch.setattr(
+        embedding,
+        "_perform_embedding_requests",
+        lambda batch, api_key: (_ for _ in ()).throw(embedding.EmbeddingError("forbidden", code=403)),
+    )
+    with pytest.raises(embedding.EmbeddingError):
+        embedding.embed_documents(["a"])
+
+
+def test_embed_documents_splits_oversized_batches_and_keeps_order(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "batch-key")
+
+    def picky(batch, api_key):
+        if len(batch) > 2:
+            raise embedding.EmbeddingError("payload too large", code=400)
+        return [np.array([float(item.text)], dtype=np.float32) for item in batch]
+
+    monkeypatch.setattr(embedding, "_perform_embedding_requests", picky)
+    vectors = embedding.embed_documents([str(i) for i in range(7)])
+    assert [float(v[0]) for v in vectors] == [float(i) for i in range(7)]
+
+
+def test_embed_documents_fails_fast_on_other_bad_requests(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "batch-key")
+    calls = []
+
+    def invalid(batch, api_key):
+        calls.append(len(batch))
+        raise embedding.EmbeddingError("Embedding API error 400: API key not valid", code=400)
+
+    monkeypatch.setattr(embedding, "_perform_embedding_requests", invalid)
+    with pytest.raises(embedding.EmbeddingError):
+        embedding.embed_documents([str(i) for i in range(4)], max_workers=1)
+    assert calls == [4]
+
+
+def test_embed_documents_splits_on_413(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "batch-key")
+
+    def picky(batch, api_key):
+        if len(batch) > 1:
+            raise embedding.EmbeddingError("Embedding API error 413", code=413)
+        return [np.array([float(item.text)], dtype=np.float32) for item in batch]
+
+    monkeypatch.setattr(embedding, "_perform_embedding_requests", picky)
+    vectors = embedding.embed_documents(["1", "2", "3"])
+    assert [float(v[0]) for v in vectors] == [1.0, 2.0, 3.0]
+
+
+def test_plan_batches_respects_character_budget():
+    batches = embedding._plan_batches(["x" * 40, "y" * 40, "z" * 10, "w"], max_items=3, max_chars=60)
+    assert batches == [[0], [1, 2, 3]]
+
+
+def test_embed_documents_resumes_from_checkpoints(monkeypatch, tmp_path):
+    monkeypatch.setenv("GOOGLE_API_KEY", "batch-key")
+    monkeypatch.setattr(embedding, "BATCH_SIZE", 2)
+    texts = ["a", "b", "c", "d"]
+    calls = []
+
+    def failing_second(batch, api_key):
+        calls.append([item.text for item in batch])
+        if batch[0].text == "c":
+            raise embedding.EmbeddingError("bad request", code=403)
+        return [np.full(2, ord(item.text), dtype=np.float32) for item in batch]
+
+    monkeypatch.setattr(embedding, "_perform_embedding_requests", failing_second)
+    with pytest.raises(embedding.EmbeddingError):
+        embedding.embed_documents(texts, max_workers=1, checkpoint_dir=tmp_path)
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+
+    calls.clear()
+    monkeypatch.setattr(
+        embedding,
+        "_perform_embedding_requests",
+        lambda batch, api_key: calls.append([item.text for item in batch])
+        or [np.full(2, ord(item.text), dtype=np.float32) for item in batch],
+    )
+    progress = []
+    vectors = embedding.embed_documents(
+        texts, checkpoint_dir=tmp_path, progress=lambda done, total: progress.append((done, total))
+    )
+    assert calls == [["c", "d"]]
+    assert progress == [(2, 2)]
+    assert [float(v[0]) for v in vectors] == [ord(t) for t in texts]
@@ -0,0 +1,128 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from app import db
+from app.api import bi
+from app.models import CostEntry, CostMonthlyRollup, RevenueMonthlyRollup
+from app.services.finance_rollup import full_month_window, rebuild_rollups
+
+
+def _rollup_rows(model):
+    rows = db.session.query(model).all()
+    return sorted(
+        (str(r.month), r.category, r.breed, r.lactation_number, r.production_stage, float(r.total_amount), r.entry_count)
+        for r in rows
+    )
+
+
+def _snapshot():
+    return _rollup_rows(CostMonthlyRollup), _rollup_rows(RevenueMonthlyRollup)
+
+
+@pytest.fixture
+def finance_history(authenticated_client, test_sheep):
+    costs = [
+        ('2023-11-15T08:00:00', 'feed', 100, '努比亞', 1, '泌乳期'),
+        ('2023-12-01T00:00:00', 'feed', 40, '努比亞', 1, '泌乳期'),
+        ('2023-12-20T12:30:00', 'vet', 75.5, None, None, None),
+        ('2024-01-05T09:00:00', 'feed', 60, '波爾羊', 2, '乾乳期'),
+        ('2024-01-31T23:59:59', 'feed', 25, '努比亞', 1, '泌乳期'),
+        ('2024-02-10T10:00:00', 'vet', 30, '努比亞', None, '泌乳期'),
+    ]
+    revenues = [
+        ('2023-11-20T08:00:00', 'milk', 300, '努比亞', 1, '泌乳期'),
+        ('2023-12-31T18:00:00', 'milk', 280, '努比亞', 1, '泌乳期'),
+        ('2024-01-15T09:00:00', 'kids', 500, '波爾羊', 2, None),
+        ('2024-02-01T00:00:00', 'milk', 120, None, None, None),
+    ]
+
+    def entries(rows):
+        return [
+            {
+                'recorded_at': recorded_at, 'category': category, 'amount': amount, 'breed': breed,
+                'lactation_number': lactation, 'production_stage': stage, 'sheep_id': test_sheep.id,
+            }
+            for recorded_at, category, amount, breed, lactation, stage in rows
+        ]
+
+    assert authenticated_client.post('/api/finance/costs/bulk-import', json={'entries': entries(costs)}).status_code == 201
+    assert authenticated_client.post('/api/finance/revenues/bulk-import', json={'entries': entries(revenues)}).status_code == 201
+    return authenticated_client
+
+
+def test_full_month_window_splits_partial_edges():
+    assert full_month_window(None, None) == (None, None)
+    assert full_month_window(datetime(2024, 1, 1), datetime(2024, 3, 31, 23, 59, 59, 999999)) == (
+        datetime(2024, 1, 1), datetime(2024, 4, 1),
+    )
+    assert full_month_window(datetime(2024, 1, 10), datetime(2024, 3, 15)) == (datetime(2024, 2, 1), datetime(2024, 3, 1))
+    assert full_month_window(datetime(2023, 12, 2), None) == (datetime(2024, 1, 1), None)
+    assert full_month_window(datetime(2024, 1, 10), datetime(2024, 1, 20)) is None
+
+
+def test_writes_keep_rollups_in_sync_with_rebuild(finance_history, test_user):
+    client = finance_history
+    created = client.post('/api/finance/costs', json={
+        'recorded_at': '2024-02-11T10:00:00', 'category': 'vet', 'amount': 12, 'breed': '努比亞', 'production_stage': '泌乳期',
+    }).get_json()
+    client.put(f"/api/finance/costs/{created['id']}", json={'recorded_at': '2024-03-01T00:00:00', 'amount': 15})
+    first_cost = db.session.query(CostEntry).order_by(CostEntry.id).first()
+    client.delete(f'/api/finance/costs/{first_cost.id}')
+
+    incremental = _snapshot()
+    assert ('2023-11-01', 'feed', '努比亞', 1, '泌乳期', 100.0, 1) not in incremental[0]
+    assert ('2024-03-01', 'vet', '努比亞', None, '泌乳期', 15.0, 1) in incremental[0]
+
+    rebuild_rollups(test_user.id)
+    assert _snapshot() == incremental
+
+
+QUERIES = [
+    ('cost-benefit', {'group_by': 'month'}),
+    ('cost-benefit', {'group_by': 'none'}),
+    ('cost-benefit', {'group_by': 'category', 'time_range': {'start': '2023-11-18T00:00:00', 'end': '2024-01-31T23:59:59'}}),
+    ('cost-benefit', {'group_by': 'month', 'time_range': {'start': '2023-12-01T00:00:00'}}),
+    ('cost-benefit', {'group_by': 'breed', 'filters': {'production_stage': ['泌乳期']}, 'time_range': {'end': '2024-01-10T00:00:00'}}),
+    ('cohort-analysis', {'cohort_by': ['breed', 'lactation_number'], 'metrics': ['total_cost', 'total_revenue', 'net_profit']}),
+    ('cohort-analysis', {
+        'cohort_by': ['production_stage'], 'metrics': ['total_cost', 'total_revenue'],
+        'filters': {'category': ['feed', 'milk']}, 'time_range': {'start': '2023-12-01T00:00:00', 'end': '2024-02-01T00:00:00'},
+    }),
+]
+
+
+@pytest.mark.parametrize('endpoint,payload', QUERIES)
+def test_rollup_answers_match_raw_scan(finance_history, test_user, monkeypatch, endpoint, payload):
+    from app.schemas import CohortAnalysisRequest, CostBenefitRequest
+
+    from_rollups = finance_history.post(f'/api/bi/{endpoint}', json=payload).get_json()
+
+    # 清空彙總表並停用完整月份切分，強制全部掃描明細
+    db.session.query(CostMonthlyRollup).delete()
+    db.session.query(RevenueMonthlyRollup).delete()
+    db.session.commit()
+    monkeypatch.setattr(bi, 'full_month_window', lambda start, end: None)
+    if endpoint == 'cohort-analysis':
+        wrapped = {'endpoint': 'cohort', 'payload': CohortAnalysisRequest(**payload).model_dump()}
+    else:
+        wrapped = {'endpoint': endpoint, 'payload': CostBenefitRequest(**payload).model_dump()}
+    from_entries = bi.compute_bi_response(test_user.id, wrapped)
+
+    assert from_entries['items']
+    assert from_rollups == from_entries
+
+
+def test_rebuild_command_recreates_rollups(finance_history, runner, test_user):
+    expected = _snapshot()
+    db.session.query(CostMonthlyRollup).delete()
+    db.session.query(RevenueMonthlyRollup).delete()
+    db.session.commit()
+
+    result = runner.invoke(args=['finance-rollups', 'rebuild', '--user-id', str(test_user.id)])
+
+    assert result.exit_code == 0, result.output
+    assert 'cost_monthly_rollup: 6 rows' in result.output
+    assert _snapshot() == expected
+    assert db.session.query(CostMonthlyRollup).filter_by(category='vet', breed=None).one().total_amount == Decimal('75.50')
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from google.genai import errors as genai_errors
+from google.genai import types as genai_types
+
+from app.ai import genai_client
+
+
+def _response(text):
+    return genai_types.GenerateContentResponse(
+        candidates=[
+            genai_types.Candidate(
+                content=genai_types.Content(role="model", parts=[genai_types.Part(text=text)]),
+                finish_reason="STOP",
+            )
+        ]
+    )
+
+
+class DummyAsyncModels:
+    def __init__(self, delay=0.01, fail_on=()):
+        self.delay = delay
+        self.fail_on = set(fail_on)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    async def generate_content(self, *, model, contents, config):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            prompt = contents[0].parts[0].text
+            if prompt in self.fail_on:
+                raise genai_errors.APIError(503, {"error": {"message": "unavailable"}})
+            return _response(f"回應:{prompt}")
+        finally:
+            self.in_flight -= 1
+
+
+class DummyAio:
+    def __init__(self, models):
+        self.models = models
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+class DummyClient:
+    def __init__(self, models):
+        self.aio = DummyAio(models)
+
+
+def test_agenerate_many_limits_concurrency_and_keeps_order():
+    models = DummyAsyncModels()
+    client = DummyClient(models)
+    prompts = [f"羊{i}" for i in range(10)]
+
+    results = asyncio.run(genai_client.agenerate_many(prompts, max_concurrency=3, client=client))
+
+    assert [result.text for result in results] == [f"回應:羊{i}" for i in range(10)]
+    assert models.max_in_flight == 3
+
+
+def test_agenerate_many_isolates_failures():
+    models = DummyAsyncModels(fail_on={"羊1"})
+    client = DummyClient(models)
+
+    results = asyncio.run(genai_client.agenerate_many(["羊0", "羊1", "羊2"], client=client))
+
+    assert results[0].text == "回應:羊0"
+    assert isinstance(results[1], genai_client.GenAIClientError)
+    assert "503" in str(results[1])
+    assert results[2].text == "回應:羊2"
+
+
+def test_generate_content_many_uses_and_closes_dedicated_client(monkeypatch):
+    models = DummyAsyncModels()
+    client = DummyClient(models)
+    monkeypatch.setattr(genai_client, "_new_client", lambda api_key: client)
+
+    results = genai_client.generate_content_many(["a", "b"], api_key="key", max_concurrency=2)
+
+    assert [result.text for result in results] == ["回應:a", "回應:b"]
+    assert client.aio.closed is True
+
+
+def test_generate_content_many_rejects_running_loop(monkeypatch):
+    monkeypatch.setattr(genai_client, "_new_client", lambda api_key: DummyClient(DummyAsyncModels()))
+
+    async def call_from_loop():
+        genai_client.generate_content_many(["a"], api_key="key")
+
+    with pytest.raises(genai_client.GenAIClientError):
+        asyncio.run(call_from_loop())
@@ -0,0 +1,148 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+SCRIPTS_PATH = Path(__file__).resolve().parents[2] / "scripts"
+if str(SCRIPTS_PATH) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_PATH))
+
+import ingest_docs  # noqa: E402
+from rag_utils import read_text  # noqa: E402
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Source and output directories under a fake repo root, with a counting fake embedder."""
+    monkeypatch.setattr(ingest_docs, "REPO_ROOT", tmp_path)
+    monkeypatch.setattr(
+        ingest_docs, "extract_texts", lambda files, **kwargs: {path: read_text(path) for path in files}
+    )
+    embedded = []
+
+    def fake_embed(texts, **kwargs):
+        embedded.extend(texts)
+        return [np.full(ingest_docs.EMBEDDING_DIMENSION, len(text), dtype=np.float32) for text in texts]
+
+    monkeypatch.setattr(ingest_docs, "embed_documents", fake_embed)
+    source = tmp_path / "sources"
+    source.mkdir()
+    output = tmp_path / "vectors" / "corpus.parquet"
+
+    def run(**kwargs):
+        embedded.clear()
+        stats, changed = ingest_docs.ingest(ingest_docs.iter_source_files(source), output, **kwargs)
+        return stats, changed, list(embedded)
+
+    return source, output, run
+
+
+def _corpus_texts(output):
+    return sorted(pd.read_parquet(output, columns=["text"])["text"])
+
+
+def test_added_file_is_embedded_once(workspace):
+    source, output, run = workspace
+    (source / "a.md").write_text("alpha", encoding="utf-8")
+
+    stats, changed, embedded = run()
+    assert changed and embedded == ["alpha"]
+    assert stats["changed_files"] == 1
+
+    (source / "b.md").write_text("beta", encoding="utf-8")
+    stats, changed, embedded = run()
+    assert changed and embedded == ["beta"]
+    assert stats["unchanged_files"] == 1 and stats["changed_files"] == 1
+    assert _corpus_texts(output) == ["alpha", "beta"]
+
+    stats, changed, embedded = run()
+    assert not changed and embedded == []
+    assert stats["unchanged_files"] == 2
+
+
+def test_changed_file_only_embeds_new_chunks(workspace, monkeypatch):
+    source, output, run = workspace
+    monkeypatch.setattr(ingest_docs, "chunk_text", lambda text: text.split("|"))
+    (source / "a.md").write_text("one|two", encoding="utf-8")
+    run()
+
+    (source / "a.md").write_text("one|three", encoding="utf-8")
+    stats, changed, embedded = run()
+    assert changed and embedded == ["three"]
+    assert stats["reused_chunks"] == 1
+    assert _corpus_texts(output) == ["one", "three"]
+
+
+def test_deleted_file_drops_its_partition(workspace):
+    source, output, run = workspace
+    (source / "a.md").write_text("alpha", encoding="utf-8")
+    (source / "b.md").write_text("beta", encoding="utf-8")
+    run()
+    partitions = output.parent / ingest_docs.PARTITION_DIR_NAME
+    assert len(list(partitions.glob("*.parquet"))) == 2
+
+    (source / "b.md").unlink()
+    stats, changed, embedded = run()
+    assert changed and embedded == []
+    assert stats["deleted_files"] == 1
+    assert len(list(partitions.glob("*.parquet"))) == 1
+    assert _corpus_texts(output) == ["alpha"]
+
+
+def test_first_run_without_manifest_reuses_existing_corpus(workspace):
+    source, output, run = workspace
+    (source / "a.md").write_text("alpha", encoding="utf-8")
+    (source / "b.md").write_text("beta", encoding="utf-8")
+    output.parent.mkdir(parents=True)
+    pd.DataFrame(
+        {
+            "doc_path": ["sources/a.md"],
+            "chunk_index": [0],
+            "text": ["alpha"],
+            "embedding": [[0.5] * ingest_docs.EMBEDDING_DIMENSION],
+            "meta": ['{"source": "sources/a.md"}'],
+        }
+    ).to_parquet(output, index=False)
+
+    stats, changed, embedded = run()
+    assert embedded == ["beta"]
+    assert stats["reused_chunks"] == 1
+    corpus = pd.read_parquet(output)
+    reused = corpus.loc[corpus["text"] == "alpha", "embedding"].iloc[0]
+    assert list(reused) == [0.5] * ingest_docs.EMBEDDING_DIMENSION
+
+
+def test_file_with_skipped_ocr_is_retried_next_run(workspace, monkeypatch):
+    source, output, run = workspace
+    (source / "scan.pdf").write_bytes(b"%PDF")
+    extracted = []
+    ocr_available = False
+
+    def fake_extract(files, ocr_incomplete=None, **kwargs):
+        extracted.extend(files)
+        if not ocr_available:
+            ocr_incomplete.update(files)
+            return {path: "" for path in files}
+        return {path: "scanned text" for path in files}
+
+    monkeypatch.setattr(ingest_docs, "extract_texts", fake_extract)
+
+    stats, _, _ = run()
+    assert stats["ocr_incomplete_files"] == 1
+    manifest = ingest_docs.load_manifest(output.parent / ingest_docs.MANIFEST_NAME)
+    assert manifest["sources/scan.pdf"]["ocr_incomplete"] is True
+
+    ocr_available = True
+    extracted.clear()
+    stats, changed, embedded = run()
+    assert extracted == [source / "scan.pdf"]
+    assert changed and embedded == ["scanned text"]
+    assert stats["ocr_incomplete_files"] == 0 and stats["unchanged_files"] == 0
+    manifest = ingest_docs.load_manifest(output.parent / ingest_docs.MANIFEST_NAME)
+    assert "ocr_incomplete" not in manifest["sources/scan.pdf"]
+
+    extracted.clear()
+    stats, changed, _ = run()
+    assert extracted == [] and not changed
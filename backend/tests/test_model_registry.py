@@ -0,0 +1,105 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.in_memory_redis import InMemoryRedis
+from app.services.model_registry import RELOAD_GENERATION_KEY, ModelRegistry
+
+lightgbm = pytest.importorskip('lightgbm')
+
+MODEL_FILES = {
+    'main': 'growth.joblib',
+    'q10': 'growth_q10.joblib',
+}
+
+
+def _train_regressor():
+    rng = np.random.default_rng(0)
+    features = pd.DataFrame({
+        'AgeDays': rng.uniform(60, 365, 200),
+        'Breed': pd.Categorical(rng.choice(['NU', 'BO'], 200), categories=['BO', 'NU']),
+    })
+    target = features['AgeDays'] * 0.1 + (features['Breed'] == 'BO') * 3.0
+    model = lightgbm.LGBMRegressor(n_estimators=10, min_child_samples=5, verbosity=-1)
+    model.fit(features, target)
+    return model, features
+
+
+def test_registry_loads_joblib_and_native_text(tmp_path):
+    model, features = _train_regressor()
+    joblib.dump(model, tmp_path / 'growth.joblib')
+    model.booster_.save_model(str(tmp_path / 'growth_q10.txt'))
+
+    registry = ModelRegistry(tmp_path, MODEL_FILES)
+    assert registry.preload() is True
+    assert registry.formats == {'main': 'joblib', 'q10': 'lightgbm_text'}
+    assert registry.version
+
+    native = registry.models['q10']
+    assert native.pandas_categorical == [['BO', 'NU']]
+    np.testing.assert_allclose(native.predict(features.head(5)), model.predict(features.head(5)))
+
+
+def test_registry_version_tracks_file_contents(tmp_path):
+    model, _ = _train_regressor()
+    joblib.dump(model, tmp_path / 'growth.joblib')
+
+    registry = ModelRegistry(tmp_path, MODEL_FILES)
+    assert registry.load()
+    first_version = registry.version
+    assert registry.warnings == ['量化模型檔案 growth_q10.joblib 不存在']
+
+    model.booster_.save_model(str(tmp_path / 'growth_q10.txt'))
+    assert registry.load(force=True)
+    assert registry.version != first_version
+
+
+def test_registry_retries_after_failed_load(tmp_path):
+    registry = ModelRegistry(tmp_path, MODEL_FILES, retry_interval=3600)
+    assert registry.load() is False
+    assert '找不到主要模型檔案' in registry.last_error
+
+    model, _ = _train_regressor()
+    joblib.dump(model, tmp_path / 'growth.joblib')
+    # 重試間隔內不重新讀取磁碟
+    assert registry.load() is False
+
+    registry.retry_interval = 0
+    assert registry.load() is True
+    assert registry.last_error is None
+
+
+def test_registry_follows_published_reload(tmp_path):
+    model, _ = _train_regressor()
+    joblib.dump(model, tmp_path / 'growth.joblib')
+    redis = InMemoryRedis()
+
+    publisher = ModelRegistry(tmp_path, MODEL_FILES)
+    follower = ModelRegistry(tmp_path, MODEL_FILES, generation_check_interval=0)
+    assert publisher.load() and follower.load()
+    assert follower.sync_generation(redis) is False
+
+    model.booster_.save_model(str(tmp_path / 'growth_q10.txt'))
+    publisher.publish_reload(redis)
+    assert 'q10' in publisher.models
+
+    assert follower.sync_generation(redis) is True
+    assert follower.version == publisher.version
+
+
+def test_failed_forced_reload_keeps_models_and_reports_error(tmp_path):
+    model, _ = _train_regressor()
+    joblib.dump(model, tmp_path / 'growth.joblib')
+    redis = InMemoryRedis()
+
+    registry = ModelRegistry(tmp_path, MODEL_FILES)
+    assert registry.load() is True
+    version = registry.version
+
+    (tmp_path / 'growth.joblib').unlink()
+    assert registry.publish_reload(redis) is False
+    assert '找不到主要模型檔案' in registry.last_error
+    assert registry.version == version and 'main' in registry.models
+    # 失敗的重新載入不通知其他 worker
+    assert redis.get(RELOAD_GENERATION_KEY) is None
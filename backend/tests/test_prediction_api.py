@@ -3,6 +3,8 @@ import json
 from unittest.mock import patch, MagicMock
 from datetime import datetime, date, timedelta
 
+import numpy as np
+
 from app.api.prediction import MIN_ELIGIBLE_AGE_DAYS, MAX_ELIGIBLE_AGE_DAYS
 
 class TestPredictionAPI:
@@ -364,11 +366,11 @@ class TestPredictionAPI:
             def __init__(self, value):
                 self.value = value
 
-            def predict(self, _):
-                return [self.value]
+            def predict(self, features):
+                return [self.value] * len(features)
 
-        def fake_build_dataframe(sheep, future_days, future_date):
-            return object(), None
+        def fake_build_feature_frame(sheep, age_days_series, future_dates):
+            return list(age_days_series), None
 
         monkeypatch.setattr(prediction_mod, '_lgbm_models', {
             'main': DummyModel(26.0),
@@ -377,7 +379,7 @@ class TestPredictionAPI:
         }, raising=False)
         monkeypatch.setattr(prediction_mod, '_lgbm_load_error', None, raising=False)
         monkeypatch.setattr(prediction_mod, '_ensure_lgbm_models', lambda: True, raising=False)
-        monkeypatch.setattr(prediction_mod, '_build_lgbm_dataframe', fake_build_dataframe, raising=False)
+        monkeypatch.setattr(prediction_mod, '_build_lgbm_feature_frame', fake_build_feature_frame, raising=False)
 
         user = test_user
         birth_date = (date.today() - timedelta(days=120)).strftime('%Y-%m-%d')
@@ -424,3 +426,375 @@ class TestPredictionAPI:
         chart_data = json.loads(chart_resp.data)
         assert chart_data['confidence_band']
         assert len(chart_data['confidence_band']) == len(data['daily_confidence_band'])
+
+    def test_lgbm_feature_frame_matches_single_row_builder(self, app):
+        """批次特徵矩陣應與逐日單列組裝結果一致"""
+        from types import SimpleNamespace
+        from app.api import prediction as prediction_mod
+
+        sheep = SimpleNamespace(
+            BirWei=3.1, Sex='母', Breed='努比亞', LittleSize=2,
+            Lactation=None, DaysInMilk=None, ReproStatus=None, status=None
+        )
+        today = date.today()
+        ages = [120 + offset for offset in range(40)]
+        dates = [today + timedelta(days=offset) for offset in range(40)]
+
+        frame, warning = prediction_mod._build_lgbm_feature_frame(sheep, ages, dates)
+        assert frame is not None
+        assert list(frame.columns) == prediction_mod.LGBM_FEATURE_ORDER
+        assert len(frame) == 40
+
+        for idx in (0, 17, 39):
+            single, single_warning = prediction_mod._build_lgbm_dataframe(sheep, ages[idx], dates[idx])
+            assert single_warning == warning
+            for column in frame.columns:
+                batch_value = frame[column].iloc[idx]
+                single_value = single[column].iloc[0]
+                if isinstance(batch_value, float) and np.isnan(batch_value):
+                    assert np.isnan(single_value)
+                else:
+                    assert batch_value == single_value
+
+    def test_lgbm_feature_frame_warns_once_for_invalid_daily_values(self, app, caplog):
+        """逐日特徵無法轉換時改用 NaN，並只記錄一次警告"""
+        from types import SimpleNamespace
+        from app.api import prediction as prediction_mod
+
+        sheep = SimpleNamespace(
+            BirWei=3.1, Sex='母', Breed='努比亞', LittleSize=2,
+            Lactation=1, DaysInMilk=30, ReproStatus='懷孕', status=None
+        )
+        today = date.today()
+        ages = [120, 'bad', 'bad', 123]
+        dates = [today, today, None, today]
+
+        with app.app_context(), caplog.at_level('WARNING'):
+            frame, warning = prediction_mod._build_lgbm_feature_frame(sheep, ages, dates)
+
+        assert np.isnan(frame['AgeDays'].iloc[1]) and np.isnan(frame['Seasonality'].iloc[2])
+        assert frame['AgeDays'].iloc[3] == 123
+        assert 'AgeDays 無法轉為數值，已使用 NaN（2 筆）' in warning
+        assert 'Seasonality 缺值，已使用 NaN（1 筆）' in warning
+        logged = [record for record in caplog.records if 'LightGBM 逐日特徵含無效值' in record.getMessage()]
+        assert len(logged) == 1
+
+    def test_lgbm_numpy_fast_path_matches_pandas(self, app, monkeypatch):
+        """NumPy 編碼 + Booster.predict 應與 pandas 路徑輸出一致"""
+        import pandas as pd
+        from types import SimpleNamespace
+        from lightgbm import LGBMRegressor
+        from app.api import prediction as prediction_mod
+
+        rng = np.random.default_rng(7)
+        rows = 300
+        train = pd.DataFrame({
+            'AgeDays': rng.uniform(0, 400, rows),
+            'BirWei': rng.uniform(2.0, 4.5, rows),
+            'Sex': rng.choice([1.0, 2.0], rows),
+            'Breed': rng.choice(['NU', 'AL', 'SA'], rows),
+            'LittleSize': rng.integers(1, 4, rows).astype(float),
+            'Lactation': rng.integers(0, 4, rows).astype(float),
+            'DaysInMilk': np.full(rows, -1.0),
+            'ReproStatus': rng.choice(['未配種', '懷孕'], rows),
+            'Seasonality': rng.integers(1, 13, rows).astype(float),
+        })[prediction_mod.LGBM_FEATURE_ORDER]
+        for feature in prediction_mod.LGBM_CATEGORICAL_FEATURE_LIST:
+            train[feature] = train[feature].astype('category')
+        target = train['AgeDays'] * 0.1 + train['BirWei'] + (train['Breed'] == 'NU') * 3.0
+        model = LGBMRegressor(n_estimators=20, num_leaves=8, min_child_samples=5, verbose=-1)
+        model.fit(train, target)
+
+        for name in ('_lgbm_models', '_lgbm_boosters', '_lgbm_category_levels',
+                     '_lgbm_category_codes', '_lgbm_model_version'):
+            monkeypatch.setattr(prediction_mod, name, getattr(prediction_mod, name))
+        monkeypatch.setattr(prediction_mod.model_registry, 'models', {'main': model, 'q10': model, 'q90': model})
+        prediction_mod._sync_from_registry()
+        assert prediction_mod._lgbm_fast_path_ready()
+
+        sheep = SimpleNamespace(
+            BirWei=3.1, Sex='母', Breed='努比亞', LittleSize=2,
+            Lactation=None, DaysInMilk=None, ReproStatus=None, status=None
+        )
+        today = date.today()
+        ages = [120 + offset for offset in range(60)]
+        dates = [today + timedelta(days=offset) for offset in range(60)]
+
+        matrix, matrix_warning = prediction_mod._build_lgbm_feature_matrix(sheep, ages, dates)
+        frame, frame_warning = prediction_mod._build_lgbm_feature_frame(sheep, ages, dates)
+        assert matrix.dtype == np.float32
+        assert matrix_warning == frame_warning
+
+        fast = prediction_mod._predict_lgbm_curves(matrix)
+        slow = prediction_mod._predict_lgbm_curves(frame)
+        for fast_curve, slow_curve in zip(fast, slow):
+            np.testing.assert_allclose(fast_curve, slow_curve, rtol=1e-6)
+
+
+class TestBatchPredictionAPI:
+    """批次生長預測 API 測試"""
+
+    @staticmethod
+    def _create_sheep(db_session, user, ear_tag, age_days, weights, breed='努比亞'):
+        from app.models import Sheep, SheepHistoricalData
+
+        sheep = Sheep(
+            user_id=user.id,
+            EarNum=ear_tag,
+            Breed=breed,
+            Sex='母',
+            BirthDate=(date.today() - timedelta(days=age_days)).strftime('%Y-%m-%d')
+        )
+        db_session.add(sheep)
+        db_session.commit()
+        start_date = date.today() - timedelta(days=7 * len(weights))
+        for idx, weight in enumerate(weights):
+            db_session.add(SheepHistoricalData(
+                sheep_id=sheep.id,
+                user_id=user.id,
+                record_date=(start_date + timedelta(days=idx * 7)).strftime('%Y-%m-%d'),
+                record_type='Body_Weight_kg',
+                value=weight
+            ))
+        db_session.commit()
+        return sheep
+
+    def test_batch_prediction_sync(self, authenticated_client, db_session, test_user):
+        self._create_sheep(db_session, test_user, 'BATCH001', 150, [20.0, 21.0, 22.5, 23.0])
+        self._create_sheep(db_session, test_user, 'BATCH002', 200, [25.0, 26.0])
+        self._create_sheep(db_session, test_user, 'BATCHOLD', 800, [50.0, 50.5, 51.0])
+
+        response = authenticated_client.post('/api/prediction/batch', json={
+            'ear_tags': ['BATCH001', 'BATCH002', 'BATCHOLD'],
+            'target_days': 30,
+            'eligible_only': False
+        })
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['requested'] == 3
+        assert data['succeeded'] == 1
+        by_tag = {entry['ear_tag']: entry for entry in data['results']}
+        assert by_tag['BATCH001']['success'] is True
+        assert by_tag['BATCH001']['predicted_weight'] > 0
+        assert 'daily_forecasts' not in by_tag['BATCH001']
+        assert by_tag['BATCH002']['error'] == '數據不足以進行預測'
+        assert '僅支援出生一年內' in by_tag['BATCHOLD']['error']
+
+    def test_batch_prediction_filters_eligible_by_breed(self, authenticated_client, db_session, test_user):
+        self._create_sheep(db_session, test_user, 'BOER01', 150, [20.0, 21.0, 22.0], breed='波爾')
+        self._create_sheep(db_session, test_user, 'NUBI01', 150, [20.0, 21.0, 22.0])
+        self._create_sheep(db_session, test_user, 'BOEROLD', 900, [50.0, 51.0, 52.0], breed='波爾')
+
+        response = authenticated_client.post('/api/prediction/batch', json={
+            'breeds': ['波爾'],
+            'include_daily_forecasts': True
+        })
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [entry['ear_tag'] for entry in data['results']] == ['BOER01']
+        assert len(data['results'][0]['daily_forecasts']) == 31
+
+    def test_batch_prediction_fans_out_ai_analysis(self, authenticated_client, db_session, test_user, monkeypatch):
+        self._create_sheep(db_session, test_user, 'FAN001', 150, [20.0, 21.0, 22.5, 23.0])
+        self._create_sheep(db_session, test_user, 'FAN002', 160, [21.0, 22.0, 23.5, 24.0])
+        calls = []
+
+        def fake_many(prompts, api_key, **kwargs):
+            calls.append(list(prompts))
+            return [{'text': 'ok'}, {'error': 'API 調用失敗'}]
+
+        monkeypatch.setattr('app.api.prediction.call_gemini_api_many', fake_many)
+
+        response = authenticated_client.post(
+            '/api/prediction/batch',
+            json={'ear_tags': ['FAN001', 'FAN002'], 'include_ai_analysis': True},
+            headers={'X-Api-Key': 'test-api-key'}
+        )
+
+        assert response.status_code == 200
+        assert len(calls) == 1 and len(calls[0]) == 2
+        by_tag = {entry['ear_tag']: entry for entry in response.get_json()['results']}
+        assert by_tag['FAN001']['ai_analysis'] == 'ok'
+        assert by_tag['FAN001']['ai_error'] is None
+        assert by_tag['FAN002']['ai_analysis'] is None
+        assert by_tag['FAN002']['ai_error'] == 'API 調用失敗'
+
+    def test_batch_prediction_requires_api_key_for_ai(self, authenticated_client):
+        response = authenticated_client.post('/api/prediction/batch', json={'include_ai_analysis': True})
+        assert response.status_code == 401
+
+    def test_batch_prediction_validation_error(self, authenticated_client):
+        response = authenticated_client.post('/api/prediction/batch', json={'target_days': 3})
+        assert response.status_code == 400
+
+    def test_batch_prediction_background_job(self, authenticated_client, app, db_session, test_user, monkeypatch):
+        from app.simple_queue import SimpleQueue, SimpleWorker
+
+        self._create_sheep(db_session, test_user, 'JOB001', 150, [20.0, 21.0, 22.5, 23.0])
+        used_keys = []
+
+        def fake_many(prompts, api_key, **kwargs):
+            used_keys.append(api_key)
+            return [{'text': '背景分析'} for _ in prompts]
+
+        monkeypatch.setattr('app.api.prediction.call_gemini_api_many', fake_many)
+
+        # 背景模式不需要請求頭金鑰，使用者提供的金鑰也不會被使用
+        response = authenticated_client.post(
+            '/api/prediction/batch',
+            json={'ear_tags': ['JOB001'], 'run_async': True, 'include_ai_analysis': True},
+            headers={'X-Api-Key': 'test-api-key'}
+        )
+        assert response.status_code == 202
+        job_id = response.get_json()['job_id']
+
+        pending = authenticated_client.get(f'/api/prediction/batch/{job_id}')
+        assert pending.status_code == 202
+        assert pending.get_json()['status'] == 'queued'
+
+        # 任務紀錄存在 Redis，不得包含使用者的 API 金鑰
+        redis_client = app.extensions['redis_client']
+        worker_queue = SimpleQueue(app.config['RQ_QUEUE_NAME'], connection=redis_client)
+        assert 'test-api-key' not in redis_client.get(worker_queue.job_key(job_id))
+
+        # 模擬獨立的 worker 行程：另建佇列實例取出並執行任務
+        SimpleWorker(worker_queue, sleep=0, app=app).work(burst=True)
+
+        finished = authenticated_client.get(f'/api/prediction/batch/{job_id}')
+        assert finished.status_code == 200
+        result = finished.get_json()['result']
+        assert result['succeeded'] == 1
+        assert result['results'][0]['ai_analysis'] == '背景分析'
+        assert used_keys == [app.config['GOOGLE_API_KEY']]
+
+        assert authenticated_client.get('/api/prediction/batch/unknown').status_code == 404
+
+    def test_batch_prediction_background_ai_uses_server_key(
+        self, authenticated_client, app, db_session, test_user, monkeypatch
+    ):
+        self._create_sheep(db_session, test_user, 'JOB002', 150, [20.0, 21.0, 22.5, 23.0])
+        payload = {'ear_tags': ['JOB002'], 'run_async': True, 'include_ai_analysis': True}
+
+        response = authenticated_client.post('/api/prediction/batch', json=payload)
+        assert response.status_code == 202
+
+        monkeypatch.setitem(app.config, 'GOOGLE_API_KEY', '')
+        response = authenticated_client.post('/api/prediction/batch', json=payload)
+        assert response.status_code == 503
+        assert 'GOOGLE_API_KEY' in response.get_json()['error']
+
+    def test_batch_prediction_stacks_lgbm_inference(self, app, db_session, test_user, monkeypatch):
+        from app.api import prediction as prediction_mod
+
+        class CountingModel:
+            def __init__(self, offset):
+                self.offset = offset
+                self.calls = 0
+
+            def predict(self, features):
+                self.calls += 1
+                return features['AgeDays'].to_numpy() * 0.0 + 20.0 + self.offset
+
+        models = {'main': CountingModel(0.0), 'q10': CountingModel(-2.0), 'q90': CountingModel(2.0)}
+        monkeypatch.setattr(prediction_mod, '_lgbm_models', models, raising=False)
+        monkeypatch.setattr(prediction_mod, '_ensure_lgbm_models', lambda: True, raising=False)
+
+        for idx in range(3):
+            self._create_sheep(db_session, test_user, f'STACK{idx}', 120 + idx, [18.0, 19.0, 20.0, 20.5])
+
+        with app.test_request_context():
+            result = prediction_mod.compute_batch_predictions(test_user.id, target_days=14)
+
+        assert result['succeeded'] == 3
+        assert all(model.calls == 1 for model in models.values())
+        assert all(entry['prediction_source'] == 'lightgbm' for entry in result['results'])
+        assert all(entry['pred_interval'] == {'q10': 18.0, 'q90': 22.0} for entry in result['results'])
+
+
+class TestPredictionForecastCache:
+    """預測與圖表端點共用預測快取"""
+
+    def test_chart_data_reuses_prediction_forecast(self, authenticated_client, sheep_with_weight_data, mock_gemini_api, monkeypatch):
+        from app.api import prediction as prediction_mod
+
+        calls = []
+        original = prediction_mod._compute_prediction_metrics
+
+        def counting_compute(*args, **kwargs):
+            calls.append(args[2])
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(prediction_mod, '_compute_prediction_metrics', counting_compute)
+        ear_tag = sheep_with_weight_data.EarNum
+
+        first = authenticated_client.get(
+            f'/api/prediction/goats/{ear_tag}/prediction?target_days=30',
+            headers={'X-Api-Key': 'test-api-key'}
+        )
+        chart = authenticated_client.get(f'/api/prediction/goats/{ear_tag}/prediction/chart-data?target_days=30')
+        repeat = authenticated_client.get(f'/api/prediction/goats/{ear_tag}/prediction/chart-data?target_days=30')
+
+        assert first.status_code == chart.status_code == repeat.status_code == 200
+        assert calls == [30]
+        assert chart.get_json()['forecast_line'][-1]['y'] == first.get_json()['daily_forecasts'][-1]['predicted_weight']
+
+        authenticated_client.get(f'/api/prediction/goats/{ear_tag}/prediction/chart-data?target_days=45')
+        assert calls == [30, 45]
+
+    def test_history_delete_invalidates_forecast(self, authenticated_client, sheep_with_weight_data, monkeypatch):
+        from app.api import prediction as prediction_mod
+        from app.models import SheepHistoricalData
+
+        calls = []
+        original = prediction_mod._compute_prediction_metrics
+
+        def counting_compute(*args, **kwargs):
+            calls.append(args[2])
+            return original(*args, **kwargs)
+
+        monkeypatch.setattr(prediction_mod, '_compute_prediction_metrics', counting_compute)
+        ear_tag = sheep_with_weight_data.EarNum
+        chart_url = f'/api/prediction/goats/{ear_tag}/prediction/chart-data?target_days=30'
+
+        assert authenticated_client.get(chart_url).status_code == 200
+        record = SheepHistoricalData.query.filter_by(sheep_id=sheep_with_weight_data.id).first()
+        assert authenticated_client.delete(f'/api/sheep/history/{record.id}').status_code == 200
+
+        assert authenticated_client.get(chart_url).status_code == 200
+        assert len(calls) == 2
+
+
+class TestPredictionModelRegistryAPI:
+    """模型註冊表狀態與重新載入端點"""
+
+    def test_model_status_and_reload(self, authenticated_client, app, monkeypatch):
+        from app.api import prediction as prediction_mod
+
+        status = authenticated_client.get('/api/prediction/models')
+        assert status.status_code == 200
+        payload = status.get_json()
+        assert set(payload) >= {'loaded', 'version', 'formats', 'error'}
+
+        reload_calls = []
+
+        def failed_reload(client):
+            reload_calls.append(client)
+            return False
+
+        monkeypatch.setattr(prediction_mod.model_registry, 'publish_reload', failed_reload)
+        monkeypatch.setattr(prediction_mod, '_ensure_lgbm_models', lambda: True)
+
+        # 未設定管理員權杖時端點停用，一般登入使用者不可重新載入
+        assert authenticated_client.post('/api/prediction/models/reload').status_code == 403
+        monkeypatch.setitem(app.config, 'MODEL_ADMIN_TOKEN', 'admin-token')
+        wrong = authenticated_client.post('/api/prediction/models/reload', headers={'X-Admin-Token': 'guess'})
+        assert wrong.status_code == 403
+        assert reload_calls == []
+
+        # 重新載入失敗時即使舊模型仍可用，也要回報錯誤
+        failed = authenticated_client.post('/api/prediction/models/reload', headers={'X-Admin-Token': 'admin-token'})
+        assert len(reload_calls) == 1
+        assert failed.status_code == 503
+        assert '模型重新載入失敗' in failed.get_json()['error']
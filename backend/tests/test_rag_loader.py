@@ -76,8 +76,10 @@ def test_ensure_vectors_uses_disk_and_redis(monkeypatch, parquet_path):
 
     vectors = rag_loader.ensure_vectors(parquet_path)
     assert len(vectors) == 2
-    cached_payload = redis.store.get(rag_loader._REDIS_CACHE_KEY)
-    assert cached_payload is not None
+    manifest = json.loads(redis.store[rag_loader._REDIS_MANIFEST_KEY])
+    assert manifest["rows"] == 2 and manifest["dim"] == 2
+    chunk = redis.store[rag_loader._redis_chunk_key(manifest["version"], 0)]
+    assert isinstance(chunk, bytes) and len(chunk) == 2 * 2 * 4
 
     cached_path = Path(parquet_path)
     cached_path.unlink()
@@ -93,16 +95,17 @@ def test_linear_search_returns_ranked_results():
         {"text": "alpha", "doc": "doc", "idx": 0, "meta": {}, "embedding": np.array([1.0, 0.0], dtype=np.float32)},
         {"text": "beta", "doc": "doc", "idx": 1, "meta": {}, "embedding": np.array([0.0, 1.0], dtype=np.float32)},
     ]
-    rag_loader._EMBEDDING_MATRIX = np.vstack([v["embedding"] for v in vectors])
-    results = rag_loader._linear_search(np.array([1.0, 0.0], dtype=np.float32), vectors, top_k=1, min_sim=0.1)
+    matrix = np.vstack([v["embedding"] for v in vectors])
+    results = rag_loader._linear_search(np.array([1.0, 0.0], dtype=np.float32), vectors, matrix, top_k=1, min_sim=0.1)
     assert len(results) == 1
     assert results[0]["text"] == "alpha"
 
 
 def test_rag_query_handles_embed_error(monkeypatch):
     rag_loader._clear_cache()
-    rag_loader._EMBEDDING_MATRIX = np.empty((0, 0), dtype=np.float32)
-    monkeypatch.setattr(rag_loader, "ensure_vectors", lambda: [{"embedding": np.array([1.0])}])
+    vectors = [{"embedding": np.array([1.0])}]
+    monkeypatch.setattr(rag_loader, "_SNAPSHOT", rag_loader._VectorSnapshot(vectors, None, None, None))
+    monkeypatch.setattr(rag_loader, "ensure_vectors", lambda: vectors)
     monkeypatch.setattr(rag_loader, "embed_query", lambda *args, **kwargs: (_ for _ in ()).throw(EmbeddingError("bad")))
     assert rag_loader.rag_query("test") == []
 
@@ -113,13 +116,34 @@ def test_rag_query_linear_search(monkeypatch):
         {"text": "beta", "doc": "doc", "idx": 1, "meta": {}, "embedding": np.array([0.0, 1.0], dtype=np.float32)},
     ]
     rag_loader._clear_cache()
-    rag_loader._EMBEDDING_MATRIX = np.vstack([v["embedding"] for v in vectors])
+    matrix = np.vstack([v["embedding"] for v in vectors])
+    monkeypatch.setattr(rag_loader, "_SNAPSHOT", rag_loader._VectorSnapshot(vectors, None, matrix, "linear"))
     monkeypatch.setattr(rag_loader, "ensure_vectors", lambda: vectors)
     monkeypatch.setattr(rag_loader, "embed_query", lambda *args, **kwargs: np.array([1.0, 0.0], dtype=np.float32))
     results = rag_loader.rag_query("hello", top_k=2, min_sim=0.1)
     assert [item["text"] for item in results] == ["alpha"]
 
 
+def test_rag_query_keeps_snapshot_read_before_refresh(monkeypatch):
+    old = [{"text": "old", "doc": "doc", "idx": 0, "meta": {}, "embedding": np.array([1.0, 0.0], dtype=np.float32)}]
+    new = [
+        {"text": "new-a", "doc": "doc", "idx": 0, "meta": {}, "embedding": np.array([0.0, 1.0], dtype=np.float32)},
+        {"text": "new-b", "doc": "doc", "idx": 1, "meta": {}, "embedding": np.array([1.0, 0.0], dtype=np.float32)},
+    ]
+    rag_loader._clear_cache()
+    monkeypatch.setattr(rag_loader, "_SNAPSHOT", rag_loader._build_snapshot(old))
+    monkeypatch.setattr(rag_loader, "ensure_vectors", lambda: old)
+
+    def embed_during_refresh(*args, **kwargs):
+        # Another thread publishes a new snapshot while the query is embedded.
+        rag_loader._SNAPSHOT = rag_loader._build_snapshot(new)
+        return np.array([1.0, 0.0], dtype=np.float32)
+
+    monkeypatch.setattr(rag_loader, "embed_query", embed_during_refresh)
+    results = rag_loader.rag_query("hello", top_k=2, min_sim=0.5)
+    assert [item["text"] for item in results] == ["old"]
+
+
 def test_rag_query_empty_or_no_vectors(monkeypatch):
     rag_loader._clear_cache()
     assert rag_loader.rag_query("") == []
@@ -173,3 +197,211 @@ def test_rag_status_reflects_success(parquet_path, monkeypatch):
     status = rag_loader.get_status()
     assert status["available"] is True
     assert "載入完成" in status["message"]
+
+
+def test_top_k_indices_matches_full_sort():
+    rng = np.random.default_rng(3)
+    scores = rng.normal(size=500).astype(np.float32)
+    expected = np.argsort(scores)[::-1][:10]
+    assert list(rag_loader.top_k_indices(scores, 10)) == list(expected)
+    assert len(rag_loader.top_k_indices(scores, 1000)) == 500
+    assert len(rag_loader.top_k_indices(scores, 0)) == 0
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "hnsw", "ivf_pq"])
+def test_build_faiss_index_types_recall(monkeypatch, index_type):
+    faiss = pytest.importorskip("faiss")
+    monkeypatch.setattr(rag_loader, "faiss", faiss)
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(200, 32)).astype(np.float32)
+    embeddings = centers[rng.integers(0, 200, 4000)] + 0.1 * rng.normal(size=(4000, 32)).astype(np.float32)
+    faiss.normalize_L2(embeddings)
+
+    config = dict(rag_loader.index_config(), type=index_type, nlist=16, nprobe=4, pq_m=8)
+    index, description = rag_loader.build_faiss_index(embeddings, config)
+    assert description.startswith(index_type)
+    assert index.is_trained and index.ntotal == len(embeddings)
+
+    queries = embeddings[:20]
+    approx = [rag_loader.search_index(index, embeddings, q, 5)[1] for q in queries]
+    exact = [rag_loader.top_k_indices(embeddings @ q, 5) for q in queries]
+    recall = np.mean([len(set(a) & set(e)) / 5 for a, e in zip(approx, exact)])
+    assert recall >= 0.8
+
+
+def test_build_faiss_index_small_corpus_falls_back_to_flat(monkeypatch):
+    faiss = pytest.importorskip("faiss")
+    monkeypatch.setattr(rag_loader, "faiss", faiss)
+    embeddings = np.eye(4, dtype=np.float32)
+    config = dict(rag_loader.index_config(), type="ivf_pq")
+    _, description = rag_loader.build_faiss_index(embeddings, config)
+    assert description == "flat"
+
+
+def test_load_vectors_writes_and_maps_vector_store(parquet_path):
+    embeddings_path, meta_path = rag_loader.vector_store_paths(parquet_path)
+    assert not embeddings_path.exists()
+
+    vectors = rag_loader.load_vectors(parquet_path)
+    assert embeddings_path.exists() and meta_path.exists()
+    assert isinstance(vectors.embeddings, np.memmap)
+    assert vectors.embeddings.dtype == np.float32
+    assert vectors[1]["meta"] == {"source": "b"}
+    assert vectors[1]["text"] == "goodbye"
+
+    # A fresh store is opened directly, without touching the parquet snapshot.
+    Path(parquet_path).write_bytes(b"")
+    import os
+    os.utime(parquet_path, (0, 0))
+    reloaded = rag_loader.load_vectors(parquet_path)
+    assert [item["doc"] for item in reloaded] == ["doc1", "doc2"]
+
+
+def test_stale_vector_store_is_regenerated(tmp_path, parquet_path):
+    import os
+
+    rag_loader.load_vectors(parquet_path)
+    embeddings_path, _ = rag_loader.vector_store_paths(parquet_path)
+    os.utime(embeddings_path, (0, 0))
+
+    pd.DataFrame(
+        {
+            "doc_path": ["doc3"],
+            "chunk_index": [0],
+            "text": ["fresh"],
+            "embedding": [[0.6, 0.8]],
+            "meta": [json.dumps({"source": "c"})],
+        }
+    ).to_parquet(parquet_path, index=False)
+
+    vectors = rag_loader.load_vectors(parquet_path)
+    assert len(vectors) == 1
+    assert vectors[0]["text"] == "fresh"
+
+
+def test_memory_mapped_flat_store_uses_exact_numpy_search(monkeypatch, parquet_path):
+    faiss = pytest.importorskip("faiss")
+    monkeypatch.setattr(rag_loader, "faiss", faiss)
+    monkeypatch.setattr(rag_loader, "_FAISS_AVAILABLE", True)
+    monkeypatch.setattr(rag_loader, "_get_redis_client", lambda: None)
+    monkeypatch.setenv("RAG_INDEX_TYPE", "flat")
+    rag_loader._clear_cache()
+
+    vectors = rag_loader.ensure_vectors(parquet_path)
+    assert rag_loader._SNAPSHOT.vectors is vectors
+    assert rag_loader._SNAPSHOT.index is None
+    assert isinstance(rag_loader._SNAPSHOT.matrix, np.memmap)
+
+    monkeypatch.setattr(rag_loader, "ensure_vectors", lambda: vectors)
+    monkeypatch.setattr(rag_loader, "embed_query", lambda *args, **kwargs: np.array([0.0, 2.0], dtype=np.float32))
+    results = rag_loader.rag_query("hello", top_k=1, min_sim=0.5)
+    assert [item["text"] for item in results] == ["goodbye"]
+    rag_loader._clear_cache()
+
+
+class CountingRedis(StubRedis):
+    def __init__(self):
+        super().__init__()
+        self.reads = []
+
+    def get(self, key):
+        self.reads.append(key)
+        return super().get(key)
+
+
+def test_redis_snapshot_streams_chunks_and_skips_reload_for_same_version(monkeypatch, parquet_path):
+    redis = CountingRedis()
+    monkeypatch.setattr(rag_loader, "_get_redis_client", lambda: redis)
+    monkeypatch.setattr(rag_loader, "_attempt_git_lfs_pull", lambda: None)
+    monkeypatch.setattr(rag_loader, "_REDIS_CHUNK_BYTES", 12)
+    rag_loader._clear_cache()
+    rag_loader.ensure_vectors(parquet_path)
+    manifest = json.loads(redis.store[rag_loader._REDIS_MANIFEST_KEY])
+    assert manifest["chunks"] == 2
+
+    Path(parquet_path).unlink()
+    rag_loader._clear_cache()
+    vectors = rag_loader.ensure_vectors(parquet_path)
+    assert vectors[0]["meta"] == {"source": "a"}
+    assert np.allclose(vectors[1]["embedding"], [0.0, 1.0])
+
+    redis.reads.clear()
+    monkeypatch.setattr(rag_loader, "_VECTOR_CHECKED_AT", None)
+    rag_loader.ensure_vectors(parquet_path)
+    assert redis.reads == [rag_loader._REDIS_MANIFEST_KEY]
+
+
+def test_second_worker_maps_local_sidecars_instead_of_copying_from_redis(monkeypatch, parquet_path):
+    redis = CountingRedis()
+    monkeypatch.setattr(rag_loader, "_get_redis_client", lambda: redis)
+    monkeypatch.setattr(rag_loader, "_attempt_git_lfs_pull", lambda: None)
+    rag_loader._clear_cache()
+    rag_loader.ensure_vectors(parquet_path)
+    manifest = json.loads(redis.store[rag_loader._REDIS_MANIFEST_KEY])
+
+    # A fresh worker process: same file on disk, snapshot already published.
+    rag_loader._clear_cache()
+    redis.reads.clear()
+    monkeypatch.setattr(
+        rag_loader, "_cache_in_redis", lambda *args: pytest.fail("an already published snapshot must not be republished")
+    )
+    vectors = rag_loader.ensure_vectors(parquet_path)
+
+    assert isinstance(vectors.embeddings, np.memmap)
+    assert isinstance(rag_loader._SNAPSHOT.matrix, np.memmap)
+    assert redis.reads == [rag_loader._REDIS_MANIFEST_KEY]
+    assert rag_loader._VECTOR_VERSION == manifest["version"]
+    rag_loader._clear_cache()
+
+
+def test_ensure_vectors_fast_path_skips_lock_stat_and_redis(monkeypatch, parquet_path):
+    redis = CountingRedis()
+    monkeypatch.setattr(rag_loader, "_get_redis_client", lambda: redis)
+    monkeypatch.setattr(rag_loader, "_attempt_git_lfs_pull", lambda: None)
+    rag_loader._clear_cache()
+    vectors = rag_loader.ensure_vectors(parquet_path)
+
+    class ExplodingLock:
+        def __enter__(self):
+            raise AssertionError("fast path must not take the lock")
+
+        def __exit__(self, *exc):
+            return False
+
+    redis.reads.clear()
+    monkeypatch.setattr(rag_loader, "_VECTOR_LOCK", ExplodingLock())
+    monkeypatch.setattr(Path, "stat", lambda self: (_ for _ in ()).throw(AssertionError("stat called")))
+    assert rag_loader.ensure_vectors(parquet_path) is vectors
+    assert redis.reads == []
+    monkeypatch.undo()
+
+    # Once the interval has elapsed the next call re-validates the snapshot.
+    monkeypatch.setattr(rag_loader, "_VECTOR_CHECK_INTERVAL", 0.0)
+    monkeypatch.setattr(rag_loader, "_get_redis_client", lambda: redis)
+    assert rag_loader.ensure_vectors(parquet_path) is vectors
+    rag_loader._clear_cache()
+
+
+def test_redis_snapshot_republish_drops_previous_version(monkeypatch, parquet_path):
+    redis = StubRedis()
+    redis.store[rag_loader._REDIS_CACHE_KEY] = "legacy-json"
+    table = rag_loader.load_vectors(parquet_path)
+    first = rag_loader._cache_in_redis(redis, table, 1.0, None)
+
+    table.embeddings = np.array([[0.6, 0.8], [0.0, 1.0]], dtype=np.float32)
+    second = rag_loader._cache_in_redis(redis, table, 2.0, None)
+
+    assert first != second
+    assert rag_loader._REDIS_CACHE_KEY not in redis.store
+    assert rag_loader._redis_chunk_key(first, 0) not in redis.store
+    assert rag_loader._redis_meta_key(first) not in redis.store
+    assert json.loads(redis.store[rag_loader._REDIS_MANIFEST_KEY])["version"] == second
+
+
+def test_incomplete_redis_snapshot_is_ignored(monkeypatch, parquet_path):
+    redis = StubRedis()
+    table = rag_loader.load_vectors(parquet_path)
+    version = rag_loader._cache_in_redis(redis, table, 1.0, None)
+    redis.delete(rag_loader._redis_chunk_key(version, 0))
+    manifest = rag_loader._load_redis_manifest(redis)
+    assert rag_loader._load_cache_from_redis(redis, manifest) is None
@@ -0,0 +1,74 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPTS_PATH = Path(__file__).resolve().parents[2] / "scripts"
+if str(SCRIPTS_PATH) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_PATH))
+
+import rag_utils  # noqa: E402
+
+
+class _FakePage:
+    def __init__(self, text):
+        self._text = text
+
+    def extract_text(self):
+        return self._text
+
+
+class _FakeReader:
+    def __init__(self, *texts):
+        self.pages = [_FakePage(text) for text in texts]
+
+
+@pytest.fixture
+def fake_pdf(monkeypatch):
+    def install(*texts):
+        monkeypatch.setattr(rag_utils, "_load_pdf_reader", lambda path: _FakeReader(*texts))
+        monkeypatch.setattr(rag_utils, "_page_hash", lambda reader, index: f"hash-{index}")
+
+    return install
+
+
+@pytest.fixture
+def ocr_calls(monkeypatch):
+    calls = []
+
+    def fake_ocr(file_path, page_number, page_hash="", cache_dir=None):
+        calls.append((page_number, page_hash))
+        return f"ocr page {page_number}"
+
+    monkeypatch.setattr(rag_utils, "_ocr_page", fake_ocr)
+    return calls
+
+
+def test_text_pdf_blank_pages_are_not_ocrd(fake_pdf, ocr_calls):
+    fake_pdf("第一頁", "", "第三頁")
+
+    assert rag_utils._pdf_text_layer(Path("doc.pdf")) == (["第一頁", "", "第三頁"], {})
+    assert rag_utils._extract_pdf_text(Path("doc.pdf")) == "第一頁\n\n第三頁"
+    assert ocr_calls == []
+
+
+def test_scanned_pdf_falls_back_to_ocr_for_every_page(fake_pdf, ocr_calls):
+    fake_pdf("", "  ")
+
+    assert rag_utils._pdf_text_layer(Path("scan.pdf")) == (["", ""], {0: "hash-0", 1: "hash-1"})
+    assert rag_utils._extract_pdf_text(Path("scan.pdf")) == "ocr page 1\n\nocr page 2"
+    assert ocr_calls == [(1, "hash-0"), (2, "hash-1")]
+
+
+def test_missing_ocr_tooling_skips_pages_with_warning(fake_pdf, monkeypatch, caplog):
+    fake_pdf("")
+
+    def no_poppler(*args, **kwargs):
+        raise RuntimeError("Failed to rasterize PDF for OCR. Ensure Poppler utilities are installed and accessible.")
+
+    monkeypatch.setattr(rag_utils, "_ocr_page", no_poppler)
+
+    with caplog.at_level("WARNING", logger=rag_utils.LOGGER.name):
+        assert rag_utils._extract_pdf_text(Path("scan.pdf")) == ""
+        assert rag_utils._ocr_task((Path("scan.pdf"), 1, "hash-0", None)) is None
+    assert "Skipping OCR of scan.pdf page 1" in caplog.text
@@ -0,0 +1,109 @@
+import pytest
+from google.genai import types as genai_types
+
+from app.ai import genai_client, response_cache
+
+
+@pytest.fixture(autouse=True)
+def _reset_stats():
+    response_cache.reset_response_cache_stats()
+    yield
+    response_cache.reset_response_cache_stats()
+
+
+class DummyModels:
+    def __init__(self, finish_reason="STOP"):
+        self.finish_reason = finish_reason
+        self.calls = []
+
+    def generate_content(self, *, model, contents, config):
+        self.calls.append((model, contents, config))
+        return genai_types.GenerateContentResponse(
+            candidates=[
+                genai_types.Candidate(
+                    content=genai_types.Content(role="model", parts=[genai_types.Part(text=f"回應 {len(self.calls)}")]),
+                    finish_reason=self.finish_reason,
+                )
+            ]
+        )
+
+
+@pytest.fixture
+def dummy_models(monkeypatch):
+    models = DummyModels()
+    client = type("DummyClient", (), {"models": models})()
+    monkeypatch.setattr(genai_client, "_get_client", lambda api_key: client)
+    return models
+
+
+def test_cache_policy_serves_identical_prompt_from_redis(app, dummy_models):
+    first = genai_client.generate_content("季節提示", api_key="key", cache_policy="agent_tip")
+    second = genai_client.generate_content("季節提示", api_key="key", cache_policy="agent_tip")
+
+    assert len(dummy_models.calls) == 1
+    assert first.cached is False
+    assert second.cached is True
+    assert second.text == first.text
+    assert second.finish_reason == "STOP"
+
+    stats = response_cache.get_response_cache_stats()
+    assert stats["policies"]["agent_tip"] == {"hits": 1, "misses": 1, "stores": 1, "errors": 0}
+    assert stats["ttl_seconds"]["agent_tip"] == response_cache.RESPONSE_CACHE_POLICIES["agent_tip"]
+
+
+def test_cache_key_covers_contents_and_generation_config(app, dummy_models):
+    genai_client.generate_content("提示", api_key="key", cache_policy="agent_tip")
+    genai_client.generate_content("另一個提示", api_key="key", cache_policy="agent_tip")
+    genai_client.generate_content(
+        "提示", api_key="key", generation_config_override={"temperature": 0.9}, cache_policy="agent_tip"
+    )
+    genai_client.generate_content("提示", api_key="key", model="gemini-other", cache_policy="agent_tip")
+
+    assert len(dummy_models.calls) == 4
+
+
+def test_calls_without_policy_are_not_cached(app, dummy_models):
+    genai_client.generate_content("提示", api_key="key")
+    result = genai_client.generate_content("提示", api_key="key")
+
+    assert len(dummy_models.calls) == 2
+    assert result.cached is False
+    assert response_cache.get_response_cache_stats()["policies"] == {}
+
+
+def test_truncated_responses_are_not_stored(app, dummy_models):
+    dummy_models.finish_reason = "MAX_TOKENS"
+
+    genai_client.generate_content("提示", api_key="key", cache_policy="analytics_report")
+    genai_client.generate_content("提示", api_key="key", cache_policy="analytics_report")
+
+    assert len(dummy_models.calls) == 2
+    assert response_cache.get_response_cache_stats()["policies"]["analytics_report"]["stores"] == 0
+
+
+def test_disabled_policy_bypasses_cache(app, dummy_models, monkeypatch):
+    monkeypatch.setitem(response_cache.RESPONSE_CACHE_POLICIES, "agent_tip", 0)
+
+    genai_client.generate_content("提示", api_key="key", cache_policy="agent_tip")
+    genai_client.generate_content("提示", api_key="key", cache_policy="agent_tip")
+
+    assert len(dummy_models.calls) == 2
+
+
+def test_unknown_policy_is_rejected(app, dummy_models):
+    with pytest.raises(KeyError):
+        genai_client.generate_content("提示", api_key="key", cache_policy="no_such_policy")
+
+
+def test_tip_endpoint_reuses_cached_answer(authenticated_client, dummy_models):
+    headers = {"X-Api-Key": "test-api-key"}
+
+    first = authenticated_client.get("/api/agent/tip", headers=headers)
+    second = authenticated_client.get("/api/agent/tip", headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert first.get_json() == second.get_json()
+    assert len(dummy_models.calls) == 1
+
+    status = authenticated_client.get("/api/agent/status", headers=headers).get_json()
+    assert status["response_cache"]["policies"]["agent_tip"]["hits"] == 1
@@ -1,3 +1,6 @@
+import pytest
+
+from app.in_memory_redis import InMemoryRedis
 from app.simple_queue import SimpleJob, SimpleQueue, SimpleWorker
 
 
@@ -36,3 +39,44 @@ def test_simple_job_perform():
     job = SimpleJob(sample_task, (5, 7), {}, description=None)
     assert job.perform() == 12
     assert job.func_name.endswith("sample_task")
+
+
+def failing_task():
+    raise RuntimeError("boom")
+
+
+def test_redis_backed_queue_is_shared_between_instances():
+    redis = InMemoryRedis()
+    producer = SimpleQueue("jobs", connection=redis)
+    job = producer.enqueue(sample_task, 1, 2, description="addition")
+
+    consumer = SimpleQueue("jobs", connection=redis)
+    assert consumer.fetch_job(job.id).status == "queued"
+
+    SimpleWorker(consumer, sleep=0).work(burst=True)
+
+    fetched = producer.fetch_job(job.id)
+    assert fetched.status == "finished"
+    assert fetched.args == (1, 2)
+    assert fetched.func_name.endswith("sample_task")
+    assert consumer.pop_job() is None
+
+
+def test_worker_records_failures_and_keeps_going():
+    redis = InMemoryRedis()
+    queue = SimpleQueue("jobs", connection=redis)
+    failed = queue.enqueue(failing_task)
+    succeeded = queue.enqueue(sample_task, 2, 3)
+
+    SimpleWorker(queue, sleep=0).work(burst=True)
+
+    failed = queue.fetch_job(failed.id)
+    assert failed.status == "failed"
+    assert "boom" in failed.error
+    assert queue.fetch_job(succeeded.id).status == "finished"
+
+
+def test_redis_backed_queue_rejects_local_functions():
+    queue = SimpleQueue("jobs", connection=InMemoryRedis())
+    with pytest.raises(ValueError):
+        queue.enqueue(lambda: None)
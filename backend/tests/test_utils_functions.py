@@ -7,8 +7,11 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
+from google.genai import types as genai_types
+
+from app.ai import genai_client
 from app.ai.genai_client import GenAIClientError, GenAIResponse, GenAIPromptBlocked
-from app.utils import call_gemini_api, get_sheep_info_for_context
+from app.utils import call_gemini_api, call_gemini_api_many, get_sheep_info_for_context, stream_gemini_api
 
 
 class TestUtilsFunctions:
@@ -208,3 +211,156 @@ class TestUtilsFunctions:
 
         assert result["text"] == ""
         assert result["finish_reason"] == "STOP"
+
+    @patch('app.utils.stream_content')
+    def test_stream_gemini_api_yields_fragments_then_error(self, mock_stream):
+        """測試串流調用逐段回傳，並在中途失敗時回傳錯誤後結束"""
+
+        def fragments(*args, **kwargs):
+            yield "第一段"
+            yield "第二段"
+            raise GenAIClientError("GenAI API error (code 503): unavailable")
+
+        mock_stream.side_effect = fragments
+
+        result = list(stream_gemini_api("測試", "test_key"))
+
+        assert result == [
+            {"text": "第一段"},
+            {"text": "第二段"},
+            {"error": "GenAI API error (code 503): unavailable"},
+        ]
+
+    def test_stream_content_uses_streaming_api(self, monkeypatch):
+        """測試 stream_content 透過 SDK 串流 API 逐段產出文字並略過空片段"""
+
+        def chunk(text):
+            parts = [genai_types.Part(text=text)] if text else []
+            return genai_types.GenerateContentResponse(
+                candidates=[genai_types.Candidate(content=genai_types.Content(role="model", parts=parts))]
+            )
+
+        client = MagicMock()
+        client.models.generate_content_stream.return_value = iter([chunk("你好"), chunk(""), chunk("，世界")])
+        monkeypatch.setattr(genai_client, "_get_client", lambda api_key: client)
+
+        assert list(genai_client.stream_content("hi", api_key="key")) == ["你好", "，世界"]
+        client.models.generate_content.assert_not_called()
+
+    def test_stream_content_raises_when_prompt_blocked(self, monkeypatch):
+        """測試串流時提示詞被阻擋會拋出 GenAIPromptBlocked"""
+
+        blocked = genai_types.GenerateContentResponse(
+            prompt_feedback=genai_types.GenerateContentResponsePromptFeedback(block_reason="SAFETY")
+        )
+        client = MagicMock()
+        client.models.generate_content_stream.return_value = iter([blocked])
+        monkeypatch.setattr(genai_client, "_get_client", lambda api_key: client)
+
+        with pytest.raises(GenAIPromptBlocked):
+            list(genai_client.stream_content("hi", api_key="key"))
+
+    @patch('app.utils.generate_content_many')
+    def test_call_gemini_api_many_maps_results_in_order(self, mock_many):
+        """測試並行調用依原順序回傳結果，失敗項目轉為錯誤訊息"""
+
+        mock_many.return_value = [
+            GenAIResponse(text="甲", finish_reason="STOP", raw_response=MagicMock(), candidate=MagicMock()),
+            GenAIPromptBlocked("SAFETY", []),
+            GenAIClientError("GenAI API error (code 503): unavailable"),
+        ]
+
+        result = call_gemini_api_many(["a", "b", "c"], "test_key", max_concurrency=2)
+
+        assert result[0] == {"text": "甲", "finish_reason": "STOP", "cached": False}
+        assert "提示詞被拒絕" in result[1]["error"]
+        assert result[2] == {"error": "GenAI API error (code 503): unavailable"}
+        assert mock_many.call_args.kwargs["max_concurrency"] == 2
+
+
+class TestSheepContextCache:
+    """羊隻背景快照快取測試"""
+
+    @pytest.fixture
+    def herd(self, app, test_user):
+        from app import db
+        from app.models import Sheep, SheepEvent, SheepHistoricalData
+
+        first = Sheep(user_id=test_user.id, EarNum='CTX-A')
+        second = Sheep(user_id=test_user.id, EarNum='CTX-B')
+        db.session.add_all([first, second])
+        db.session.flush()
+        for day in range(1, 8):
+            db.session.add(SheepEvent(user_id=test_user.id, sheep_id=first.id, event_date=f'2024-01-{day:02d}', event_type='測量'))
+        for day in range(1, 13):
+            db.session.add(SheepHistoricalData(
+                user_id=test_user.id, sheep_id=first.id, record_date=f'2024-02-{day:02d}',
+                record_type='Body_Weight_kg', value=40 + day,
+            ))
+        db.session.add(SheepEvent(user_id=test_user.id, sheep_id=second.id, event_date='2024-03-01', event_type='疫苗接種'))
+        db.session.commit()
+        return test_user.id
+
+    @staticmethod
+    def _record_loads(monkeypatch):
+        from app import utils
+
+        loaded = []
+        original_load = utils._load_sheep_contexts
+
+        def recording_load(ear_nums, user_id):
+            loaded.append(list(ear_nums))
+            return original_load(ear_nums, user_id)
+
+        monkeypatch.setattr(utils, '_load_sheep_contexts', recording_load)
+        return loaded
+
+    def test_bulk_variant_applies_per_sheep_limits(self, herd):
+        from app.utils import get_sheep_info_for_contexts
+
+        contexts = get_sheep_info_for_contexts(['CTX-A', 'CTX-B', 'MISSING'], herd)
+
+        assert set(contexts) == {'CTX-A', 'CTX-B'}
+        assert [e['event_date'] for e in contexts['CTX-A']['recent_events']] == [f'2024-01-{d:02d}' for d in range(7, 2, -1)]
+        assert [h['record_date'] for h in contexts['CTX-A']['history_records']][:2] == ['2024-02-12', '2024-02-11']
+        assert len(contexts['CTX-A']['history_records']) == 10
+        assert [e['event_type'] for e in contexts['CTX-B']['recent_events']] == ['疫苗接種']
+        assert contexts['CTX-B']['history_records'] == []
+
+    def test_second_lookup_is_served_from_cache(self, herd, monkeypatch):
+        first = get_sheep_info_for_context('CTX-A', herd)
+
+        def fail_load(*args):
+            raise AssertionError('snapshot should come from Redis')
+
+        monkeypatch.setattr('app.utils._load_sheep_contexts', fail_load)
+        assert get_sheep_info_for_context('CTX-A', herd) == first
+
+    def test_sheep_writes_invalidate_only_that_snapshot(self, authenticated_client, herd, monkeypatch):
+        from app import utils
+
+        utils.get_sheep_info_for_contexts(['CTX-A', 'CTX-B'], herd)
+
+        response = authenticated_client.post(
+            '/api/sheep/CTX-B/events', json={'event_date': '2024-04-01', 'event_type': '驅蟲'}
+        )
+        assert response.status_code == 201
+
+        loaded = self._record_loads(monkeypatch)
+
+        contexts = utils.get_sheep_info_for_contexts(['CTX-A', 'CTX-B'], herd)
+
+        assert loaded == [['CTX-B']]
+        assert contexts['CTX-B']['recent_events'][0]['event_type'] == '驅蟲'
+
+    def test_user_wide_invalidation(self, herd, monkeypatch):
+        from app import utils
+        from app.cache import clear_sheep_context_cache
+
+        utils.get_sheep_info_for_contexts(['CTX-A', 'CTX-B'], herd)
+        clear_sheep_context_cache(herd)
+
+        loaded = self._record_loads(monkeypatch)
+        utils.get_sheep_info_for_contexts(['CTX-A', 'CTX-B'], herd)
+
+        assert loaded == [['CTX-A', 'CTX-B']]
@@ -0,0 +1,106 @@
+"""Compare the pandas and NumPy LightGBM inference paths used by the prediction API.
+
+Loads the registered models when they exist; otherwise trains a small stand-in
+model on ``backend/models/prepared_sheep_growth_data_clean.csv`` so the
+comparison can still run on a checkout without the model artefacts.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+BACKEND_PATH = REPO_ROOT / "backend"
+if str(BACKEND_PATH) not in sys.path:
+    sys.path.insert(0, str(BACKEND_PATH))
+
+from app.api import prediction  # type: ignore  # noqa: E402
+
+TRAINING_CSV = BACKEND_PATH / "models" / "prepared_sheep_growth_data_clean.csv"
+
+
+def _train_stand_in_models(rows: int):
+    from lightgbm import LGBMRegressor
+
+    data = pd.read_csv(TRAINING_CSV, encoding="utf-8-sig", nrows=rows)
+    features = data[prediction.LGBM_FEATURE_ORDER].copy()
+    for feature in prediction.LGBM_CATEGORICAL_FEATURE_LIST:
+        features[feature] = features[feature].astype("category")
+
+    models = {}
+    for key, params in (
+        ("main", {}),
+        ("q10", {"objective": "quantile", "alpha": 0.1}),
+        ("q90", {"objective": "quantile", "alpha": 0.9}),
+    ):
+        model = LGBMRegressor(n_estimators=200, num_leaves=31, verbose=-1, **params)
+        model.fit(features, data["Weight"])
+        models[key] = model
+    return models
+
+
+def _prepare_models(rows: int) -> str:
+    if prediction.model_registry.load():
+        source = f"registry (version {prediction.model_registry.version})"
+    else:
+        prediction.model_registry.models = _train_stand_in_models(rows)
+        source = f"stand-in trained on {rows} rows of {TRAINING_CSV.name}"
+    prediction._sync_from_registry()
+    return source
+
+
+def _time(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark LightGBM inference paths.")
+    parser.add_argument("--days", type=int, default=30, help="Forecast horizon per sheep (rows per call).")
+    parser.add_argument("--repeat", type=int, default=500, help="Timed iterations per path.")
+    parser.add_argument("--train-rows", type=int, default=5000, help="Rows used for the stand-in model.")
+    args = parser.parse_args()
+
+    source = _prepare_models(args.train_rows)
+    if not prediction._lgbm_fast_path_ready():
+        raise SystemExit("NumPy fast path unavailable: models expose no Booster or category levels")
+
+    sheep = SimpleNamespace(
+        BirWei=3.4, Sex="母", Breed="努比亞", LittleSize=2,
+        Lactation=None, DaysInMilk=None, ReproStatus=None, status=None,
+    )
+    today = date.today()
+    ages = [150 + offset for offset in range(args.days + 1)]
+    dates = [today + timedelta(days=offset) for offset in range(args.days + 1)]
+
+    def pandas_path():
+        frame, _ = prediction._build_lgbm_feature_frame(sheep, ages, dates)
+        return prediction._predict_lgbm_curves(frame)
+
+    def numpy_path():
+        matrix, _ = prediction._build_lgbm_feature_matrix(sheep, ages, dates)
+        return prediction._predict_lgbm_curves(matrix)
+
+    for expected, actual in zip(pandas_path(), numpy_path()):
+        np.testing.assert_allclose(actual, expected, rtol=1e-6, atol=1e-6)
+
+    pandas_ms = _time(pandas_path, args.repeat)
+    numpy_ms = _time(numpy_path, args.repeat)
+
+    print(f"Models: {source}")
+    print(f"Rows per call: {len(ages)}; outputs match (rtol=1e-6)")
+    print(f"pandas path: {pandas_ms:.3f} ms/call")
+    print(f"numpy path:  {numpy_ms:.3f} ms/call ({pandas_ms / numpy_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
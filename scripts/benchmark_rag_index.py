@@ -0,0 +1,94 @@
+"""Recall-vs-latency benchmark for the RAG index types in ``app/rag_loader.py``.
+
+Every index is compared against exact inner-product search over the same
+L2-normalised matrix. Uses the real corpus when ``--vectors`` points at a
+parquet file, otherwise a synthetic clustered corpus of ``--size`` rows.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+BACKEND_PATH = REPO_ROOT / "backend"
+if str(BACKEND_PATH) not in sys.path:
+    sys.path.insert(0, str(BACKEND_PATH))
+
+from app import rag_loader  # type: ignore  # noqa: E402
+
+
+def _normalise(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def _synthetic_corpus(size: int, dimension: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(max(1, size // 50), dimension)).astype(np.float32)
+    rows = topics[rng.integers(0, len(topics), size)]
+    return _normalise(rows + 0.3 * rng.normal(size=(size, dimension)).astype(np.float32))
+
+
+def _load_corpus(args) -> np.ndarray:
+    if args.vectors:
+        vectors = rag_loader.load_vectors(args.vectors)
+        return _normalise(np.vstack([item["embedding"] for item in vectors]).astype(np.float32))
+    return _synthetic_corpus(args.size, args.dim, args.seed)
+
+
+def _recall(found, expected) -> float:
+    hits = [len(set(map(int, got)) & set(map(int, want))) / len(want) for got, want in zip(found, expected)]
+    return float(np.mean(hits))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark RAG ANN index types against exact search.")
+    parser.add_argument("--vectors", type=Path, help="Parquet vector store to benchmark instead of synthetic data.")
+    parser.add_argument("--size", type=int, default=20000, help="Synthetic corpus size.")
+    parser.add_argument("--dim", type=int, default=768, help="Synthetic embedding dimension.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not rag_loader._FAISS_AVAILABLE:
+        raise SystemExit("faiss-cpu is required for this benchmark")
+
+    embeddings = _load_corpus(args)
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(0, len(embeddings), args.queries)
+    queries = _normalise(embeddings[picks] + 0.1 * rng.normal(size=(args.queries, embeddings.shape[1])).astype(np.float32))
+    print(f"Corpus: {embeddings.shape[0]} x {embeddings.shape[1]}, {args.queries} queries, top-{args.top_k}")
+
+    start = time.perf_counter()
+    expected = [np.argsort(embeddings @ query)[::-1][: args.top_k] for query in queries]
+    sort_ms = (time.perf_counter() - start) / args.queries * 1000
+    start = time.perf_counter()
+    partitioned = [rag_loader.top_k_indices(embeddings @ query, args.top_k) for query in queries]
+    partition_ms = (time.perf_counter() - start) / args.queries * 1000
+    print(f"{'numpy argsort':<44} recall=1.000 query={sort_ms:7.3f} ms")
+    print(f"{'numpy argpartition':<44} recall={_recall(partitioned, expected):.3f} query={partition_ms:7.3f} ms")
+
+    base = rag_loader.index_config()
+    for index_type in rag_loader._INDEX_TYPES:
+        config = dict(base, type=index_type)
+        start = time.perf_counter()
+        index, description = rag_loader.build_faiss_index(embeddings.copy(), config)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = [rag_loader.search_index(index, embeddings, query, args.top_k)[1] for query in queries]
+        query_ms = (time.perf_counter() - start) / args.queries * 1000
+        print(
+            f"{description:<44} recall={_recall(found, expected):.3f} "
+            f"query={query_ms:7.3f} ms build={build_s:6.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
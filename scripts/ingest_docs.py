@@ -1,10 +1,25 @@
-"""Convert docs/rag_sources/ documents into normalized Gemini embeddings."""
+"""Convert docs/rag_sources/ documents into normalized Gemini embeddings.
+
+Ingestion is incremental: ``<output dir>/manifest.json`` records the content
+hash of every source file and of each of its chunks, and each source file owns
+one partition under ``<output dir>/partitions/``. Unchanged files are not even
+re-read, changed files only embed chunks whose hash is new, and partitions of
+deleted files are removed. Files whose OCR was skipped because Poppler or
+Tesseract is missing are flagged ``ocr_incomplete`` and extracted again on the
+next run. The combined ``corpus.parquet`` is reassembled from
+the partitions without calling the embedding API. When there is no manifest
+yet (the first run after upgrading from a single ``corpus.parquet``), chunks
+whose text already appears in the existing corpus reuse its embeddings.
+"""
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
+import shutil
 import sys
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Set, Tuple
 
 import pandas as pd
 
@@ -14,63 +29,291 @@ if str(BACKEND_PATH) not in sys.path:
     sys.path.insert(0, str(BACKEND_PATH))
 
 from app.ai import EmbeddingError, embed_documents  # type: ignore  # noqa: E402
-from rag_utils import chunk_text, iter_source_files, read_text  # noqa: E402
+from app.ai.embedding import EMBEDDING_DIMENSION, EMBEDDING_MODEL  # type: ignore  # noqa: E402
+from app.rag_loader import read_vector_parquet, write_vector_store  # type: ignore  # noqa: E402
+from rag_utils import (  # noqa: E402
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_CHUNK_SIZE,
+    chunk_text,
+    extract_texts,
+    iter_source_files,
+    read_text,
+)
 
 DEFAULT_SOURCE_DIR = REPO_ROOT / "docs" / "rag_sources"
 DEFAULT_TARGET_PATH = REPO_ROOT / "docs" / "rag_vectors" / "corpus.parquet"
+DEFAULT_CHECKPOINT_DIR = REPO_ROOT / ".cache" / "rag_embeddings"
+DEFAULT_OCR_CACHE_DIR = REPO_ROOT / ".cache" / "ocr"
+MANIFEST_NAME = "manifest.json"
+PARTITION_DIR_NAME = "partitions"
+VECTOR_COLUMNS = ["doc_path", "chunk_index", "text", "embedding", "meta"]
 
 
-def build_records(files: List[Path]) -> List[Dict[str, object]]:
-    records: List[Dict[str, object]] = []
-    for file_path in files:
-        rel_path = file_path.relative_to(REPO_ROOT)
+def build_file_records(file_path: Path, text: str | None = None) -> List[Dict[str, object]]:
+    rel_path = file_path.relative_to(REPO_ROOT)
+    if text is None:
         text = read_text(file_path)
-        chunks = chunk_text(text)
-        for idx, chunk in enumerate(chunks):
-            records.append(
-                {
-                    "doc_path": str(rel_path),
-                    "chunk_index": idx,
-                    "text": chunk,
-                    "meta": {"source": str(rel_path)},
-                }
-            )
-    return records
+    return [
+        {
+            "doc_path": str(rel_path),
+            "chunk_index": idx,
+            "text": chunk,
+            "meta": {"source": str(rel_path)},
+        }
+        for idx, chunk in enumerate(chunk_text(text))
+    ]
+
+
+def _sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(file_path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return _sha256_bytes(text.encode("utf-8"))
+
+
+def _manifest_settings() -> Dict[str, object]:
+    return {
+        "model": EMBEDDING_MODEL,
+        "dimension": EMBEDDING_DIMENSION,
+        "chunk_size": DEFAULT_CHUNK_SIZE,
+        "chunk_overlap": DEFAULT_CHUNK_OVERLAP,
+    }
+
+
+def load_manifest(manifest_path: Path) -> Dict[str, Dict[str, object]]:
+    """Return the per-file manifest entries, or ``{}`` when settings changed (full rebuild)."""
+    if not manifest_path.exists():
+        return {}
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("settings") != _manifest_settings():
+        print("Embedding or chunking settings changed; rebuilding every partition.")
+        return {}
+    return manifest.get("files", {})
+
+
+def save_manifest(manifest_path: Path, files: Dict[str, Dict[str, object]]) -> None:
+    payload = {"settings": _manifest_settings(), "files": dict(sorted(files.items()))}
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    tmp_path.replace(manifest_path)
+
+
+def partition_path(partition_dir: Path, rel_path: str) -> Path:
+    return partition_dir / f"{_sha256_bytes(rel_path.encode('utf-8'))[:16]}.parquet"
+
 
+def _previous_embeddings(partition_file: Path) -> Dict[str, List[float]]:
+    """Map chunk hash -> embedding for chunks already stored in a partition."""
+    if not partition_file.exists():
+        return {}
+    previous = pd.read_parquet(partition_file, columns=["text", "embedding"])
+    return {chunk_hash(text): list(embedding) for text, embedding in zip(previous["text"], previous["embedding"])}
 
-def embed_records(records: List[Dict[str, object]]) -> None:
+
+def _corpus_embeddings(output_path: Path) -> Dict[str, List[float]]:
+    """Map chunk hash -> embedding for an existing corpus built before manifests existed."""
+    if not output_path.exists():
+        return {}
+    try:
+        corpus = pd.read_parquet(output_path, columns=["text", "embedding"])
+    except Exception as exc:
+        print(f"Unable to reuse embeddings from {output_path}: {exc}")
+        return {}
+    return {
+        chunk_hash(text): list(embedding)
+        for text, embedding in zip(corpus["text"], corpus["embedding"])
+        if len(embedding) == EMBEDDING_DIMENSION
+    }
+
+
+def _write_partition(partition_file: Path, records: List[Dict[str, object]]) -> None:
+    partition_file.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(records, columns=VECTOR_COLUMNS).to_parquet(partition_file, index=False)
+
+
+def _print_progress(done: int, total: int) -> None:
+    print(f"embedded batch {done}/{total}", flush=True)
+
+
+def embed_records(
+    records: List[Dict[str, object]],
+    *,
+    workers: int | None = None,
+    checkpoint_dir: Path | None = None,
+) -> None:
     texts = [record["text"] for record in records]
-    embeddings = embed_documents(texts)
+    embeddings = embed_documents(
+        texts,
+        max_workers=workers,
+        checkpoint_dir=checkpoint_dir,
+        progress=_print_progress,
+    )
     if len(embeddings) != len(records):
         raise RuntimeError("Mismatch between generated embeddings and records")
     for record, vector in zip(records, embeddings):
         record["embedding"] = vector.astype(float).tolist()
 
 
-def save_vectors(records: List[Dict[str, object]], output_path: Path) -> None:
+def assemble_corpus(partition_files: List[Path], output_path: Path) -> int:
+    """Concatenate partitions (in source order) into the corpus snapshot and its sidecars."""
+    frames = [pd.read_parquet(path) for path in partition_files]
+    frames = [frame for frame in frames if not frame.empty]
+    corpus = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=VECTOR_COLUMNS)
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    df = pd.DataFrame(records, columns=["doc_path", "chunk_index", "text", "embedding", "meta"])
-    df.to_parquet(output_path, index=False)
+    corpus[VECTOR_COLUMNS].to_parquet(output_path, index=False)
+    write_vector_store(read_vector_parquet(output_path), output_path)
+    return len(corpus)
+
+
+def ingest(
+    files: List[Path],
+    output_path: Path,
+    *,
+    workers: int | None = None,
+    checkpoint_dir: Path | None = None,
+    full: bool = False,
+    extract_workers: int | None = None,
+    ocr_cache_dir: Path | None = None,
+) -> Tuple[Dict[str, int], bool]:
+    """Embed new or changed chunks only; returns per-run counters and whether the corpus changed."""
+    manifest_path = output_path.parent / MANIFEST_NAME
+    partition_dir = output_path.parent / PARTITION_DIR_NAME
+    previous_files = {} if full else load_manifest(manifest_path)
+    # Without a manifest there are no partitions yet, so seed from the existing corpus instead.
+    seeded = {} if full or manifest_path.exists() else _corpus_embeddings(output_path)
+
+    current_files: Dict[str, Dict[str, object]] = {}
+    pending: List[Tuple[str, Path, List[Dict[str, object]]]] = []
+    stats = {
+        "unchanged_files": 0,
+        "changed_files": 0,
+        "deleted_files": 0,
+        "ocr_incomplete_files": 0,
+        "reused_chunks": 0,
+        "embedded_chunks": 0,
+    }
+
+    changed: List[Tuple[Path, str, str, Path]] = []
+    for file_path in files:
+        rel_path = str(file_path.relative_to(REPO_ROOT))
+        digest = file_hash(file_path)
+        partition_file = partition_path(partition_dir, rel_path)
+        previous = previous_files.get(rel_path)
+        unchanged = previous and previous.get("sha256") == digest and not previous.get("ocr_incomplete")
+        if unchanged and partition_file.exists():
+            current_files[rel_path] = previous
+            stats["unchanged_files"] += 1
+            continue
+        changed.append((file_path, rel_path, digest, partition_file))
+
+    ocr_incomplete: Set[Path] = set()
+    texts = extract_texts(
+        [file_path for file_path, _, _, _ in changed],
+        max_workers=extract_workers,
+        ocr_cache_dir=ocr_cache_dir,
+        ocr_incomplete=ocr_incomplete,
+    )
+    for file_path, rel_path, digest, partition_file in changed:
+        records = build_file_records(file_path, texts[file_path])
+        reusable = {} if full else {**seeded, **_previous_embeddings(partition_file)}
+        for record in records:
+            embedding = reusable.get(chunk_hash(record["text"]))
+            if embedding is not None:
+                record["embedding"] = embedding
+                stats["reused_chunks"] += 1
+        current_files[rel_path] = {
+            "sha256": digest,
+            "partition": partition_file.name,
+            "chunks": [chunk_hash(record["text"]) for record in records],
+        }
+        if file_path in ocr_incomplete:
+            current_files[rel_path]["ocr_incomplete"] = True
+            stats["ocr_incomplete_files"] += 1
+        pending.append((rel_path, partition_file, records))
+        stats["changed_files"] += 1
+
+    to_embed = [record for _, _, records in pending for record in records if "embedding" not in record]
+    if to_embed:
+        embed_records(to_embed, workers=workers, checkpoint_dir=checkpoint_dir)
+    stats["embedded_chunks"] = len(to_embed)
+
+    for _, partition_file, records in pending:
+        _write_partition(partition_file, records)
+
+    for rel_path in set(previous_files) - set(current_files):
+        partition_path(partition_dir, rel_path).unlink(missing_ok=True)
+        stats["deleted_files"] += 1
+
+    corpus_changed = bool(pending or stats["deleted_files"] or full or not output_path.exists())
+    if corpus_changed:
+        assemble_corpus([partition_path(partition_dir, rel_path) for rel_path in sorted(current_files)], output_path)
+    save_manifest(manifest_path, current_files)
+    return stats, corpus_changed
 
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Generate RAG vectors from project documentation.")
     parser.add_argument("--source", type=str, default=str(DEFAULT_SOURCE_DIR), help="Directory containing source documents")
     parser.add_argument("--output", type=str, default=str(DEFAULT_TARGET_PATH), help="Parquet file path to write")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent embedding requests (default: EMBEDDING_MAX_WORKERS)")
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=str,
+        default=str(DEFAULT_CHECKPOINT_DIR),
+        help="Directory for per-batch checkpoints; an interrupted run resumes from here",
+    )
+    parser.add_argument("--no-checkpoint", action="store_true", help="Disable batch checkpointing")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-embed every chunk")
+    parser.add_argument(
+        "--extract-workers", type=int, default=None, help="Processes for text extraction and OCR (default: CPU count)"
+    )
+    parser.add_argument(
+        "--ocr-cache-dir", type=str, default=str(DEFAULT_OCR_CACHE_DIR), help="Directory caching OCR text per page hash"
+    )
     args = parser.parse_args()
 
     source_dir = Path(args.source).resolve()
     output_path = Path(args.output).resolve()
+    checkpoint_dir = None if args.no_checkpoint else Path(args.checkpoint_dir).resolve()
 
     try:
         files = iter_source_files(source_dir)
         if not files:
             print("No source documents found; nothing to embed.")
             return 0
-        records = build_records(files)
-        embed_records(records)
-        save_vectors(records, output_path)
-        print(f"saved: {output_path} ({len(records)} chunks)")
+        stats, changed = ingest(
+            files,
+            output_path,
+            workers=args.workers,
+            checkpoint_dir=checkpoint_dir,
+            full=args.full,
+            extract_workers=args.extract_workers,
+            ocr_cache_dir=Path(args.ocr_cache_dir).resolve(),
+        )
+        if checkpoint_dir is not None:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        print(
+            "files: {unchanged_files} unchanged, {changed_files} changed, {deleted_files} deleted; "
+            "chunks: {embedded_chunks} embedded, {reused_chunks} reused".format(**stats)
+        )
+        if stats["ocr_incomplete_files"]:
+            print(
+                f"{stats['ocr_incomplete_files']} file(s) skipped OCR pages; install Poppler and Tesseract, "
+                "they are retried on the next run."
+            )
+        print(f"saved: {output_path}" if changed else "Vector store already up to date.")
         return 0
     except (EmbeddingError, FileNotFoundError, ValueError, RuntimeError) as exc:
         print(f"Error: {exc}", file=sys.stderr)
@@ -1,11 +1,14 @@
 """Shared helpers for preparing Retrieval-Augmented Generation inputs."""
 from __future__ import annotations
 
+import hashlib
 import importlib
+import io
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 
 LOGGER = logging.getLogger(__name__)
 
@@ -66,8 +69,7 @@ def chunk_text(
     return chunks
 
 
-def _extract_pdf_text(file_path: Path) -> str:
-    """Extract textual content from a PDF file using text layer or OCR fallback."""
+def _load_pdf_reader(file_path: Path):
     try:
         PdfReader = importlib.import_module("pypdf").PdfReader  # type: ignore[attr-defined]
     except ModuleNotFoundError as exc:  # pragma: no cover - dependency missing
@@ -75,26 +77,76 @@ def _extract_pdf_text(file_path: Path) -> str:
             "PDF support requires the 'pypdf' package. "
             "Please install backend dependencies (pip install -r backend/requirements.txt)."
         ) from exc
+    return PdfReader(str(file_path))
 
-    text_segments: List[str] = []
+
+def _page_hash(reader, page_index: int) -> str:
+    """Hash a single page (content stream and images) by writing it out as a one-page PDF."""
+    PdfWriter = importlib.import_module("pypdf").PdfWriter  # type: ignore[attr-defined]
+    writer = PdfWriter()
+    writer.add_page(reader.pages[page_index])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return hashlib.sha256(buffer.getvalue()).hexdigest()
+
+
+def _pdf_text_layer(file_path: Path) -> Tuple[List[str], Dict[int, str]]:
+    """Extract the text layer page by page.
+
+    OCR is a document-level fallback: only a PDF without any text layer is
+    treated as scanned, in which case every page is returned as missing along
+    with its content hash (used as the OCR cache key). Blank pages of a text
+    PDF (separators, figure-only pages) are not OCR'd.
+    """
+    page_texts: List[str] = []
+    missing: Dict[int, str] = {}
     try:
-        reader = PdfReader(str(file_path))
+        reader = _load_pdf_reader(file_path)
         for page_index, page in enumerate(reader.pages):
             try:
                 page_text = (page.extract_text() or "").strip()
             except Exception as page_exc:  # pragma: no cover - defensive
                 LOGGER.warning("Failed to extract text from %s page %s: %s", file_path, page_index + 1, page_exc)
                 page_text = ""
-            if page_text:
-                text_segments.append(page_text)
+            page_texts.append(page_text)
+        if not any(page_texts):
+            for page_index in range(len(page_texts)):
+                try:
+                    missing[page_index] = _page_hash(reader, page_index)
+                except Exception:  # pragma: no cover - hashing is an optimisation only
+                    missing[page_index] = ""
+    except RuntimeError:
+        raise
     except Exception as exc:  # pragma: no cover - defensive
         LOGGER.warning("Unable to read PDF %s via pypdf: %s", file_path, exc)
+        # Fall back to OCR for every page; without pypdf there is no page hash to cache by.
+        page_count = _pdf_page_count(file_path)
+        page_texts = [""] * page_count
+        missing = {page_index: "" for page_index in range(page_count)}
+    return page_texts, missing
+
+
+def _pdf_page_count(file_path: Path) -> int:
+    try:
+        pdfinfo_from_path = importlib.import_module("pdf2image").pdfinfo_from_path  # type: ignore[attr-defined]
+        info = pdfinfo_from_path(str(file_path), poppler_path=os.environ.get("POPPLER_PATH") or None)
+        return int(info.get("Pages", 0))
+    except Exception as exc:  # pragma: no cover - depends on poppler availability
+        LOGGER.warning("Unable to determine page count of %s for OCR: %s", file_path, exc)
+        return 0
+
 
-    combined_text = "\n\n".join(text_segments).strip()
-    if combined_text:
-        return combined_text
+def _ocr_cache_path(cache_dir: Optional[Path], page_hash: str, dpi: int) -> Optional[Path]:
+    if cache_dir is None or not page_hash:
+        return None
+    return cache_dir / f"{page_hash}-{dpi}.txt"
 
-    LOGGER.info("PDF %s appears to lack an extractable text layer; falling back to OCR", file_path)
+
+def _ocr_page(file_path: Path, page_number: int, page_hash: str = "", cache_dir: Optional[Path] = None) -> str:
+    """Rasterise and OCR one page (1-based), so memory is bounded by a single page image."""
+    cache_path = _ocr_cache_path(cache_dir, page_hash, DEFAULT_OCR_DPI)
+    if cache_path is not None and cache_path.exists():
+        return cache_path.read_text(encoding="utf-8")
 
     try:
         convert_from_path = importlib.import_module("pdf2image").convert_from_path  # type: ignore[attr-defined]
@@ -112,16 +164,22 @@ def _extract_pdf_text(file_path: Path) -> str:
 
     poppler_path = os.environ.get("POPPLER_PATH") or None
     try:
-        images = convert_from_path(str(file_path), dpi=DEFAULT_OCR_DPI, poppler_path=poppler_path)
+        images = convert_from_path(
+            str(file_path),
+            dpi=DEFAULT_OCR_DPI,
+            first_page=page_number,
+            last_page=page_number,
+            poppler_path=poppler_path,
+        )
     except Exception as exc:
         raise RuntimeError(
             "Failed to rasterize PDF for OCR. Ensure Poppler utilities are installed and accessible."
         ) from exc
 
-    ocr_segments: List[str] = []
-    for page_number, image in enumerate(images, start=1):
+    text = ""
+    for image in images:
         try:
-            text = pytesseract.image_to_string(image)
+            text = pytesseract.image_to_string(image).strip()
         except pytesseract.TesseractNotFoundError as exc:
             raise RuntimeError(
                 "Tesseract OCR binary not found. Install 'tesseract-ocr' (and language packs) on the host system."
@@ -129,14 +187,103 @@ def _extract_pdf_text(file_path: Path) -> str:
         except Exception as exc:  # pragma: no cover - defensive
             LOGGER.warning("OCR failed for %s page %s: %s", file_path, page_number, exc)
             text = ""
-        text = text.strip()
-        if text:
-            ocr_segments.append(text)
-        else:
-            LOGGER.debug("OCR produced empty output for %s page %s", file_path, page_number)
+        finally:
+            image.close()
+
+    if not text:
+        LOGGER.debug("OCR produced empty output for %s page %s", file_path, page_number)
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + f".{os.getpid()}.tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        tmp_path.replace(cache_path)
+    return text
+
+
+def _ocr_page_or_skip(
+    file_path: Path, page_number: int, page_hash: str = "", cache_dir: Optional[Path] = None
+) -> Optional[str]:
+    """OCR one page; returns ``None`` with a warning when Poppler or Tesseract is unavailable."""
+    try:
+        return _ocr_page(file_path, page_number, page_hash, cache_dir)
+    except RuntimeError as exc:
+        LOGGER.warning("Skipping OCR of %s page %s: %s", file_path, page_number, exc)
+        return None
+
+
+def _ocr_task(task: Tuple[Path, int, str, Optional[Path]]) -> Optional[str]:
+    file_path, page_number, page_hash, cache_dir = task
+    return _ocr_page_or_skip(file_path, page_number, page_hash, cache_dir)
+
+
+def _document_task(file_path: Path) -> Tuple[Optional[str], List[str], Dict[int, str]]:
+    """Stage one: plain text for .md/.txt, or the per-page text layer for PDFs."""
+    if file_path.suffix.lower() != ".pdf":
+        return read_text(file_path), [], {}
+    page_texts, missing = _pdf_text_layer(file_path)
+    return None, page_texts, missing
+
+
+def _join_pages(page_texts: Sequence[str]) -> str:
+    return "\n\n".join(text for text in page_texts if text).strip()
+
+
+def _extract_pdf_text(file_path: Path, *, ocr_cache_dir: Optional[Path] = None) -> str:
+    """Extract textual content from a PDF file using the text layer, falling back to OCR for scanned PDFs."""
+    page_texts, missing = _pdf_text_layer(file_path)
+    if missing:
+        LOGGER.info("PDF %s has no text layer; running OCR on %s page(s)", file_path, len(missing))
+        for page_index, page_hash in missing.items():
+            page_texts[page_index] = _ocr_page_or_skip(file_path, page_index + 1, page_hash, ocr_cache_dir) or ""
+
+    combined_text = _join_pages(page_texts)
+    if not combined_text:
+        LOGGER.warning("No text could be extracted from PDF %s", file_path)
+    return combined_text
+
+
+def extract_texts(
+    files: Sequence[Path],
+    *,
+    max_workers: Optional[int] = None,
+    ocr_cache_dir: Optional[Path] = None,
+    ocr_incomplete: Optional[Set[Path]] = None,
+) -> Dict[Path, str]:
+    """Extract many documents on a process pool.
+
+    Stage one reads each document (text layer per PDF page); stage two OCRs
+    the pages of PDFs without any text layer, one page per task, so a single
+    large scanned PDF spreads across all workers. OCR output is cached by
+    page content hash under ``ocr_cache_dir``; pages are skipped with a
+    warning when the OCR tooling is missing, and the affected files are added
+    to ``ocr_incomplete`` so callers can retry them later.
+    """
+    if not files:
+        return {}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        documents = dict(zip(files, pool.map(_document_task, files)))
 
-    if not ocr_segments:
-        LOGGER.warning("OCR fallback produced no text for PDF %s", file_path)
-        return ""
+        ocr_tasks = [
+            (file_path, page_index + 1, page_hash, ocr_cache_dir)
+            for file_path, (_, _, missing) in documents.items()
+            for page_index, page_hash in missing.items()
+        ]
+        if ocr_tasks:
+            LOGGER.info("Running OCR on %s page(s) across %s document(s)", len(ocr_tasks), len({t[0] for t in ocr_tasks}))
+        for task, text in zip(ocr_tasks, pool.map(_ocr_task, ocr_tasks)):
+            if text is None:
+                if ocr_incomplete is not None:
+                    ocr_incomplete.add(task[0])
+                continue
+            documents[task[0]][1][task[1] - 1] = text
 
-    return "\n\n".join(ocr_segments).strip()
+    texts: Dict[Path, str] = {}
+    for file_path, (plain_text, page_texts, _) in documents.items():
+        if plain_text is not None:
+            texts[file_path] = plain_text
+            continue
+        texts[file_path] = _join_pages(page_texts)
+        if not texts[file_path]:
+            LOGGER.warning("No text could be extracted from PDF %s", file_path)
+    return texts